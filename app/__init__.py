@@ -1,14 +1,18 @@
 import os
 from flask import Flask
 
-from .config import STATIC_DIR, INPUT_DIR, OUTPUT_DIR
-from .db import db_init
-from .model import load_model
+from .config import STATIC_DIR, INPUT_DIR, OUTPUT_DIR, BROADCAST_BUFFER
+from .db import db_init, db_query_cursor
+from .broadcast import broadcaster
+from .model import start_model_loading
 from .worker import start_worker_thread
+from .storage import start_retention_thread
 from .routes import bp
 
 
-def create_app():
+def create_app(start_services: bool = True):
+    """`start_services=False`: chỉ dựng app, không nạp model và không chạy worker
+    (vd. process cha của reloader khi debug=True)."""
     app = Flask(
         __name__,
         template_folder=os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates"),
@@ -19,9 +23,19 @@ def create_app():
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
     db_init()
-    load_model()
+    recent = db_query_cursor("", "", "", limit=BROADCAST_BUFFER)[::-1]
+    broadcaster.prime(recent, recent[-1]["id"] if recent else 0)
 
     app.register_blueprint(bp)
-    start_worker_thread()
+    if start_services:
+        run_services()
 
     return app
+
+
+def run_services():
+    """Nạp model, chạy worker suy luận và luồng gom ảnh cũ (một lần cho mỗi DB, không theo số process web)."""
+    # model nạp nền; worker tự chờ model sẵn sàng
+    start_model_loading()
+    start_worker_thread()
+    start_retention_thread()
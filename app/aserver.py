@@ -0,0 +1,416 @@
+"""Server HTTP/1.1 trên asyncio cho chạy thật (serve.py), không cần thư viện ngoài.
+
+/api/stream, /api/chat và /api/chat/stream chạy thẳng trên event loop: mỗi client SSE chỉ
+là một coroutine chờ broadcaster, lúc chờ Gemini cũng không giữ luồng nào. Mọi route khác
+đi qua app Flask (WSGI) trên pool WSGI_THREADS luồng cố định, nên số luồng không tăng theo
+số client. Hỗ trợ keep-alive, body chunked và Expect: 100-continue.
+
+Process web không chạy worker: bản ghi mới được đọc từ DB mỗi FOLLOW_POLL_SECONDS (một
+truy vấn cho cả process, không phải cho từng client) rồi phát qua broadcaster như cũ.
+"""
+import io
+import sys
+import json
+import signal
+import time
+import asyncio
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, unquote_to_bytes
+
+from werkzeug.datastructures import Headers, MultiDict
+from werkzeug.http import HTTP_STATUS_CODES
+
+from .config import (SSE_KEEPALIVE_SECONDS, WSGI_THREADS, FOLLOW_POLL_SECONDS, MAX_BODY_MB,
+                     KEEPALIVE_SECONDS, WEB_PROCESSES, BROADCAST_BUFFER)
+from .broadcast import broadcaster, record_matches
+from .db import db_query_newer, db_note_records
+from .gemini_chat import aask_gemini, astream_gemini
+from .routes import _stream_params, _stream_event, _chat_params, _chat_event
+from .metrics import CHAT_SECONDS
+
+_MAX_HEAD = 64 * 1024
+_MAX_BODY = int(MAX_BODY_MB * 1024 * 1024)
+# client không đọc kịp (mạng chậm / treo) quá lâu thì ngắt, không giữ bộ đệm vô hạn
+_DRAIN_TIMEOUT = 30.0
+_END = object()
+
+_chat_seconds = CHAT_SECONDS.labels("chat")
+_chat_stream_seconds = CHAT_SECONDS.labels("chat_stream")
+
+
+class _HttpError(Exception):
+    def __init__(self, status: int):
+        super().__init__(status)
+        self.status = status
+
+
+class _Request:
+    __slots__ = ("method", "path", "query", "version", "headers", "body", "keep_alive")
+
+    def __init__(self, method: str, target: str, version: str, headers: Headers):
+        self.method = method
+        self.path, _, self.query = target.partition("?")
+        self.version = version
+        self.headers = headers
+        self.body = b""
+        conn = headers.get("Connection", "").lower()
+        self.keep_alive = "close" not in conn if version == "HTTP/1.1" else "keep-alive" in conn
+
+    @property
+    def args(self) -> MultiDict:
+        return MultiDict(parse_qsl(self.query, keep_blank_values=True))
+
+
+async def _read_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Optional[_Request]:
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_SECONDS)
+    except asyncio.LimitOverrunError:
+        raise _HttpError(431)
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+        return None  # client đóng kết nối keep-alive / rảnh quá lâu
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ", 2)
+    except ValueError:
+        raise _HttpError(400)
+    headers = Headers()
+    for line in lines[1:]:
+        if line:
+            k, _, v = line.partition(":")
+            headers.add(k.strip(), v.strip())
+    req = _Request(method.upper(), target, version.strip(), headers)
+
+    chunked = "chunked" in headers.get("Transfer-Encoding", "").lower()
+    length = headers.get("Content-Length", type=int) or 0
+    if length > _MAX_BODY:
+        raise _HttpError(413)
+    if (chunked or length) and headers.get("Expect", "").lower() == "100-continue":
+        writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+    try:
+        req.body = await asyncio.wait_for(_read_chunked(reader) if chunked else reader.readexactly(length),
+                                          KEEPALIVE_SECONDS)
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+        return None
+    return req
+
+
+async def _read_chunked(reader: asyncio.StreamReader) -> bytes:
+    body = bytearray()
+    while True:
+        size_line = await reader.readuntil(b"\r\n")
+        try:
+            size = int(size_line.split(b";", 1)[0].strip(), 16)
+        except ValueError:
+            raise _HttpError(400)
+        if size == 0:
+            # bỏ qua trailer tới dòng trống
+            while await reader.readuntil(b"\r\n") != b"\r\n":
+                pass
+            return bytes(body)
+        if len(body) + size > _MAX_BODY:
+            raise _HttpError(413)
+        body += await reader.readexactly(size)
+        await reader.readexactly(2)
+
+
+def _head(status: int, headers, keep_alive: bool, version: str = "HTTP/1.1") -> bytes:
+    lines = [f"{version} {status} {HTTP_STATUS_CODES.get(status, 'Unknown')}"]
+    lines += [f"{k}: {v}" for k, v in headers]
+    lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def _send(writer: asyncio.StreamWriter, data: bytes):
+    writer.write(data)
+    await asyncio.wait_for(writer.drain(), _DRAIN_TIMEOUT)
+
+
+async def _send_json(writer: asyncio.StreamWriter, req: _Request, status: int, payload: Any) -> bool:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await _send(writer, _head(status, [("Content-Type", "application/json"), ("Content-Length", len(body))],
+                              req.keep_alive) + body)
+    return req.keep_alive
+
+
+_SSE_HEADERS = [("Content-Type", "text/event-stream; charset=utf-8"), ("Cache-Control", "no-cache"),
+                ("X-Accel-Buffering", "no")]
+
+
+class _Hub:
+    """Đánh thức mọi coroutine SSE của event loop khi broadcaster có bản ghi mới.
+
+    publish() chạy trên luồng khác (worker / follower) -> chỉ đặt lịch một lần đánh thức
+    cho mỗi loạt bản ghi, coroutine tự đọc broadcaster.newer().
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.event = asyncio.Event()
+        self._scheduled = False
+        broadcaster.add_listener(self._on_publish)
+
+    def _on_publish(self):
+        if not self._scheduled:
+            self._scheduled = True
+            self.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        self._scheduled = False
+        ev, self.event = self.event, asyncio.Event()
+        ev.set()
+
+
+class AsyncServer:
+    def __init__(self, app, follow_db: bool = True):
+        self.app = app
+        self.follow_db = follow_db
+        self.pool = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix="wsgi")
+        self.hub: Optional[_Hub] = None
+        # id -> sự kiện SSE đã mã hoá: mỗi bản ghi chỉ json.dumps một lần cho mọi client
+        self._events: Dict[int, bytes] = {}
+        self.routes = {
+            ("GET", "/api/stream"): self.sse_stream,
+            ("POST", "/api/chat"): self.chat,
+            ("POST", "/api/chat/stream"): self.chat_stream,
+        }
+
+    async def serve(self, host: str, port: int, reuse_port: bool = False, ready=None):
+        loop = asyncio.get_running_loop()
+        self.hub = _Hub(loop)
+        server = await asyncio.start_server(self.handle, host, port, limit=_MAX_HEAD, reuse_port=reuse_port or None,
+                                            backlog=1024)
+        if self.follow_db:
+            loop.create_task(self.follow())
+        addr = server.sockets[0].getsockname()
+        print(f"[WEB] asyncio server on http://{addr[0]}:{addr[1]} (wsgi threads={WSGI_THREADS})")
+        if ready is not None:
+            ready(addr)
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # không phải luồng chính / Windows: dừng bằng KeyboardInterrupt như thường
+        async with server:
+            await stop.wait()
+        # các kết nối còn mở (SSE) bị huỷ khi asyncio.run kết thúc
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    async def follow(self):
+        """Đọc bản ghi mới từ DB (worker ở process khác ghi) và phát cho các client SSE."""
+        loop = asyncio.get_running_loop()
+        last = broadcaster.high_id
+        while True:
+            await asyncio.sleep(FOLLOW_POLL_SECONDS)
+            try:
+                rows = await loop.run_in_executor(self.pool, db_query_newer, "", "", "", last, 500)
+            except Exception as e:
+                print(f"[WEB] Follow error: {e}")
+                continue
+            if rows:
+                # cache trước, rồi mới phát: client nhận sự kiện thì truy vấn đã thấy dữ liệu mới
+                last = rows[-1]["id"]
+                db_note_records(rows)
+            for r in rows:
+                broadcaster.publish(r)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info("peername") or ("", 0)
+        try:
+            while True:
+                req = await _read_request(reader, writer)
+                if req is None:
+                    break
+                route = self.routes.get((req.method, req.path))
+                keep = await (route(req, writer) if route else self.wsgi(req, writer, peer))
+                if not keep:
+                    break
+        except _HttpError as e:
+            try:
+                await _send(writer, _head(e.status, [("Content-Length", 0)], False))
+            except Exception:
+                pass
+        except (ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            pass  # server đang dừng
+        except Exception:
+            traceback.print_exc()
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (Exception, asyncio.CancelledError):
+                pass
+
+    # --- WSGI (các route Flask thường) ---
+
+    def _environ(self, req: _Request, peer: Tuple) -> Dict[str, Any]:
+        host, _, port = (req.headers.get("Host") or "localhost").partition(":")
+        env = {
+            "REQUEST_METHOD": req.method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": unquote_to_bytes(req.path).decode("latin-1"),
+            "QUERY_STRING": req.query,
+            "SERVER_NAME": host,
+            "SERVER_PORT": port or "80",
+            "SERVER_PROTOCOL": req.version,
+            "REMOTE_ADDR": peer[0],
+            "REMOTE_PORT": str(peer[1]),
+            "CONTENT_LENGTH": str(len(req.body)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(req.body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": WEB_PROCESSES > 1,
+            "wsgi.run_once": False,
+        }
+        for k, v in req.headers.items():
+            key = k.upper().replace("-", "_")
+            if key == "CONTENT_TYPE":
+                env[key] = v
+            elif key not in ("CONTENT_LENGTH", "TRANSFER_ENCODING"):
+                env["HTTP_" + key] = v if "HTTP_" + key not in env else env["HTTP_" + key] + "," + v
+        return env
+
+    def _call_app(self, environ):
+        """Chạy app tới chunk đầu tiên (start_response có thể được gọi muộn tới lúc đó)."""
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            started[:] = [status, headers]
+
+        result = self.app(environ, start_response)
+        it = iter(result)
+        first = next(it, _END)
+        return started[0], started[1], first, it, result
+
+    async def wsgi(self, req: _Request, writer: asyncio.StreamWriter, peer: Tuple) -> bool:
+        loop = asyncio.get_running_loop()
+        status, headers, first, it, result = await loop.run_in_executor(
+            self.pool, self._call_app, self._environ(req, peer))
+        try:
+            code = int(status.split(" ", 1)[0])
+            hdrs = Headers(headers)
+            no_body = req.method == "HEAD" or code in (204, 304) or code < 200
+            keep = req.keep_alive
+            chunked = False
+            if not no_body and "Content-Length" not in hdrs:
+                # độ dài chưa biết (stream CSV/Excel...): chunked nếu giữ kết nối, ngược lại đóng để báo hết
+                if keep and req.version == "HTTP/1.1":
+                    hdrs["Transfer-Encoding"] = "chunked"
+                    chunked = True
+                else:
+                    keep = False
+            await _send(writer, _head(code, hdrs.to_wsgi_list(), keep))
+            if no_body:
+                return keep
+            chunk = first
+            while chunk is not _END:
+                if chunk:
+                    await _send(writer, b"%x\r\n%s\r\n" % (len(chunk), chunk) if chunked else chunk)
+                chunk = await loop.run_in_executor(self.pool, next, it, _END)
+            if chunked:
+                await _send(writer, b"0\r\n\r\n")
+            return keep
+        finally:
+            close = getattr(result, "close", None)
+            if close is not None:
+                await loop.run_in_executor(self.pool, close)
+
+    # --- route chạy thẳng trên event loop ---
+
+    def _event(self, r: Dict[str, Any]) -> bytes:
+        rid = int(r["id"])
+        data = self._events.get(rid)
+        if data is None:
+            data = self._events[rid] = _stream_event(r).encode("utf-8")
+            if len(self._events) > 2 * BROADCAST_BUFFER:
+                del self._events[next(iter(self._events))]
+        return data
+
+    async def sse_stream(self, req: _Request, writer: asyncio.StreamWriter) -> bool:
+        """Như routes.api_stream, nhưng mỗi client là một coroutine thay vì một luồng."""
+        loop = asyncio.get_running_loop()
+        start, end, product, last_id = _stream_params(req.args, req.headers)
+        await _send(writer, _head(200, _SSE_HEADERS, False) + b"retry: 1000\n\n")
+        broadcaster.subscribe()
+        try:
+            while True:
+                ev = self.hub.event
+                rows = broadcaster.newer(last_id)
+                if rows is None:
+                    # last_id cũ hơn ring buffer -> đọc DB để bắt kịp
+                    high_id = broadcaster.high_id
+                    rows = await loop.run_in_executor(self.pool, db_query_newer, start, end, product, last_id, 50)
+                    if rows:
+                        last_id = max(last_id, max(int(r["id"]) for r in rows))
+                        await _send(writer, b"".join(self._event(r) for r in rows))
+                    if len(rows) < 50:
+                        last_id = max(last_id, high_id)
+                    continue
+                if not rows:
+                    try:
+                        await asyncio.wait_for(ev.wait(), SSE_KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        await _send(writer, b": keep-alive\n\n")
+                    continue
+                out = []
+                for r in rows:
+                    last_id = max(last_id, int(r["id"]))
+                    if record_matches(r, start, end, product):
+                        out.append(self._event(r))
+                if out:
+                    await _send(writer, b"".join(out))
+        finally:
+            broadcaster.unsubscribe()
+
+    async def chat(self, req: _Request, writer: asyncio.StreamWriter) -> bool:
+        t0 = time.perf_counter()
+        try:
+            question, start, end, product = _chat_params(json.loads(req.body or b"{}") or {})
+            answer = await aask_gemini(question, start, end, product)
+            payload = {"answer": answer}
+        except Exception as e:
+            print("------- SERVER CHAT ERROR -------")
+            traceback.print_exc()
+            payload = {"answer": f"Lỗi hệ thống: {str(e)}"}
+        finally:
+            _chat_seconds.observe(time.perf_counter() - t0)
+        return await _send_json(writer, req, 200, payload)
+
+    async def chat_stream(self, req: _Request, writer: asyncio.StreamWriter) -> bool:
+        t0 = time.perf_counter()
+        try:
+            question, start, end, product = _chat_params(json.loads(req.body or b"{}") or {})
+        except ValueError:
+            return await _send_json(writer, req, 400, {"answer": "JSON không hợp lệ"})
+        await _send(writer, _head(200, _SSE_HEADERS, False))
+        gen = astream_gemini(question, start, end, product)
+        try:
+            async for kind, text in gen:
+                payload = {"text": text} if kind == "token" else {"answer": text}
+                await _send(writer, _chat_event(kind, payload).encode("utf-8"))
+        except (ConnectionError, asyncio.TimeoutError):
+            raise
+        except Exception as e:
+            print("------- SERVER CHAT ERROR -------")
+            traceback.print_exc()
+            await _send(writer, _chat_event("error", {"answer": f"Lỗi hệ thống: {str(e)}"}).encode("utf-8"))
+        finally:
+            await gen.aclose()
+            _chat_stream_seconds.observe(time.perf_counter() - t0)
+        return False
+
+
+def run(app, host: str, port: int, reuse_port: bool = False, follow_db: bool = True):
+    """Chạy server tới khi process bị dừng."""
+    try:
+        asyncio.run(AsyncServer(app, follow_db).serve(host, port, reuse_port))
+    except KeyboardInterrupt:
+        pass
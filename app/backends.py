@@ -0,0 +1,308 @@
+"""Backend suy luận: PyTorch (ultralytics) hoặc ONNX Runtime, cùng một kiểu kết quả.
+
+Mọi backend nhận list ảnh BGR (HxWx3 uint8) và trả về list `Detections` (mảng NumPy),
+nên phần còn lại của app không phụ thuộc ultralytics/torch.
+"""
+import os
+import ast
+import json
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from .config import (
+    BASE_DIR, MODEL_BACKEND, MODEL_PATH, ONNX_PATH, ONNX_PROVIDERS, ONNX_THREADS,
+    MODEL_IMGSZ, CONF_THRES, IOU_THRES, MAX_DET,
+)
+
+# dời box theo lớp để NMS không loại box khác lớp (như ultralytics)
+_MAX_WH = 7680
+
+
+class Detections:
+    """Kết quả của một ảnh: `cls` (N,), `conf` (N,), và `boxes` xyxy (N, 4) hoặc `obb` xywhr (N, 5)."""
+
+    __slots__ = ("cls", "conf", "boxes", "obb")
+
+    def __init__(self, cls: np.ndarray, conf: np.ndarray,
+                 boxes: Optional[np.ndarray] = None, obb: Optional[np.ndarray] = None):
+        self.cls = cls.astype(np.int64, copy=False)
+        self.conf = conf.astype(np.float32, copy=False)
+        self.boxes = boxes
+        self.obb = obb
+
+    def __len__(self) -> int:
+        return int(self.cls.shape[0])
+
+    def top1(self):
+        """(chỉ số lớp, độ tin cậy) của detection tin cậy nhất, hoặc None nếu rỗng."""
+        if not len(self):
+            return None
+        i = int(np.argmax(self.conf))
+        return int(self.cls[i]), float(self.conf[i])
+
+    def polygons(self) -> np.ndarray:
+        """Các đỉnh box (N, 4, 2) trên ảnh gốc, dùng để vẽ."""
+        if self.obb is not None:
+            return xywhr_to_corners(self.obb)
+        b = self.boxes if self.boxes is not None else np.zeros((0, 4), np.float32)
+        return np.stack([b[:, [0, 1]], b[:, [2, 1]], b[:, [2, 3]], b[:, [0, 3]]], axis=1)
+
+    def to_json(self, names: Optional[Dict[int, str]] = None) -> str:
+        """Hình học detection dạng JSON gọn (lưu DB, vẽ lại khi cần)."""
+        geom = self.obb if self.obb is not None else self.boxes
+        used = {int(c) for c in self.cls}
+        return json.dumps({
+            "kind": "obb" if self.obb is not None else "box",
+            "names": {str(c): (names or {}).get(c, str(c)) for c in sorted(used)},
+            "cls": self.cls.tolist(),
+            "conf": np.round(self.conf.astype(np.float64), 4).tolist(),
+            "geom": np.round(np.asarray(geom, np.float64), 1).tolist() if geom is not None else [],
+        }, ensure_ascii=False, separators=(",", ":"))
+
+    @staticmethod
+    def from_json(s: str):
+        """Ngược của to_json: trả về (Detections, names)."""
+        d = json.loads(s)
+        geom = np.asarray(d["geom"], dtype=np.float32)
+        cls, conf = np.asarray(d["cls"]), np.asarray(d["conf"])
+        names = {int(k): v for k, v in d.get("names", {}).items()}
+        if d.get("kind") == "obb":
+            return Detections(cls, conf, obb=geom.reshape(-1, 5)), names
+        return Detections(cls, conf, boxes=geom.reshape(-1, 4)), names
+
+    def plot(self, img: np.ndarray, names: Optional[Dict[int, str]] = None) -> np.ndarray:
+        out = img.copy()
+        for poly, c, cf in zip(self.polygons(), self.cls, self.conf):
+            pts = np.round(poly).astype(np.int32)
+            cv2.polylines(out, [pts], True, (0, 200, 0), 2)
+            label = f"{names.get(int(c), c) if names else c} {cf:.2f}"
+            x, y = int(pts[:, 0].min()), int(pts[:, 1].min())
+            cv2.putText(out, label, (x, max(12, y - 4)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 200, 0), 1)
+        return out
+
+
+def _empty() -> Detections:
+    return Detections(np.zeros(0), np.zeros(0), boxes=np.zeros((0, 4), np.float32))
+
+
+# --- PyTorch ---
+
+def _to_numpy(t) -> np.ndarray:
+    if hasattr(t, "detach"):
+        t = t.detach().cpu().numpy()
+    return np.asarray(t)
+
+
+class TorchBackend:
+    name = "torch"
+
+    def __init__(self, path: str = MODEL_PATH):
+        from ultralytics import YOLO
+        self.model = YOLO(path)
+        self.names = self.model.names
+
+    def predict(self, imgs: List[np.ndarray]) -> List[Detections]:
+        results = self.model(imgs, verbose=False) or []
+        out = []
+        for r in results:
+            obb = getattr(r, "obb", None)
+            if obb is not None and len(obb):
+                out.append(Detections(_to_numpy(obb.cls), _to_numpy(obb.conf), obb=_to_numpy(obb.xywhr)))
+                continue
+            boxes = getattr(r, "boxes", None)
+            if boxes is not None and len(boxes):
+                out.append(Detections(_to_numpy(boxes.cls), _to_numpy(boxes.conf), boxes=_to_numpy(boxes.xyxy)))
+                continue
+            out.append(_empty())
+        return out
+
+
+# --- ONNX Runtime ---
+
+def letterbox(img: np.ndarray, size: int):
+    """Resize giữ tỉ lệ rồi đệm 114 cho đủ size x size. Trả về (ảnh, tỉ lệ, (pad_x, pad_y))."""
+    h, w = img.shape[:2]
+    r = min(size / h, size / w)
+    nw, nh = int(round(w * r)), int(round(h * r))
+    if (nw, nh) != (w, h):
+        img = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    dw, dh = (size - nw) / 2, (size - nh) / 2
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return img, r, (left, top)
+
+
+def preprocess(imgs: List[np.ndarray], size: int):
+    """BGR uint8 -> tensor NCHW float32 RGB 0..1, kèm thông số letterbox từng ảnh."""
+    batch = np.empty((len(imgs), size, size, 3), dtype=np.uint8)
+    metas = []
+    for i, img in enumerate(imgs):
+        batch[i], r, pad = letterbox(img, size)
+        metas.append((r, pad, img.shape[:2]))
+    x = batch[..., ::-1].transpose(0, 3, 1, 2).astype(np.float32) * (1.0 / 255.0)
+    return np.ascontiguousarray(x), metas
+
+
+def xywh_to_xyxy(b: np.ndarray) -> np.ndarray:
+    out = np.empty_like(b)
+    out[:, :2] = b[:, :2] - b[:, 2:4] / 2
+    out[:, 2:4] = b[:, :2] + b[:, 2:4] / 2
+    return out
+
+
+def xywhr_to_corners(b: np.ndarray) -> np.ndarray:
+    """xywhr (N, 5) -> 4 đỉnh (N, 4, 2)."""
+    ctr, w, h, r = b[:, :2], b[:, 2:3], b[:, 3:4], b[:, 4:5]
+    cos, sin = np.cos(r), np.sin(r)
+    v1 = np.concatenate([w / 2 * cos, w / 2 * sin], axis=1)
+    v2 = np.concatenate([-h / 2 * sin, h / 2 * cos], axis=1)
+    return np.stack([ctr + v1 + v2, ctr + v1 - v2, ctr - v1 - v2, ctr - v1 + v2], axis=1)
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU từng cặp giữa a (N, 4) và b (M, 4), xyxy."""
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-7)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_thres: float) -> np.ndarray:
+    """NMS tham lam cho box xyxy; trả về chỉ số giữ lại theo conf giảm dần."""
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        if order.size == 1:
+            break
+        ious = box_iou(boxes[i:i + 1], boxes[order[1:]])[0]
+        order = order[1:][ious < iou_thres]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def _covariance(b: np.ndarray):
+    a, c = b[:, 2] ** 2 / 12, b[:, 3] ** 2 / 12
+    cos, sin = np.cos(b[:, 4]), np.sin(b[:, 4])
+    return a * cos ** 2 + c * sin ** 2, a * sin ** 2 + c * cos ** 2, (a - c) * cos * sin
+
+
+def probiou(obb1: np.ndarray, obb2: np.ndarray, eps: float = 1e-7) -> np.ndarray:
+    """IoU xác suất (Gaussian) giữa box xoay (N, 5) và (M, 5), như ultralytics.batch_probiou."""
+    x1, y1 = obb1[:, 0:1], obb1[:, 1:2]
+    x2, y2 = obb2[None, :, 0], obb2[None, :, 1]
+    a1, b1, c1 = (v[:, None] for v in _covariance(obb1))
+    a2, b2, c2 = (v[None, :] for v in _covariance(obb2))
+    denom = (a1 + a2) * (b1 + b2) - (c1 + c2) ** 2 + eps
+    t1 = ((a1 + a2) * (y1 - y2) ** 2 + (b1 + b2) * (x1 - x2) ** 2) / denom * 0.25
+    t2 = ((c1 + c2) * (x2 - x1) * (y1 - y2)) / denom * 0.5
+    det1 = np.clip(a1 * b1 - c1 ** 2, 0, None)
+    det2 = np.clip(a2 * b2 - c2 ** 2, 0, None)
+    t3 = np.log(denom / (4 * np.sqrt(det1 * det2) + eps) + eps) * 0.5
+    bd = np.clip(t1 + t2 + t3, eps, 100.0)
+    return 1 - np.sqrt(1.0 - np.exp(-bd) + eps)
+
+
+def nms_rotated(obb: np.ndarray, scores: np.ndarray, iou_thres: float) -> np.ndarray:
+    """NMS dạng ma trận cho box xoay: giữ box không trùng quá ngưỡng với box nào có conf cao hơn."""
+    order = np.argsort(-scores, kind="stable")
+    ious = np.triu(probiou(obb[order], obb[order]), k=1)
+    return order[(ious >= iou_thres).sum(axis=0) <= 0]
+
+
+def postprocess(pred: np.ndarray, nc: int, obb: bool, meta, conf_thres: float = CONF_THRES,
+                iou_thres: float = IOU_THRES, max_det: int = MAX_DET) -> Detections:
+    """Đầu ra thô (4 + nc [+ 1 góc], N) của một ảnh -> Detections trên toạ độ ảnh gốc."""
+    p = pred.T
+    scores = p[:, 4:4 + nc]
+    cls = scores.argmax(axis=1)
+    conf = scores[np.arange(len(cls)), cls]
+    m = conf > conf_thres
+    if not m.any():
+        return _empty()
+    p, cls, conf = p[m], cls[m], conf[m]
+
+    r, (px, py), (h, w) = meta
+    offset = (cls * _MAX_WH)[:, None].astype(np.float32)
+    if obb:
+        rb = np.concatenate([p[:, :4], p[:, -1:]], axis=1)
+        shifted = rb.copy()
+        shifted[:, :2] += offset
+        keep = nms_rotated(shifted, conf, iou_thres)[:max_det]
+        rb = rb[keep]
+        rb[:, 0] = (rb[:, 0] - px) / r
+        rb[:, 1] = (rb[:, 1] - py) / r
+        rb[:, 2:4] /= r
+        return Detections(cls[keep], conf[keep], obb=rb)
+
+    boxes = xywh_to_xyxy(p[:, :4])
+    keep = nms(boxes + offset, conf, iou_thres)[:max_det]
+    boxes = boxes[keep]
+    boxes[:, [0, 2]] = np.clip((boxes[:, [0, 2]] - px) / r, 0, w)
+    boxes[:, [1, 3]] = np.clip((boxes[:, [1, 3]] - py) / r, 0, h)
+    return Detections(cls[keep], conf[keep], boxes=boxes)
+
+
+def _load_names(meta: Dict[str, str]) -> Dict[int, str]:
+    if "names" in meta:
+        try:
+            return {int(k): v for k, v in ast.literal_eval(meta["names"]).items()}
+        except (ValueError, SyntaxError):
+            pass
+    # ONNX không có metadata -> dùng classes.txt cạnh repo
+    path = os.path.join(BASE_DIR, "classes.txt")
+    with open(path, encoding="utf-8") as f:
+        return {i: line.strip() for i, line in enumerate(f) if line.strip()}
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, path: str = ONNX_PATH):
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        if ONNX_THREADS > 0:
+            opts.intra_op_num_threads = ONNX_THREADS
+        available = ort.get_available_providers()
+        providers = [p for p in ONNX_PROVIDERS if p in available] or ["CPUExecutionProvider"]
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=providers)
+
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        # batch cố định (export không dynamic) -> chạy từng ảnh
+        self.fixed_batch = inp.shape[0] if isinstance(inp.shape[0], int) else None
+        self.imgsz = inp.shape[2] if isinstance(inp.shape[2], int) else MODEL_IMGSZ
+
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.names = _load_names(meta)
+        self.nc = len(self.names)
+        channels = self.session.get_outputs()[0].shape[1]
+        task = meta.get("task")
+        self.obb = task == "obb" if task else (isinstance(channels, int) and channels == 4 + self.nc + 1)
+
+    def _run(self, x: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: x})[0]
+
+    def predict(self, imgs: List[np.ndarray]) -> List[Detections]:
+        if not imgs:
+            return []
+        x, metas = preprocess(imgs, self.imgsz)
+        if self.fixed_batch == 1 and len(imgs) > 1:
+            preds = np.concatenate([self._run(x[i:i + 1]) for i in range(len(imgs))])
+        else:
+            preds = self._run(x)
+        return [postprocess(preds[i], self.nc, self.obb, metas[i]) for i in range(len(imgs))]
+
+
+BACKENDS = {"torch": TorchBackend, "onnx": OnnxBackend}
+
+
+def create_backend(name: str = MODEL_BACKEND) -> Any:
+    if name not in BACKENDS:
+        raise ValueError(f"MODEL_BACKEND không hợp lệ: {name} (chọn: {', '.join(BACKENDS)})")
+    return BACKENDS[name]()
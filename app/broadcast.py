@@ -0,0 +1,108 @@
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from .config import BROADCAST_BUFFER
+
+
+def record_matches(r: Dict[str, Any], start_date: str, end_date: str, product: str) -> bool:
+    """Lọc giống WHERE của db_query_newer nhưng chạy trong bộ nhớ."""
+    ts = r.get("timestamp") or ""
+    if start_date and ts < start_date:
+        return False
+    if end_date and ts > end_date:
+        return False
+    if product:
+        name = r.get("product_name") or ""
+        # "=" ở đầu: khớp đúng tên, giống db._match_products
+        if product.startswith("="):
+            return name == product[1:]
+        if product.lower() not in name.lower():
+            return False
+    return True
+
+
+class Broadcaster:
+    """Phát bản ghi mới tới các client /api/stream mà không cần mỗi client tự poll DB.
+
+    Worker gọi publish() sau mỗi insert. Ring buffer giữ BROADCAST_BUFFER bản ghi
+    gần nhất; client nào có last_id cũ hơn buffer thì tự đọc DB để bắt kịp.
+    Luồng request chờ bằng wait_newer(); server asyncio đăng ký listener và đọc newer().
+    """
+
+    def __init__(self, size: int):
+        self._buf: Deque[Dict[str, Any]] = deque(maxlen=size)
+        self._cond = threading.Condition()
+        self._high_id = 0
+        # mọi bản ghi có id > _floor đều nằm trong buffer (hoặc chưa tồn tại)
+        self._floor = 0
+        self._subscribers = 0
+        self._listeners: List[Callable[[], None]] = []
+
+    def prime(self, rows: List[Dict[str, Any]], high_id: int):
+        """Nạp sẵn các bản ghi gần nhất (tăng dần theo id) lúc khởi động."""
+        with self._cond:
+            self._buf.clear()
+            self._buf.extend(rows[-(self._buf.maxlen or 0):])
+            self._high_id = max(high_id, self._buf[-1]["id"] if self._buf else 0)
+            self._floor = self._buf[0]["id"] - 1 if self._buf else self._high_id
+
+    def publish(self, record: Dict[str, Any]):
+        with self._cond:
+            if len(self._buf) == self._buf.maxlen:
+                self._floor = self._buf[0]["id"]
+            self._buf.append(record)
+            self._high_id = max(self._high_id, int(record["id"]))
+            self._cond.notify_all()
+        for fn in self._listeners:
+            fn()
+
+    def add_listener(self, fn: Callable[[], None]):
+        """`fn()` được gọi (ngoài lock, trên luồng publish) sau mỗi bản ghi mới."""
+        self._listeners.append(fn)
+
+    @property
+    def high_id(self) -> int:
+        return self._high_id
+
+    @property
+    def subscribers(self) -> int:
+        return self._subscribers
+
+    def needs_catchup(self, last_id: int) -> bool:
+        with self._cond:
+            return last_id < self._floor
+
+    def newer(self, last_id: int) -> Optional[List[Dict[str, Any]]]:
+        """Như wait_newer nhưng không chờ."""
+        with self._cond:
+            if last_id < self._floor:
+                return None
+            if self._high_id <= last_id:
+                return []
+            return [r for r in self._buf if r["id"] > last_id]
+
+    def wait_newer(self, last_id: int, timeout: float) -> Optional[List[Dict[str, Any]]]:
+        """Trả về các bản ghi có id > last_id, chờ tối đa `timeout` giây.
+
+        None nghĩa là last_id đã rơi khỏi buffer: cần đọc DB để bắt kịp.
+        """
+        with self._cond:
+            if last_id < self._floor:
+                return None
+            if self._high_id <= last_id:
+                self._cond.wait(timeout)
+                if last_id < self._floor:
+                    return None
+            return [r for r in self._buf if r["id"] > last_id]
+
+    def subscribe(self):
+        with self._cond:
+            self._subscribers += 1
+
+    def unsubscribe(self):
+        with self._cond:
+            self._subscribers -= 1
+
+
+broadcaster = Broadcaster(BROADCAST_BUFFER)
@@ -0,0 +1,71 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+from .config import QUERY_CACHE_SIZE, QUERY_CACHE_TTL
+from .db import db_high_water
+
+_MISS = object()
+
+
+class QueryCache:
+    """LRU cache nhiều khoá cho các truy vấn dashboard.
+
+    Mỗi mục gắn với high-water id của records lúc tính; có insert mới là mục
+    cũ hết hiệu lực ngay, TTL chỉ là giới hạn phụ.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        version = db_high_water()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] == version and now - entry[2] <= self.ttl:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        return default
+
+    def put(self, key: Hashable, value: Any, version: int):
+        """Lưu giá trị tính từ dữ liệu ở high-water `version` (lấy trước khi tính)."""
+        with self._lock:
+            self._data[key] = (value, version, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_compute(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        version = db_high_water()
+        value = self.get(key, _MISS)
+        if value is not _MISS:
+            return value
+        value = fn()
+        self.put(key, value, version)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+query_cache = QueryCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
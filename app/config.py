@@ -3,20 +3,130 @@ import os
 APP_TITLE = "Vision Drink Survey"
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", "5000"))
+DEBUG = os.getenv("DEBUG", "1") == "1"
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 MODEL_PATH = os.getenv("MODEL_PATH", os.path.join(BASE_DIR, "best.pt"))
+# Cạnh ảnh giả dùng để warmup model ngay sau khi nạp
+WARMUP_SIZE = int(os.getenv("WARMUP_SIZE", "640"))
+# Nạp model lỗi: worker thử nạp lại sau MODEL_RETRY_BASE * 2^(lần-1) giây, tối đa MODEL_RETRY_MAX
+MODEL_RETRY_BASE = float(os.getenv("MODEL_RETRY_BASE", "5"))
+MODEL_RETRY_MAX = float(os.getenv("MODEL_RETRY_MAX", "300"))
+
+# Backend suy luận: "torch" (ultralytics, best.pt) hoặc "onnx" (ONNX Runtime, file từ scripts/export_onnx.py)
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "torch").lower()
+ONNX_PATH = os.getenv("ONNX_PATH", os.path.splitext(MODEL_PATH)[0] + ".onnx")
+# Thứ tự execution provider của ONNX Runtime; provider không có sẵn thì bỏ qua
+# (vd. "OpenVINOExecutionProvider,CPUExecutionProvider" với onnxruntime-openvino)
+ONNX_PROVIDERS = [p.strip() for p in os.getenv("ONNX_PROVIDERS", "CPUExecutionProvider").split(",") if p.strip()]
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))  # 0 = để ORT tự chọn
+# Tham số hậu xử lý cho backend onnx (mặc định giống ultralytics)
+MODEL_IMGSZ = int(os.getenv("MODEL_IMGSZ", "640"))
+CONF_THRES = float(os.getenv("CONF_THRES", "0.25"))
+IOU_THRES = float(os.getenv("IOU_THRES", "0.7"))
+MAX_DET = int(os.getenv("MAX_DET", "300"))
 
 INPUT_DIR  = os.getenv("INPUT_DIR",  os.path.join(BASE_DIR, "uploads"))
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", os.path.join(BASE_DIR, "outputs", "sautrain"))
+# Ảnh raw lưu theo OUTPUT_DIR/YYYY/MM/DD; ngày cũ hơn PACK_AFTER_DAYS gom thành DD.zip (0 = không gom)
+PACK_AFTER_DAYS = int(os.getenv("PACK_AFTER_DAYS", "0"))
+PACK_INTERVAL_HOURS = float(os.getenv("PACK_INTERVAL_HOURS", "6"))
 
 STATIC_DIR = os.path.join(BASE_DIR, "static")
-DB_PATH = os.path.join(BASE_DIR, "vision_drink_survey.db")
+# Ảnh annotate vẽ khi có người xem (/annotated/<id>), cache trên đĩa giới hạn theo dung lượng
+ANNOTATED_CACHE_DIR = os.getenv("ANNOTATED_CACHE_DIR", os.path.join(BASE_DIR, "outputs", "cache", "annotated"))
+ANNOTATED_CACHE_MB = int(os.getenv("ANNOTATED_CACHE_MB", "256"))
+# Ảnh thu nhỏ cho /thumb/<cạnh dài>/<file>: chỉ phục vụ các kích thước cố định, tạo lần đầu khi được xem
+THUMB_CACHE_DIR = os.getenv("THUMB_CACHE_DIR", os.path.join(BASE_DIR, "outputs", "cache", "thumbs"))
+THUMB_CACHE_MB = int(os.getenv("THUMB_CACHE_MB", "512"))
+THUMB_SIZES = tuple(int(s) for s in os.getenv("THUMB_SIZES", "128,480,1024").split(",") if s.strip())
+THUMB_QUALITY = int(os.getenv("THUMB_QUALITY", "80"))
+# Thumbnail gắn với mtime file gốc -> cache phía trình duyệt/proxy 1 năm
+THUMB_MAX_AGE = int(os.getenv("THUMB_MAX_AGE", "31536000"))
+DB_PATH = os.getenv("DB_PATH", os.path.join(BASE_DIR, "vision_drink_survey.db"))
+# Số kết nối đọc giữ lại trong pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+# Group commit: mỗi transaction gom các lệnh ghi đang chờ (tối đa DB_COMMIT_ROWS);
+# DB_COMMIT_MS > 0 thì chờ thêm chừng ấy ms để gom lô lớn hơn
+DB_COMMIT_MS = float(os.getenv("DB_COMMIT_MS", "0"))
+DB_COMMIT_ROWS = int(os.getenv("DB_COMMIT_ROWS", "64"))
 
 POLL_SECONDS = float(os.getenv("POLL_SECONDS", "0.5"))
 STABLE_SECONDS = float(os.getenv("STABLE_SECONDS", "0.6"))
 
+# Hàng đợi job bền trong SQLite cho ảnh trên đĩa (0 = như cũ: lỗi suy luận/lưu thì xoá ảnh)
+JOB_QUEUE = os.getenv("JOB_QUEUE", "1") == "1"
+# Job bị nhận quá thời gian này mà chưa xong (process chết) sẽ được nhận lại
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+# Số lần thử tối đa; giữa các lần chờ JOB_RETRY_BASE * 2^(lần-1) giây, tối đa JOB_RETRY_MAX
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BASE = float(os.getenv("JOB_RETRY_BASE", "2"))
+JOB_RETRY_MAX = float(os.getenv("JOB_RETRY_MAX", "300"))
+# Ảnh hết lượt thử (dead-letter) được chuyển vào đây, không bị xoá
+JOB_DEAD_DIR = os.getenv("JOB_DEAD_DIR", os.path.join(INPUT_DIR, "failed"))
+# Giữ job đã xong bao lâu (để đối soát sau crash) trước khi xoá khỏi bảng
+JOB_KEEP_HOURS = float(os.getenv("JOB_KEEP_HOURS", "24"))
+
+# Cách phát hiện ảnh mới: "auto" (inotify nếu có), "inotify", hoặc "poll" (quét thư mục như cũ)
+INGEST_MODE = os.getenv("INGEST_MODE", "auto").lower()
+
+# Chế độ trong bộ nhớ: ảnh upload đi thẳng vào hàng đợi RAM, chỉ ghi đĩa một lần ở OUTPUT_DIR
+INMEMORY_INGEST = os.getenv("INMEMORY_INGEST", "0") == "1"
+MEM_QUEUE_SIZE = int(os.getenv("MEM_QUEUE_SIZE", "64"))
+# Số ảnh tối đa trong một request /api/upload_cam nhiều file (camera gửi lại backlog từ thẻ SD)
+UPLOAD_MAX_FILES = int(os.getenv("UPLOAD_MAX_FILES", "64"))
+
+# Số worker suy luận song song (1 = một luồng như cũ) và kiểu worker: "thread" hoặc "process"
+WORKERS = int(os.getenv("WORKERS", "1"))
+WORKER_MODE = os.getenv("WORKER_MODE", "thread").lower()
+
+# Bỏ frame trùng trước khi suy luận: "off", "skip" (không ghi) hoặc "reuse" (ghi với kết quả frame trước)
+DEDUP_MODE = os.getenv("DEDUP_MODE", "off").lower()
+# Khoảng cách Hamming tối đa (trên 64 bit dHash) để coi hai frame là cùng cảnh
+DEDUP_DISTANCE = int(os.getenv("DEDUP_DISTANCE", "5"))
+
+# Gom nhiều ảnh vào một lần gọi YOLO (1 = xử lý từng ảnh như cũ)
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "1"))
+# Thời gian tối đa chờ đủ lô trước khi chạy với số ảnh đang có
+BATCH_MAX_WAIT = float(os.getenv("BATCH_MAX_WAIT", "0.3"))
+
+# Cache truy vấn dashboard (LRU); mục bị bỏ ngay khi có insert mới, TTL chỉ là giới hạn phụ
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "256"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "30"))
+
+# Thu thập metrics cho /metrics (0 = tắt ghi mẫu, endpoint vẫn trả về các gauge)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# Số frame gần nhất giữ span thời gian theo giai đoạn (0 = tắt), xem /admin/traces
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", "1000"))
+
+# Token cho /admin/* (header X-Admin-Token hoặc ?token=); để trống = chỉ cho phép từ localhost
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Thời gian tối đa một lần /admin/profile được lấy mẫu (giây)
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+# serve.py (server asyncio, app/aserver.py): số process web dùng chung cổng (SO_REUSEPORT);
+# worker suy luận luôn chạy ở đúng một process riêng, không nhân theo số process web
+WEB_PROCESSES = int(os.getenv("WEB_PROCESSES", "1"))
+# Luồng chạy các route Flask thường (mọi route trừ /api/stream và chat) trong mỗi process web
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", "16"))
+# Process web đọc bản ghi mới từ DB mỗi chừng này giây để phát cho client /api/stream
+FOLLOW_POLL_SECONDS = float(os.getenv("FOLLOW_POLL_SECONDS", "0.25"))
+# Body request tối đa (MB) và thời gian giữ kết nối keep-alive rảnh (giây)
+MAX_BODY_MB = float(os.getenv("MAX_BODY_MB", "32"))
+KEEPALIVE_SECONDS = float(os.getenv("KEEPALIVE_SECONDS", "75"))
+# Process worker ghi trạng thái model ra file này (heartbeat) cho /health của các process web
+WORKER_STATUS_FILE = os.getenv("WORKER_STATUS_FILE", os.path.splitext(DB_PATH)[0] + ".worker.json")
+# Process worker mở cổng riêng (chỉ 127.0.0.1) cho /metrics, /admin/traces, /admin/profile, /health
+# của phần suy luận: các số liệu đó chỉ có trong process worker, không có ở process web. 0 = tắt
+WORKER_ADMIN_PORT = int(os.getenv("WORKER_ADMIN_PORT", str(PORT + 1)))
+
+# Số bản ghi gần nhất giữ trong RAM để phát cho các client /api/stream
+BROADCAST_BUFFER = int(os.getenv("BROADCAST_BUFFER", "500"))
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+
 EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
 
 LAST_RAW = os.path.join(STATIC_DIR, "last.jpg")
@@ -28,3 +138,10 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "***********************")
 # Sửa thành bản 1.5-flash (bản ổn định nhất hiện nay)
 GEMINI_MODEL = "gemini-2.5-flash" 
 USE_GEMINI = True
+
+# Timeout cứng cho mỗi lần gọi model (quá hạn -> trả lời bằng luật cứng)
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "8"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+# Memo câu trả lời cho cùng câu hỏi + bộ lọc + phiên bản dữ liệu
+CHAT_MEMO_SIZE = int(os.getenv("CHAT_MEMO_SIZE", "128"))
+CHAT_MEMO_TTL = float(os.getenv("CHAT_MEMO_TTL", "300"))
@@ -1,14 +1,69 @@
+import queue
+import functools
 import sqlite3
-from typing import List, Dict, Any, Optional
-from .config import DB_PATH
+import threading
+import time
+import calendar
+from datetime import datetime, timedelta
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Callable, Iterator, Tuple
+from urllib.request import pathname2url
 
+from .config import DB_PATH, DB_POOL_SIZE, DB_COMMIT_MS, DB_COMMIT_ROWS
+from .metrics import DB_SECONDS
 
-def db_connect():
-    con = sqlite3.connect(DB_PATH, check_same_thread=False)
+
+def _timed(fn):
+    """Ghi thời gian mỗi lần gọi vào vision_db_seconds{fn=...}."""
+    hist = DB_SECONDS.labels(fn.__name__)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            hist.observe(time.perf_counter() - t0)
+    return wrapper
+
+
+def _timed_iter(fn):
+    """Như _timed cho hàm generator: tính cả thời gian tới khi đọc hết (không tính thời gian bên gọi xử lý)."""
+    hist = DB_SECONDS.labels(fn.__name__)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        it = fn(*args, **kwargs)
+        spent = 0.0
+        try:
+            while True:
+                t0 = time.perf_counter()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    spent += time.perf_counter() - t0
+                    return
+                spent += time.perf_counter() - t0
+                yield item
+        finally:
+            it.close()
+            hist.observe(spent)
+    return wrapper
+
+
+def db_connect(readonly: bool = False):
+    if readonly:
+        con = sqlite3.connect(f"file:{pathname2url(DB_PATH)}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        con = sqlite3.connect(DB_PATH, check_same_thread=False)
     con.row_factory = sqlite3.Row
     try:
-        con.execute("PRAGMA journal_mode=WAL;")
-        con.execute("PRAGMA synchronous=NORMAL;")
+        if readonly:
+            con.execute("PRAGMA query_only=ON;")
+        else:
+            con.execute("PRAGMA journal_mode=WAL;")
+            con.execute("PRAGMA synchronous=NORMAL;")
         con.execute("PRAGMA temp_store=MEMORY;")
         con.execute("PRAGMA busy_timeout=3000;")
     except Exception:
@@ -16,9 +71,178 @@ def db_connect():
     return con
 
 
+class _ConnPool:
+    """Pool kết nối đọc dùng lại giữa các request (Flask tạo thread mới cho mỗi request,
+    nên giữ kết nối theo thread không có tác dụng). PRAGMA chỉ chạy một lần khi mở kết nối."""
+
+    def __init__(self, size: int):
+        self._size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+
+    @contextmanager
+    def conn(self):
+        try:
+            con = self._idle.get_nowait()
+        except queue.Empty:
+            con = db_connect(readonly=True)
+        try:
+            yield con
+        finally:
+            if self._idle.qsize() < self._size:
+                self._idle.put(con)
+            else:
+                con.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class _GroupWriter:
+    """Một luồng ghi duy nhất gom nhiều lệnh ghi vào một transaction.
+
+    Mỗi transaction lấy mọi lệnh đang chờ (tối đa DB_COMMIT_ROWS), và nếu
+    DB_COMMIT_MS > 0 thì chờ thêm tối đa chừng ấy ms để gom lô lớn hơn. Mỗi lệnh chạy
+    trong SAVEPOINT riêng nên một lệnh lỗi không làm hỏng các lệnh khác cùng lô. Lỗi ngoài
+    lô (vd. không mở được DB) trả về cho mọi lệnh đang chờ, luồng ghi mở lại kết nối.
+    """
+
+    def __init__(self, commit_ms: float, commit_rows: int):
+        self._window = commit_ms / 1000.0
+        self._rows = max(1, commit_rows)
+        self._q: "queue.Queue[tuple]" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[[sqlite3.Cursor], Any]) -> Any:
+        self._ensure_started()
+        fut: Future = Future()
+        self._q.put((fn, fut))
+        return fut.result()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            con = None
+            batch: list = []
+            try:
+                con = db_connect()
+                con.isolation_level = None
+                while True:
+                    batch = self._next_batch()
+                    self._commit(con, batch)
+            except Exception as e:
+                # lỗi ngoài từng lô (mở kết nối, ...): báo lỗi cho mọi lệnh đang chờ thay vì để
+                # bên gọi chờ mãi, rồi mở lại kết nối
+                print(f"[DB] Writer error: {e!r} -> reconnect")
+                pending = batch + self._drain()
+                for _, fut in pending:
+                    if not fut.done():
+                        fut.set_exception(e)
+                if con is not None:
+                    try:
+                        con.close()
+                    except Exception:
+                        pass
+                time.sleep(1.0)
+
+    def _drain(self) -> list:
+        out = []
+        while True:
+            try:
+                out.append(self._q.get_nowait())
+            except queue.Empty:
+                return out
+
+    def _next_batch(self) -> list:
+        batch = [self._q.get()]
+        # lấy hết lệnh đang chờ; chỉ chờ thêm khi có cấu hình cửa sổ DB_COMMIT_MS
+        deadline = time.monotonic() + self._window
+        while len(batch) < self._rows:
+            try:
+                batch.append(self._q.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            try:
+                batch.append(self._q.get(timeout=left))
+            except queue.Empty:
+                break
+        return batch
+
+    def _commit(self, con: sqlite3.Connection, batch: list):
+        results = []
+        cur = con.cursor()
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            for fn, fut in batch:
+                cur.execute("SAVEPOINT w")
+                try:
+                    results.append((fut, fn(cur), None))
+                    cur.execute("RELEASE w")
+                except Exception as e:
+                    cur.execute("ROLLBACK TO w")
+                    cur.execute("RELEASE w")
+                    _products_rolled_back()
+                    results.append((fut, None, e))
+            cur.execute("COMMIT")
+            _products_committed()
+        except Exception as e:
+            try:
+                con.rollback()
+            except Exception:
+                pass
+            _products_rolled_back()
+            for fn, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        for fut, res, err in results:
+            if err is not None:
+                fut.set_exception(err)
+            else:
+                fut.set_result(res)
+
+
+_read_pool = _ConnPool(DB_POOL_SIZE)
+_writer = _GroupWriter(DB_COMMIT_MS, DB_COMMIT_ROWS)
+
+# id lớn nhất đã ghi vào records; cache dùng làm "phiên bản dữ liệu"
+_high_water = 0
+# db_init chờ process khác migrate xong (dựng lại rollup DB lớn có thể mất cả phút)
+_INIT_BUSY_MS = 300000
+
+
+@_timed
+def db_write(fn: Callable[[sqlite3.Cursor], Any]) -> Any:
+    """Chạy `fn(cur)` trên luồng ghi (group commit) và trả về kết quả của nó."""
+    return _writer.submit(fn)
+
+
+@_timed
 def db_init():
+    global _high_water
     con = db_connect()
+    # Cả schema + migration trong một transaction ghi: nhiều process (serve.py) cùng db_init
+    # thì process sau chờ process trước xong rồi mới đọc cột/bảng, không ALTER/rebuild hai lần
+    con.isolation_level = None
+    con.execute(f"PRAGMA busy_timeout={_INIT_BUSY_MS};")
     cur = con.cursor()
+    cur.execute("BEGIN IMMEDIATE")
     cur.execute("""
     CREATE TABLE IF NOT EXISTS records (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -29,25 +253,652 @@ def db_init():
         image_path TEXT
     )
     """)
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_records_timestamp ON records(timestamp);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_records_product ON records(product_name);")
-    con.commit()
-    con.close()
+    # Bảng danh mục sản phẩm (~40 nhãn); records tham chiếu qua product_id
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+    """)
+    cols = [r[1] for r in cur.execute("PRAGMA table_info(records)").fetchall()]
+    if "product_id" not in cols:
+        # migration DB cũ: tạo product_id từ product_name
+        cur.execute("ALTER TABLE records ADD COLUMN product_id INTEGER REFERENCES products(id)")
+        cur.execute("""
+            INSERT OR IGNORE INTO products (name)
+            SELECT DISTINCT product_name FROM records WHERE product_name IS NOT NULL
+        """)
+        cur.execute("""
+            UPDATE records SET product_id = (SELECT id FROM products WHERE name = records.product_name)
+            WHERE product_name IS NOT NULL
+        """)
+    if "ts_epoch" not in cols:
+        # migration: thời gian dạng số nguyên (giây, tính giờ tường như UTC) để lọc/nhóm không phải so chuỗi
+        cur.execute("ALTER TABLE records ADD COLUMN ts_epoch INTEGER")
+        cur.execute("UPDATE records SET ts_epoch = CAST(strftime('%s', timestamp) AS INTEGER)")
 
+    # Index theo đúng dạng truy vấn:
+    #  - (ts_epoch, product_id): lọc khoảng thời gian (+ sản phẩm), covering cho COUNT và cạnh lẻ của rollup
+    #  - (product_id, id): lọc sản phẩm + phân trang theo id
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_records_ts_product ON records(ts_epoch, product_id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_records_product_id ON records(product_id, id);")
+    # index TEXT cũ không còn truy vấn nào dùng, chỉ làm chậm insert
+    cur.execute("DROP INDEX IF EXISTS idx_records_timestamp;")
+    cur.execute("DROP INDEX IF EXISTS idx_records_product;")
+    # timestamp không đọc được thì ts_epoch NULL -> mọi lọc/thống kê theo ngày bỏ sót bản ghi
+    fixed = _backfill_ts_epoch(cur)
+    if fixed:
+        print(f"[DB] ts_epoch: {fixed} records with unparseable timestamp -> date part / migration time")
 
-def db_insert(timestamp: str, brand: str, product_name: str, conf: float, image_path: str) -> int:
-    con = db_connect()
-    cur = con.cursor()
+    # Bảng tổng hợp theo giờ / ngày, cập nhật cùng transaction với mỗi insert
+    has_rollups = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='rollup_hourly'"
+    ).fetchone() is not None
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS rollup_hourly (
+        hour TEXT NOT NULL,
+        product_name TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (hour, product_name)
+    ) WITHOUT ROWID
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS rollup_daily (
+        day TEXT NOT NULL,
+        product_name TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (day, product_name)
+    ) WITHOUT ROWID
+    """)
+    # Hình học detection của từng bản ghi (JSON), dùng để vẽ ảnh annotate khi cần
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS record_detections (
+        record_id INTEGER PRIMARY KEY,
+        data TEXT NOT NULL
+    )
+    """)
+    # Hàng đợi job cho ảnh trong INPUT_DIR: pending -> claimed -> done | (pending thử lại) | failed.
+    # `due`: với pending là thời điểm được chạy (backoff), với claimed là lúc hết lease.
     cur.execute("""
-        INSERT INTO records (timestamp, brand, product_name, conf, image_path)
-        VALUES (?, ?, ?, ?, ?)
-    """, (timestamp, brand, product_name, conf, image_path))
-    con.commit()
-    rid = cur.lastrowid
-    con.close()
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        path TEXT NOT NULL,
+        state TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        due REAL NOT NULL,
+        created REAL NOT NULL,
+        updated REAL NOT NULL,
+        record_id INTEGER,
+        error TEXT
+    )
+    """)
+    # nhận job = một lần dò index (state, due), không liệt kê thư mục
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state_due ON jobs(state, due);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_path ON jobs(path);")
+    # dead-letter: job hết lượt thử, ảnh nằm ở JOB_DEAD_DIR
+    cur.execute("""
+    CREATE VIEW IF NOT EXISTS dead_jobs AS
+    SELECT id, path, attempts, error, created, updated FROM jobs WHERE state = 'failed'
+    """)
+    if not has_rollups:
+        # DB cũ chưa có rollup -> dựng lại từ records
+        _rebuild_rollups(cur)
+    _high_water = cur.execute("SELECT IFNULL(MAX(id), 0) FROM records").fetchone()[0]
+    try:
+        cur.execute("COMMIT")
+    except Exception:
+        cur.execute("ROLLBACK")
+        raise
+    finally:
+        con.close()
+    # kết nối đọc mở trước khi đổi schema thì bỏ đi
+    _read_pool.close_all()
+    _product_ids.clear()
+    _pending_products.clear()
+    _product_match_cache.clear()
+
+
+@_timed
+def db_insert(timestamp: str, brand: str, product_name: str, conf: float, image_path: str,
+              detections: Optional[str] = None, job_id: Optional[int] = None) -> int:
+    """Ghi một bản ghi; `job_id` != None thì đánh dấu job done trong cùng transaction."""
+    global _high_water
+
+    def _insert(cur: sqlite3.Cursor) -> int:
+        cur.execute("""
+            INSERT INTO records (timestamp, brand, product_name, conf, image_path, product_id, ts_epoch)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (timestamp, brand, product_name, conf, image_path, _product_id(cur, product_name), _ts_epoch(timestamp)))
+        rid = cur.lastrowid
+        if detections is not None:
+            cur.execute("INSERT INTO record_detections (record_id, data) VALUES (?, ?)", (rid, detections))
+        _bump_rollups(cur, timestamp, product_name)
+        if job_id is not None:
+            _job_done(cur, job_id, rid)
+        return rid
+
+    rid = db_write(_insert)
+    _high_water = max(_high_water, rid)
     return rid
 
 
+@_timed
+def db_get_record(record_id: int) -> Optional[Dict[str, Any]]:
+    """Một bản ghi kèm hình học detection (None nếu chưa lưu), cho /annotated/<id>."""
+    with _read_pool.conn() as con:
+        r = con.execute("""
+            SELECT r.id, r.image_path, d.data AS detections
+            FROM records r LEFT JOIN record_detections d ON d.record_id = r.id
+            WHERE r.id = ?
+        """, (record_id,)).fetchone()
+    if r is None:
+        return None
+    return {"id": r["id"], "image_path": r["image_path"] or "", "detections": r["detections"]}
+
+
+@_timed
+def db_flat_image_paths() -> List[Tuple[int, str, str]]:
+    """(id, timestamp, image_path) của các bản ghi còn image_path kiểu cũ (không có thư mục ngày)."""
+    with _read_pool.conn() as con:
+        rows = con.execute("""
+            SELECT id, timestamp, image_path FROM records
+            WHERE image_path IS NOT NULL AND image_path != '' AND image_path NOT LIKE '%/%'
+        """).fetchall()
+    return [(r["id"], r["timestamp"], r["image_path"]) for r in rows]
+
+
+@_timed
+def db_set_image_paths(pairs: List[Tuple[int, str]]) -> int:
+    """Đổi image_path theo id (dùng khi chuyển ảnh sang layout YYYY/MM/DD)."""
+    if not pairs:
+        return 0
+
+    def _update(cur: sqlite3.Cursor) -> int:
+        cur.executemany("UPDATE records SET image_path = ? WHERE id = ?", [(p, i) for i, p in pairs])
+        return cur.rowcount
+
+    return db_write(_update)
+
+
+def _job_done(cur: sqlite3.Cursor, job_id: int, record_id: Optional[int], error: Optional[str] = None):
+    cur.execute("UPDATE jobs SET state = 'done', record_id = ?, error = ?, updated = ? WHERE id = ?",
+                (record_id, error, time.time(), job_id))
+
+
+@_timed
+def db_jobs_enqueue(paths: List[str]) -> List[int]:
+    """Tạo job pending cho từng file; file đã có job pending/claimed thì trả về id job đó."""
+    if not paths:
+        return []
+
+    def _enqueue(cur: sqlite3.Cursor) -> List[int]:
+        now = time.time()
+        ids = []
+        for p in paths:
+            row = cur.execute("SELECT id FROM jobs WHERE path = ? AND state IN ('pending', 'claimed')",
+                              (p,)).fetchone()
+            if row is not None:
+                ids.append(row[0])
+                continue
+            cur.execute("INSERT INTO jobs (path, state, attempts, due, created, updated) VALUES (?, 'pending', 0, ?, ?, ?)",
+                        (p, now, now, now))
+            ids.append(cur.lastrowid)
+        return ids
+
+    return db_write(_enqueue)
+
+
+@_timed
+def db_jobs_claim(n: int, lease_seconds: float, exclude: Optional[List[str]] = None) -> List[Tuple[int, str, int]]:
+    """Nhận tối đa n job đến hạn (cũ nhất trước): (id, path, số lần thử kể cả lần này).
+
+    Job claimed đã quá lease (process xử lý nó đã chết) được trả về pending trước. Job của
+    các file trong `exclude` (bên gọi vẫn đang xử lý) để nguyên pending, không tính lượt thử;
+    mỗi file nhận tối đa một job mỗi lần.
+    """
+    exclude = list(exclude or ())
+
+    def _claim(cur: sqlite3.Cursor) -> List[Tuple[int, str, int]]:
+        now = time.time()
+        cur.execute("UPDATE jobs SET state = 'pending', error = 'lease expired', updated = ? "
+                    "WHERE state = 'claimed' AND due < ?", (now, now))
+        skip = f"AND path NOT IN ({','.join('?' * len(exclude))}) " if exclude else ""
+        rows = cur.execute("SELECT id, path, attempts FROM jobs WHERE state = 'pending' AND due <= ? "
+                           f"{skip}ORDER BY due, id LIMIT ?", (now, *exclude, n)).fetchall()
+        # nhiều job cùng một file: chỉ nhận job cũ nhất, job còn lại để pending
+        seen = set()
+        rows = [r for r in rows if not (r[1] in seen or seen.add(r[1]))]
+        if not rows:
+            return []
+        cur.executemany("UPDATE jobs SET state = 'claimed', attempts = attempts + 1, due = ?, updated = ? WHERE id = ?",
+                        [(now + lease_seconds, now, r[0]) for r in rows])
+        return [(r[0], r[1], r[2] + 1) for r in rows]
+
+    return db_write(_claim)
+
+
+@_timed
+def db_job_done(job_id: int, record_id: Optional[int] = None, error: Optional[str] = None):
+    """Job xong mà không ghi bản ghi (vd. frame trùng bị bỏ qua, ảnh vào đã mất)."""
+    db_write(lambda cur: _job_done(cur, job_id, record_id, error))
+
+
+@_timed
+def db_job_fail(job_id: int, error: str, retry_at: Optional[float] = None, path: Optional[str] = None):
+    """Lỗi: `retry_at` != None -> pending lại từ thời điểm đó; None -> failed (dead-letter), ảnh ở `path`."""
+    def _fail(cur: sqlite3.Cursor):
+        now = time.time()
+        if retry_at is not None:
+            cur.execute("UPDATE jobs SET state = 'pending', due = ?, error = ?, updated = ? WHERE id = ?",
+                        (retry_at, error, now, job_id))
+        else:
+            cur.execute("UPDATE jobs SET state = 'failed', path = IFNULL(?, path), error = ?, updated = ? WHERE id = ?",
+                        (path, error, now, job_id))
+
+    db_write(_fail)
+
+
+@_timed
+def db_job_requeue(job_id: int, path: str) -> bool:
+    """Đưa job dead-letter về pending (ảnh đã được chuyển lại `path`), đếm lại lượt thử."""
+    def _requeue(cur: sqlite3.Cursor) -> bool:
+        now = time.time()
+        cur.execute("UPDATE jobs SET state = 'pending', path = ?, attempts = 0, due = ?, error = NULL, updated = ? "
+                    "WHERE id = ? AND state = 'failed'", (path, now, now, job_id))
+        return cur.rowcount > 0
+
+    return db_write(_requeue)
+
+
+@_timed
+def db_jobs_release(ids: List[int]) -> int:
+    """Trả các job claimed về pending ngay (đối soát lúc khởi động: process trước đã chết)."""
+    if not ids:
+        return 0
+
+    def _release(cur: sqlite3.Cursor) -> int:
+        now = time.time()
+        cur.executemany("UPDATE jobs SET state = 'pending', due = ?, error = 'interrupted', updated = ? "
+                        "WHERE id = ? AND state = 'claimed'", [(now, now, i) for i in ids])
+        return cur.rowcount
+
+    return db_write(_release)
+
+
+@_timed
+def db_jobs_prune(before: float) -> int:
+    """Xoá job done cập nhật trước `before` (epoch)."""
+    def _prune(cur: sqlite3.Cursor) -> int:
+        cur.execute("DELETE FROM jobs WHERE state = 'done' AND updated < ?", (before,))
+        return cur.rowcount
+
+    return db_write(_prune)
+
+
+@_timed
+def db_jobs_in_state(*states: str) -> List[Dict[str, Any]]:
+    with _read_pool.conn() as con:
+        rows = con.execute(f"SELECT id, path, state, attempts, updated FROM jobs "
+                           f"WHERE state IN ({','.join('?' * len(states))}) ORDER BY id", states).fetchall()
+    return [dict(r) for r in rows]
+
+
+@_timed
+def db_job_latest(path: str) -> Optional[Dict[str, Any]]:
+    """Job mới nhất của một file (bất kể trạng thái)."""
+    with _read_pool.conn() as con:
+        r = con.execute("SELECT id, path, state, attempts, updated, record_id FROM jobs "
+                        "WHERE path = ? ORDER BY id DESC LIMIT 1", (path,)).fetchone()
+    return dict(r) if r is not None else None
+
+
+@_timed
+def db_job_get(job_id: int) -> Optional[Dict[str, Any]]:
+    with _read_pool.conn() as con:
+        r = con.execute("SELECT id, path, state, attempts, due, created, updated, record_id, error "
+                        "FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(r) if r is not None else None
+
+
+@_timed
+def db_jobs_stats() -> Dict[str, int]:
+    with _read_pool.conn() as con:
+        rows = con.execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state").fetchall()
+    out = {"pending": 0, "claimed": 0, "done": 0, "failed": 0}
+    out.update({r["state"]: r["n"] for r in rows})
+    return out
+
+
+@_timed
+def db_jobs_dead(limit: int = 100) -> List[Dict[str, Any]]:
+    with _read_pool.conn() as con:
+        rows = con.execute("SELECT * FROM dead_jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    return [dict(r) for r in rows]
+
+
+@_timed
+def db_image_paths_on(day: str) -> set:
+    """image_path của các bản ghi có timestamp trong ngày "YYYY-MM-DD" (dùng index ts_epoch)."""
+    start = _epoch(datetime.strptime(day, "%Y-%m-%d"))
+    with _read_pool.conn() as con:
+        rows = con.execute("SELECT image_path FROM records WHERE ts_epoch >= ? AND ts_epoch < ?",
+                           (start, start + 86400)).fetchall()
+    return {r["image_path"] for r in rows}
+
+
+def db_high_water() -> int:
+    """id lớn nhất trong records mà process này biết (tăng sau mỗi db_insert)."""
+    return _high_water
+
+
+def db_note_records(rows: List[Dict[str, Any]]):
+    """Process không tự insert (web tách khỏi worker) báo các bản ghi mới thấy.
+
+    Nâng high water để cache hết hạn đúng lúc, và xoá cache khớp sản phẩm khi gặp tên
+    sản phẩm chưa biết (process này không đi qua _product_id nên không tự biết có sản phẩm mới).
+    """
+    global _high_water
+    if not rows:
+        return
+    _high_water = max(_high_water, max(int(r["id"]) for r in rows))
+    new = {r["product_name"] for r in rows} - _seen_products
+    if new:
+        _seen_products.update(new)
+        _product_match_cache.clear()
+
+
+# name -> id, chỉ luồng ghi cập nhật
+_product_ids: Dict[str, int] = {}
+# sản phẩm insert trong transaction đang mở: chỉ vào _product_ids sau COMMIT (rollback thì id không còn)
+_pending_products: Dict[str, int] = {}
+_products_dirty = False
+# chuỗi lọc -> [(id, name)] đã khớp; xoá khi có sản phẩm mới
+_product_match_cache: Dict[str, List[Tuple[int, str]]] = {}
+# tên sản phẩm đã thấy qua db_note_records
+_seen_products: set = set()
+
+
+def _product_id(cur: sqlite3.Cursor, product_name: Optional[str]) -> Optional[int]:
+    if not product_name:
+        return None
+    pid = _product_ids.get(product_name)
+    if pid is None:
+        pid = _pending_products.get(product_name)
+    if pid is None:
+        cur.execute("INSERT OR IGNORE INTO products (name) VALUES (?)", (product_name,))
+        inserted = cur.rowcount
+        pid = cur.execute("SELECT id FROM products WHERE name = ?", (product_name,)).fetchone()[0]
+        if inserted:
+            _pending_products[product_name] = pid
+        else:
+            _product_ids[product_name] = pid
+    return pid
+
+
+def _products_committed():
+    """Luồng ghi gọi sau COMMIT: id sản phẩm mới thành chính thức, cache khớp sản phẩm hết hạn."""
+    global _products_dirty
+    if _pending_products or _products_dirty:
+        _product_ids.update(_pending_products)
+        _pending_products.clear()
+        _products_dirty = False
+        _product_match_cache.clear()
+
+
+def _products_rolled_back():
+    """Luồng ghi gọi sau ROLLBACK (cả SAVEPOINT): bỏ id sản phẩm vừa insert, lần sau đọc lại từ bảng.
+
+    Lệnh khác cùng lô có thể đã insert sản phẩm và vẫn commit -> vẫn xoá cache khớp sau COMMIT.
+    """
+    global _products_dirty
+    if _pending_products:
+        _pending_products.clear()
+        _products_dirty = True
+
+
+def _match_products(product: str) -> List[Tuple[int, str]]:
+    """Tìm các sản phẩm khớp bộ lọc trên bảng products (vài chục dòng) thay vì LIKE trên records.
+
+    Mặc định khớp chuỗi con như LIKE '%x%'; tiền tố "=" để khớp đúng tên (vd. "=c2").
+    """
+    cached = _product_match_cache.get(product)
+    if cached is not None:
+        return cached
+    with _read_pool.conn() as con:
+        if product.startswith("="):
+            rows = con.execute("SELECT id, name FROM products WHERE name = ?", (product[1:],)).fetchall()
+        else:
+            rows = con.execute("SELECT id, name FROM products WHERE name LIKE ?", (f"%{product}%",)).fetchall()
+    matched = [(int(r["id"]), r["name"]) for r in rows]
+    if len(_product_match_cache) > 256:
+        _product_match_cache.clear()
+    _product_match_cache[product] = matched
+    return matched
+
+
+def _filter_clauses(start_date: str, end_date: str, product: str) -> Tuple[List[str], List[Any]]:
+    where: List[str] = []
+    params: List[Any] = []
+    try:
+        if start_date:
+            s = _epoch(_parse_bound(start_date, False))
+        if end_date:
+            e = _epoch(_parse_bound(end_date, True))
+        if start_date:
+            where.append("ts_epoch >= ?")
+            params.append(s)
+        if end_date:
+            where.append("ts_epoch < ?")
+            params.append(e)
+    except ValueError:
+        # mốc không chuẩn -> so chuỗi như cũ
+        if start_date:
+            where.append("timestamp >= ?")
+            params.append(start_date)
+        if end_date:
+            where.append("timestamp <= ?")
+            params.append(end_date)
+    if product:
+        ids = [pid for pid, _ in _match_products(product)]
+        if ids:
+            where.append(f"product_id IN ({','.join('?' * len(ids))})")
+            params += ids
+        else:
+            where.append("0")
+    return where, params
+
+
+def _bump_rollups(cur: sqlite3.Cursor, timestamp: str, product_name: str):
+    pn = product_name or ""
+    cur.execute("""
+        INSERT INTO rollup_hourly (hour, product_name, count) VALUES (?, ?, 1)
+        ON CONFLICT(hour, product_name) DO UPDATE SET count = count + 1
+    """, (timestamp[:13], pn))
+    cur.execute("""
+        INSERT INTO rollup_daily (day, product_name, count) VALUES (?, ?, 1)
+        ON CONFLICT(day, product_name) DO UPDATE SET count = count + 1
+    """, (timestamp[:10], pn))
+
+
+def _rebuild_rollups(cur: sqlite3.Cursor):
+    cur.execute("DELETE FROM rollup_hourly")
+    cur.execute("DELETE FROM rollup_daily")
+    cur.execute("""
+        INSERT INTO rollup_hourly (hour, product_name, count)
+        SELECT substr(timestamp, 1, 13), IFNULL(product_name, ''), COUNT(*) FROM records
+        GROUP BY 1, 2
+    """)
+    cur.execute("""
+        INSERT INTO rollup_daily (day, product_name, count)
+        SELECT substr(hour, 1, 10), product_name, SUM(count) FROM rollup_hourly
+        GROUP BY 1, 2
+    """)
+
+
+@_timed
+def db_rebuild_rollups() -> int:
+    """Dựng lại rollup_hourly / rollup_daily từ records. Trả về số dòng rollup theo giờ."""
+    def _rebuild(cur: sqlite3.Cursor) -> int:
+        _rebuild_rollups(cur)
+        return cur.execute("SELECT COUNT(*) FROM rollup_hourly").fetchone()[0]
+
+    return db_write(_rebuild)
+
+
+_TS_FMT = "%Y-%m-%d %H:%M:%S"
+
+
+def _epoch(dt: datetime) -> int:
+    return calendar.timegm(dt.timetuple())
+
+
+def _ts_epoch(timestamp: str) -> int:
+    """Giây (giờ tường như UTC) của timestamp; không đọc được thì lấy giờ xử lý, không để NULL."""
+    for fmt in (_TS_FMT, "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return _epoch(datetime.strptime((timestamp or "")[:19], fmt))
+        except ValueError:
+            continue
+    return _epoch(datetime.now())
+
+
+def _backfill_ts_epoch(cur: sqlite3.Cursor) -> int:
+    """Bản ghi còn ts_epoch NULL: lấy phần ngày của timestamp, không được thì giờ hiện tại.
+
+    Trả về số bản ghi đã sửa (dùng index ts_epoch, gần như không tốn gì khi không có dòng nào).
+    """
+    cur.execute("""
+        UPDATE records SET ts_epoch = COALESCE(
+            CAST(strftime('%s', substr(timestamp, 1, 10)) AS INTEGER),
+            CAST(strftime('%s', 'now', 'localtime') AS INTEGER))
+        WHERE ts_epoch IS NULL
+    """)
+    return cur.rowcount
+
+
+def _parse_bound(value: str, is_end: bool) -> datetime:
+    """Đổi mốc lọc thành datetime, giữ đúng ngữ nghĩa so sánh chuỗi của `timestamp >= / <= ?`.
+
+    Mốc đầu trả về giá trị bao gồm; mốc cuối trả về giá trị KHÔNG bao gồm
+    (vd. "... 08:30" <= "... 08:30:xx" là sai, nên mốc cuối là 08:30:00).
+    """
+    v = (value or "").strip()
+    for fmt in (_TS_FMT, "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            dt = datetime.strptime(v, fmt)
+        except ValueError:
+            continue
+        if is_end and fmt == _TS_FMT:
+            dt += timedelta(seconds=1)
+        return dt
+    raise ValueError(v)
+
+
+def _plan_buckets(start_date: str, end_date: str):
+    """Chia khoảng lọc thành các phần đọc từ rollup_daily, rollup_hourly và records.
+
+    Trả về danh sách (nguồn, lo, hi) với lo bao gồm, hi không bao gồm, None = không giới hạn;
+    hoặc None nếu không phân tích được mốc thời gian (khi đó đọc thẳng records).
+    """
+    try:
+        s = _parse_bound(start_date, False) if start_date else None
+        e = _parse_bound(end_date, True) if end_date else None
+    except ValueError:
+        return None
+    if s is not None and e is not None and s >= e:
+        return []
+
+    # [hs, he): các giờ nằm trọn trong khoảng lọc
+    hs = None
+    if s is not None:
+        hs = s.replace(minute=0, second=0)
+        if hs < s:
+            hs += timedelta(hours=1)
+    he = e.replace(minute=0, second=0) if e is not None else None
+
+    if hs is not None and he is not None and hs >= he:
+        return [("raw", s, e)]
+
+    parts = []
+    if s is not None and hs > s:
+        parts.append(("raw", s, hs))
+
+    # [ds, de): các ngày nằm trọn trong [hs, he)
+    ds = None
+    if hs is not None:
+        ds = hs.replace(hour=0)
+        if ds < hs:
+            ds += timedelta(days=1)
+    de = he.replace(hour=0) if he is not None else None
+
+    if ds is not None and de is not None and ds >= de:
+        parts.append(("hour", hs, he))
+    else:
+        if hs is not None and ds > hs:
+            parts.append(("hour", hs, ds))
+        parts.append(("day", ds, de))
+        if he is not None and he > de:
+            parts.append(("hour", de, he))
+
+    if e is not None and e > he:
+        parts.append(("raw", he, e))
+    return parts
+
+
+_BUCKET_SQL = {
+    # nguồn: (bảng, cột thời gian, định dạng mốc, biểu thức ngày, biểu thức đếm)
+    "day": ("rollup_daily", "day", "%Y-%m-%d", "day", "SUM(count)"),
+    "hour": ("rollup_hourly", "hour", "%Y-%m-%d %H", "substr(hour, 1, 10)", "SUM(count)"),
+    "raw": ("records", "ts_epoch", None, "substr(timestamp, 1, 10)", "COUNT(*)"),
+}
+
+
+def _rollup_counts(start_date: str, end_date: str, product: str, by_day: bool,
+                   matched: Optional[List[Tuple[int, str]]] = None) -> Optional[Dict[str, int]]:
+    """Đếm theo sản phẩm (hoặc theo ngày) từ rollup; records chỉ được đọc ở các giờ lẻ hai đầu.
+
+    `matched` (nếu có) thay cho bộ lọc `product`: danh sách (id, tên) đã tra sẵn.
+    Trả về None nếu mốc thời gian không chuẩn (người gọi tự đọc records).
+    """
+    plan = _plan_buckets(start_date, end_date)
+    if plan is None:
+        return None
+
+    if matched is None and product:
+        matched = _match_products(product)
+    out: Dict[str, int] = {}
+    if matched is not None and not matched:
+        return out
+    with _read_pool.conn() as con:
+        for src, lo, hi in plan:
+            table, col, fmt, day_expr, agg = _BUCKET_SQL[src]
+            key = day_expr if by_day else "product_name"
+            where = []
+            params: List[Any] = []
+            if lo is not None:
+                where.append(f"{col} >= ?")
+                params.append(lo.strftime(fmt) if fmt else _epoch(lo))
+            if hi is not None:
+                where.append(f"{col} < ?")
+                params.append(hi.strftime(fmt) if fmt else _epoch(hi))
+            if matched is not None:
+                if src == "raw":
+                    where.append(f"product_id IN ({','.join('?' * len(matched))})")
+                    params += [pid for pid, _ in matched]
+                else:
+                    where.append(f"product_name IN ({','.join('?' * len(matched))})")
+                    params += [name for _, name in matched]
+
+            sql = f"SELECT {key} AS k, {agg} AS c FROM {table}"
+            if where:
+                sql += " WHERE " + " AND ".join(where)
+            sql += " GROUP BY k"
+            for r in con.execute(sql, params).fetchall():
+                k = r["k"] or ""
+                out[k] = out.get(k, 0) + int(r["c"] or 0)
+    return out
+
+
 def _row_to_dict(r: sqlite3.Row) -> Dict[str, Any]:
     return {
         "id": r["id"],
@@ -59,73 +910,85 @@ def _row_to_dict(r: sqlite3.Row) -> Dict[str, Any]:
     }
 
 
-def db_query_cursor(start_date: str, end_date: str, product: str, limit: int = 20, cursor_id: Optional[int] = None) -> List[Dict[str, Any]]:
-    where = []
-    params = []
-    if start_date:
-        where.append("timestamp >= ?")
-        params.append(start_date)
-    if end_date:
-        where.append("timestamp <= ?")
-        params.append(end_date)
-    if product:
-        where.append("product_name LIKE ?")
-        params.append(f"%{product}%")
+def _latest_rows(cols: str, start_date: str, end_date: str, product: str, limit: int,
+                 cursor_id: Optional[int] = None) -> List[sqlite3.Row]:
+    """SELECT ... ORDER BY id DESC LIMIT, chọn dạng câu lệnh để luôn đi theo index.
+
+    - có khoảng thời gian: lấy id từ index covering (ts_epoch, product_id) trong khoảng rồi
+      sắp xếp (`+id` để SQLite không đi lùi theo khoá chính qua cả bảng khi khoảng nằm xa);
+    - chỉ lọc sản phẩm: mỗi sản phẩm đi lùi trên index (product_id, id) với LIMIT rồi gộp;
+    - không lọc: đi lùi theo khoá chính, dừng ở LIMIT.
+    """
+    where, params = _filter_clauses(start_date, end_date, product)
     if cursor_id is not None:
         where.append("id < ?")
         params.append(int(cursor_id))
 
-    sql = "SELECT * FROM records"
+    if start_date or end_date:
+        # lọc + sắp xếp chỉ trên index covering, sau đó mới đọc `limit` dòng đầy đủ
+        sql = "SELECT id FROM records WHERE " + " AND ".join(where) + " ORDER BY +id DESC LIMIT ?"
+        sql = f"SELECT {cols} FROM records WHERE id IN ({sql}) ORDER BY id DESC"
+        params.append(int(limit))
+        with _read_pool.conn() as con:
+            return con.execute(sql, params).fetchall()
+
+    if product:
+        ids = [pid for pid, _ in _match_products(product)]
+        if len(ids) > 1:
+            parts = []
+            params = []
+            for pid in ids:
+                sub = f"SELECT {cols} FROM records WHERE product_id = ?"
+                params.append(pid)
+                if cursor_id is not None:
+                    sub += " AND id < ?"
+                    params.append(int(cursor_id))
+                parts.append(f"SELECT * FROM ({sub} ORDER BY id DESC LIMIT ?)")
+                params.append(int(limit))
+            sql = " UNION ALL ".join(parts) + " ORDER BY id DESC LIMIT ?"
+            params.append(int(limit))
+            with _read_pool.conn() as con:
+                return con.execute(sql, params).fetchall()
+
+    sql = f"SELECT {cols} FROM records"
     if where:
         sql += " WHERE " + " AND ".join(where)
     sql += " ORDER BY id DESC LIMIT ?"
     params.append(int(limit))
 
-    con = db_connect()
-    cur = con.cursor()
-    cur.execute(sql, params)
-    rows = cur.fetchall()
-    con.close()
+    with _read_pool.conn() as con:
+        return con.execute(sql, params).fetchall()
+
+
+@_timed
+def db_query_cursor(start_date: str, end_date: str, product: str, limit: int = 20, cursor_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    rows = _latest_rows("*", start_date, end_date, product, limit, cursor_id)
     return [_row_to_dict(r) for r in rows]
 
 
+@_timed
 def db_query_newer(start_date: str, end_date: str, product: str, last_id: int, limit: int = 50) -> List[Dict[str, Any]]:
-    where = ["id > ?"]
-    params = [int(last_id)]
-    if start_date:
-        where.append("timestamp >= ?")
-        params.append(start_date)
-    if end_date:
-        where.append("timestamp <= ?")
-        params.append(end_date)
-    if product:
-        where.append("product_name LIKE ?")
-        params.append(f"%{product}%")
+    where, params = _filter_clauses(start_date, end_date, product)
+    where.insert(0, "id > ?")
+    params.insert(0, int(last_id))
 
     sql = "SELECT * FROM records WHERE " + " AND ".join(where)
     sql += " ORDER BY id ASC LIMIT ?"
     params.append(int(limit))
 
-    con = db_connect()
-    cur = con.cursor()
-    cur.execute(sql, params)
-    rows = cur.fetchall()
-    con.close()
+    with _read_pool.conn() as con:
+        rows = con.execute(sql, params).fetchall()
     return [_row_to_dict(r) for r in rows]
 
 
+@_timed
 def db_stats(start_date: str, end_date: str, product: str, topk: int = 30) -> List[Dict[str, Any]]:
-    where = []
-    params = []
-    if start_date:
-        where.append("timestamp >= ?")
-        params.append(start_date)
-    if end_date:
-        where.append("timestamp <= ?")
-        params.append(end_date)
-    if product:
-        where.append("product_name LIKE ?")
-        params.append(f"%{product}%")
+    counts = _rollup_counts(start_date, end_date, product, by_day=False)
+    if counts is not None:
+        items = sorted(((k, c) for k, c in counts.items() if c), key=lambda kv: kv[1], reverse=True)
+        return [{"label": k or "Unknown", "count": c} for k, c in items[:int(topk)]]
+
+    where, params = _filter_clauses(start_date, end_date, product)
 
     sql = "SELECT product_name AS label, COUNT(*) AS count FROM records"
     if where:
@@ -133,106 +996,122 @@ def db_stats(start_date: str, end_date: str, product: str, topk: int = 30) -> Li
     sql += " GROUP BY product_name ORDER BY count DESC LIMIT ?"
     params.append(int(topk))
 
-    con = db_connect()
-    cur = con.cursor()
-    cur.execute(sql, params)
-    rows = cur.fetchall()
-    con.close()
+    with _read_pool.conn() as con:
+        rows = con.execute(sql, params).fetchall()
 
     return [{"label": (r["label"] or "Unknown"), "count": int(r["count"])} for r in rows]
 
 
+@_timed
 def db_count_all() -> int:
-    con = db_connect()
-    cur = con.cursor()
-    cur.execute("SELECT COUNT(*) FROM records")
-    total = cur.fetchone()[0]
-    con.close()
+    # rollup_daily luôn khớp records, đọc vài trăm dòng thay vì quét cả bảng
+    with _read_pool.conn() as con:
+        total = con.execute("SELECT IFNULL(SUM(count), 0) FROM rollup_daily").fetchone()[0]
     return int(total)
 
 
+@_timed
 def db_count_filtered(start_date: str, end_date: str, product: str) -> int:
-    where = []
-    params = []
-    if start_date:
-        where.append("timestamp >= ?")
-        params.append(start_date)
-    if end_date:
-        where.append("timestamp <= ?")
-        params.append(end_date)
-    if product:
-        where.append("product_name LIKE ?")
-        params.append(f"%{product}%")
+    counts = _rollup_counts(start_date, end_date, product, by_day=False)
+    if counts is not None:
+        return sum(counts.values())
+
+    where, params = _filter_clauses(start_date, end_date, product)
     
     sql = "SELECT COUNT(*) FROM records"
     if where:
         sql += " WHERE " + " AND ".join(where)
         
-    con = db_connect()
-    cur = con.cursor()
-    cur.execute(sql, params)
-    total = cur.fetchone()[0]
-    con.close()
+    with _read_pool.conn() as con:
+        total = con.execute(sql, params).fetchone()[0]
     return int(total)
 
 
+@_timed
 def db_stats_by_day(start_date: str, end_date: str, product: str) -> List[Dict[str, Any]]:
-    where = []
-    params = []
-    if start_date:
-        where.append("timestamp >= ?")
-        params.append(start_date)
-    if end_date:
-        where.append("timestamp <= ?")
-        params.append(end_date)
-    if product:
-        where.append("product_name LIKE ?")
-        params.append(f"%{product}%")
+    counts = _rollup_counts(start_date, end_date, product, by_day=True)
+    if counts is not None:
+        return [{"day": k, "count": c} for k, c in sorted(counts.items()) if c]
+
+    where, params = _filter_clauses(start_date, end_date, product)
 
     sql = "SELECT substr(timestamp, 1, 10) as day, COUNT(*) as count FROM records"
     if where:
         sql += " WHERE " + " AND ".join(where)
     sql += " GROUP BY day ORDER BY day ASC"
 
-    con = db_connect()
-    cur = con.cursor()
-    cur.execute(sql, params)
-    rows = cur.fetchall()
-    con.close()
+    with _read_pool.conn() as con:
+        rows = con.execute(sql, params).fetchall()
     return [{"day": r["day"], "count": r["count"]} for r in rows]
 
 
-def db_compare_products(start_date: str, end_date: str, prod_a: str, prod_b: str) -> Dict[str, int]:
-    count_a = db_count_filtered(start_date, end_date, prod_a)
-    count_b = db_count_filtered(start_date, end_date, prod_b)
-    return {prod_a: count_a, prod_b: count_b}
+@_timed
+def db_compare_products(start_date: str, end_date: str, *products: str) -> Dict[str, int]:
+    """Đếm cho nhiều bộ lọc sản phẩm cùng lúc bằng một truy vấn GROUP BY (mỗi nguồn rollup).
+
+    Mỗi bộ lọc khớp như tham số `product` của các hàm khác (chuỗi con, "=" để khớp đúng tên).
+    """
+    products = tuple(dict.fromkeys(p or "" for p in products))
+    if "" in products:
+        # có bộ lọc rỗng = mọi sản phẩm -> đếm không lọc rồi cộng theo tên
+        matches = None
+    else:
+        matches = {p: _match_products(p) for p in products}
+        union = sorted({m for ms in matches.values() for m in ms})
+        if not union:
+            return {p: 0 for p in products}
+
+    counts = _rollup_counts(start_date, end_date, "", by_day=False,
+                            matched=None if matches is None else union)
+    if counts is None:
+        where, params = _filter_clauses(start_date, end_date, "")
+        if matches is not None:
+            where.append(f"product_id IN ({','.join('?' * len(union))})")
+            params += [pid for pid, _ in union]
+        sql = "SELECT product_name AS k, COUNT(*) AS c FROM records"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " GROUP BY product_id"
+        with _read_pool.conn() as con:
+            counts = {(r["k"] or ""): int(r["c"]) for r in con.execute(sql, params).fetchall()}
+
+    if matches is None:
+        total = sum(counts.values())
+        return {p: total if not p else sum(counts.get(n, 0) for _, n in _match_products(p)) for p in products}
+    return {p: sum(counts.get(n, 0) for _, n in matches[p]) for p in products}
+
+
+@_timed_iter
+def db_iter_export(start_date: str, end_date: str, product: str, batch_size: int = 1000) -> Iterator[sqlite3.Row]:
+    """Duyệt (id, timestamp, product_name) theo id giảm dần, từng trang theo khoá (id < trang trước).
+
+    Chỉ giữ một trang trong RAM nên bộ nhớ không tăng theo số dòng xuất. Mỗi trang mượn
+    kết nối đọc rồi trả ngay: client tải chậm không giữ snapshot WAL (checkpoint vẫn chạy,
+    WAL không phình) suốt cả lượt tải. Bản ghi mới ghi trong lúc tải không lọt vào giữa.
+    """
+    where, params = _filter_clauses(start_date, end_date, product)
+    last = None
+    while True:
+        page_where = where + (["id < ?"] if last is not None else [])
+        page_params = params + ([last] if last is not None else [])
+        sql = "SELECT id, timestamp, product_name FROM records"
+        if page_where:
+            sql += " WHERE " + " AND ".join(page_where)
+        sql += " ORDER BY id DESC LIMIT ?"
+        with _read_pool.conn() as con:
+            rows = con.execute(sql, page_params + [batch_size]).fetchall()
+        if not rows:
+            return
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        last = rows[-1]["id"]
 
 
 # === HÀM QUAN TRỌNG ĐỂ AI ĐỌC DỮ LIỆU ===
+@_timed
 def db_get_csv_data(start_date: str, end_date: str, product: str, limit: int = 200) -> str:
-    where = []
-    params = []
-    if start_date:
-        where.append("timestamp >= ?")
-        params.append(start_date)
-    if end_date:
-        where.append("timestamp <= ?")
-        params.append(end_date)
-    if product:
-        where.append("product_name LIKE ?")
-        params.append(f"%{product}%")
-    
-    sql = "SELECT id, timestamp, product_name FROM records"
-    if where:
-        sql += " WHERE " + " AND ".join(where)
-    sql += " ORDER BY id DESC LIMIT ?"
-    params.append(int(limit))
-    
-    con = db_connect()
-    cur = con.cursor()
-    cur.execute(sql, params)
-    rows = cur.fetchall()
-    con.close()
+    rows = _latest_rows("id, timestamp, product_name", start_date, end_date, product, limit)
 
     csv_lines = ["ID, Timestamp, Product"]
     for r in rows:
@@ -0,0 +1,147 @@
+"""Cổng chống frame trùng trước khi suy luận.
+
+ESP32-CAM chụp mỗi 5 giây dù cảnh không đổi. Mỗi frame được băm dHash 64 bit
+(giải mã JPEG thu nhỏ 1/8, xám) và so với frame gần nhất đã suy luận của cùng
+camera; khoảng cách Hamming <= DEDUP_DISTANCE thì frame bị bỏ qua ("skip") hoặc
+ghi lại với kết quả cũ ("reuse") thay vì chạy model.
+
+Frame đưa đi suy luận chỉ thành mốc khi đã ghi xong (record); lỗi giữa chừng thì
+forget, để lần thử lại của chính frame đó không bị coi là trùng rồi bị xoá.
+"""
+import os
+import re
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .config import DEDUP_MODE, DEDUP_DISTANCE
+
+# img_YYYYMMDD_HHMMSS[_ms].jpg -> "img"; tên không có timestamp -> bỏ hậu tố số
+_CAM_RE = re.compile(r"(?:_?\d{8}_\d{6})?(?:_\d+)?$")
+
+
+def camera_id(filename: str) -> str:
+    """Tên camera = tiền tố tên file trước phần timestamp (vd. "cam_20260101_120000.jpg" -> "cam")."""
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return _CAM_RE.sub("", name) or "default"
+
+
+def frame_hash(data: bytes) -> Optional[int]:
+    """dHash 64 bit của ảnh JPEG/PNG (None nếu không giải mã được)."""
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if img is None:
+        return None
+    small = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class _Camera:
+    __slots__ = ("anchor", "result", "pending", "frames", "skipped", "reused")
+
+    def __init__(self):
+        # mốc đã có kết quả; pending: frame mới đang suy luận, thành mốc khi record
+        self.anchor: Optional[int] = None
+        self.result: Optional[Tuple[str, float]] = None
+        self.pending: Optional[int] = None
+        self.frames = 0
+        self.skipped = 0
+        self.reused = 0
+
+
+class DuplicateGate:
+    """Quyết định cho từng frame: "infer", "skip" hoặc "reuse".
+
+    Frame mốc chỉ đổi khi một frame khác đủ xa được suy luận và ghi xong, nên cảnh
+    thay đổi chậm vẫn được suy luận lại khi lệch quá ngưỡng so với mốc.
+    """
+
+    def __init__(self, mode: str, distance: int):
+        self.mode = mode
+        self.distance = distance
+        self._cams: Dict[str, _Camera] = {}
+        self._lock = threading.Lock()
+        # thời gian suy luận trung bình (EMA) để ước lượng thời gian đã tiết kiệm
+        self._infer_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("skip", "reuse")
+
+    def check(self, camera: str, data: Optional[bytes]) -> Tuple[str, Optional[Tuple[str, float]]]:
+        """Trả về ("infer", None), ("skip", None) hoặc ("reuse", (tên, conf))."""
+        if not self.enabled or not data:
+            return "infer", None
+        h = frame_hash(data)
+        if h is None:
+            return "infer", None
+
+        with self._lock:
+            cam = self._cams.get(camera)
+            if cam is None:
+                cam = self._cams[camera] = _Camera()
+            cam.frames += 1
+            if cam.anchor is not None and hamming(h, cam.anchor) <= self.distance:
+                self.saved_seconds += self._infer_seconds
+                if self.mode == "reuse":
+                    cam.reused += 1
+                    return "reuse", cam.result
+                cam.skipped += 1
+                return "skip", None
+            if cam.pending is not None and hamming(h, cam.pending) <= self.distance:
+                # trùng frame đang suy luận: reuse chưa có kết quả để dùng -> suy luận luôn
+                # (không bỏ frame); skip thì bỏ như thường
+                if self.mode == "reuse":
+                    return "infer", None
+                self.saved_seconds += self._infer_seconds
+                cam.skipped += 1
+                return "skip", None
+            cam.pending = h
+            return "infer", None
+
+    def record(self, camera: str, result: Tuple[str, float], seconds: Optional[float] = None):
+        """Frame đã suy luận và ghi xong: frame đang chờ thành mốc với kết quả này."""
+        if not self.enabled:
+            return
+        with self._lock:
+            cam = self._cams.get(camera)
+            if cam is not None and cam.pending is not None:
+                cam.anchor, cam.result, cam.pending = cam.pending, result, None
+            if seconds is not None:
+                a = 0.2 if self._infer_seconds else 1.0
+                self._infer_seconds += a * (seconds - self._infer_seconds)
+
+    def forget(self, camera: str):
+        """Frame của camera lỗi (suy luận/lưu/ghi DB): bỏ mốc, frame sau (kể cả lần thử lại) suy luận lại."""
+        if not self.enabled:
+            return
+        with self._lock:
+            cam = self._cams.get(camera)
+            if cam is not None:
+                cam.anchor = cam.result = cam.pending = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            frames = sum(c.frames for c in self._cams.values())
+            dup = sum(c.skipped + c.reused for c in self._cams.values())
+            return {
+                "mode": self.mode,
+                "distance": self.distance,
+                "frames": frames,
+                "skipped": sum(c.skipped for c in self._cams.values()),
+                "reused": sum(c.reused for c in self._cams.values()),
+                "skip_rate": round(dup / frames, 4) if frames else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+                "cameras": {k: {"frames": c.frames, "skipped": c.skipped, "reused": c.reused}
+                            for k, c in self._cams.items()},
+            }
+
+
+dedup_gate = DuplicateGate(DEDUP_MODE, DEDUP_DISTANCE)
@@ -1,10 +1,18 @@
-from typing import Any, Dict
+from typing import Any, AsyncIterator, Dict, Iterator, List, Tuple
+import asyncio
 import traceback
 import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 from datetime import datetime
 
-from .config import GEMINI_API_KEY, GEMINI_MODEL, USE_GEMINI
-from .db import db_stats, db_count_filtered, db_stats_by_day, db_compare_products, db_get_csv_data
+from .config import (
+    GEMINI_API_KEY, GEMINI_MODEL, USE_GEMINI,
+    GEMINI_TIMEOUT, GEMINI_MAX_CONCURRENCY, CHAT_MEMO_SIZE, CHAT_MEMO_TTL,
+)
+from .db import db_stats, db_count_filtered, db_stats_by_day, db_compare_products, db_get_csv_data, db_high_water
+from .cache import query_cache, QueryCache
 
 # --- CẤU HÌNH NHÂN CÁCH AI THÔNG MINH ---
 SYSTEM_PROMPT = """
@@ -35,11 +43,11 @@ LƯU Ý:
 """
 
 def build_summary(start: str, end: str, product: str) -> Dict[str, Any]:
-    return {
+    return query_cache.get_or_compute(("summary", start, end, product), lambda: {
         "filters": {"start_date": start, "end_date": end, "product": product},
         "total_records": db_count_filtered(start, end, product),
         "top_trending": db_stats(start, end, product, topk=5),
-    }
+    })
 
 def _fallback_rule_answer(question: str, start: str, end: str, product: str) -> str:
     # Luật cứng khi mất kết nối AI
@@ -55,99 +63,503 @@ def _fallback_rule_answer(question: str, start: str, end: str, product: str) ->
     lines = [f"{it['label']}: {it['count']}" for it in stats]
     return "Thống kê sơ bộ: " + ", ".join(lines)
 
-def ask_gemini(question: str, start: str, end: str, product: str) -> str:
-    if not USE_GEMINI or not GEMINI_API_KEY:
-        return _fallback_rule_answer(question, start, end, product)
+# Client dùng chung cho cả process (tạo một lần, không tạo lại mỗi request)
+_client = None
+_types = None
+_client_lock = threading.Lock()
+# Timeout thật nằm ở client (HttpOptions: request bị huỷ, luồng được trả lại); chờ future
+# chỉ là chốt chặn cuối, dài hơn một chút để lỗi timeout của SDK về trước
+_BACKSTOP_SECONDS = 2.0
+# Luồng gọi model (client đồng bộ)
+_executor = ThreadPoolExecutor(max_workers=GEMINI_MAX_CONCURRENCY, thread_name_prefix="gemini")
+# Tool call trong cùng một lượt chạy song song
+_tool_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="gemini-tool")
+# Memo câu trả lời theo (câu hỏi, bộ lọc, ngày); phiên bản dữ liệu do QueryCache gắn
+_answer_cache = QueryCache(CHAT_MEMO_SIZE, CHAT_MEMO_TTL)
+
+
+class _NoAnswer(Exception):
+    """Model không trả lời được: trả `text` cho người dùng nhưng không memo."""
+
+    def __init__(self, text: str):
+        super().__init__(text)
+        self.text = text
+
+
+def _get_genai():
+    global _client, _types
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from google import genai
+                from google.genai import types
+                _types = types
+                _client = genai.Client(api_key=GEMINI_API_KEY,
+                                       http_options=types.HttpOptions(timeout=int(GEMINI_TIMEOUT * 1000)))
+    return _client, _types
 
+
+def set_client(client, types_module):
+    """Thay client/types của google-genai (vd. stub cục bộ khi đo độ trễ)."""
+    global _client, _types
+    with _client_lock:
+        _client, _types = client, types_module
+    _answer_cache.clear()
+
+
+def _is_timeout(e: BaseException) -> bool:
+    """Timeout của SDK (httpx) hoặc của chốt chặn (future / asyncio)."""
+    if isinstance(e, (FuturesTimeout, asyncio.TimeoutError)):
+        return True
     try:
-        from google import genai
-        from google.genai import types
+        import httpx
     except ImportError:
-        return "Lỗi Server: Chưa cài thư viện google-genai."
+        return False
+    return isinstance(e, httpx.TimeoutException)
 
+
+def _generate(client, **kwargs):
+    fut = _executor.submit(client.models.generate_content, **kwargs)
     try:
-        client = genai.Client(api_key=GEMINI_API_KEY)
-        
-        # 1. Chuẩn bị dữ liệu
+        return fut.result(timeout=GEMINI_TIMEOUT + _BACKSTOP_SECONDS)
+    except Exception as e:
+        if _is_timeout(e):
+            raise FuturesTimeout() from e
+        raise
+
+
+def _chat_context(start: str, end: str, product: str):
+    def _build():
         summary = build_summary(start, end, product)
         # Lấy 150 dòng để AI có cái nhìn tổng quan
         csv_data = db_get_csv_data(start, end, product, limit=150)
-        
         if not csv_data.strip():
             csv_data = "(Chưa có dữ liệu)"
+        return summary, csv_data
 
-        # 2. Tools (Dùng cho câu hỏi phân tích)
-        def run_tool(name: str, args: Dict[str, Any]) -> Dict[str, Any]:
-            print(f"--- [AI Tool] {name} {args}")
-            s = args.get("start_date") or start
-            e = args.get("end_date") or end
-            p = args.get("product") or product
-            
-            if name == "analyze_trend": 
-                return {"data": db_stats_by_day(s, e, p)}
-            if name == "compare_products": 
-                return {"data": db_compare_products(s, e, args.get("product_a"), args.get("product_b"))}
-            return {"error": "Unknown tool"}
-
-        tools = [
-            types.Tool(function_declarations=[
-                types.FunctionDeclaration(name="analyze_trend", description="Xem xu hướng", parameters={"type": "object", "properties": {"start_date": {"type": "string"}, "end_date": {"type": "string"}, "product": {"type": "string"}}}),
-                types.FunctionDeclaration(name="compare_products", description="So sánh", parameters={"type": "object", "properties": {"start_date": {"type": "string"}, "end_date": {"type": "string"}, "product_a": {"type": "string"}, "product_b": {"type": "string"}}, "required": ["product_a", "product_b"]}),
-            ])
-        ]
-
-        # 3. Prompt Engineering
-        # Cung cấp thời gian thực để AI tính ngày "Hôm nay" chính xác
-        current_time_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        full_prompt = (
-            f"{SYSTEM_PROMPT}\n"
-            f"THỜI GIAN HIỆN TẠI: {current_time_str}\n"
-            f"--- CSV SNIPPET ---\n{csv_data}\n"
-            f"--- JSON SUMMARY ---\n{json.dumps(summary, ensure_ascii=False)}\n\n"
-            f"USER: \"{question}\"\n"
-            f"AI:"
-        )
-
-        contents = [types.Content(role="user", parts=[types.Part(text=full_prompt)])]
-
-        # 4. Gọi Model
-        # Temperature 0.3: Đủ thấp để tạo link chính xác, đủ cao để phân tích mượt mà
-        resp = client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=contents,
-            config=types.GenerateContentConfig(tools=tools, temperature=0.3)
-        )
-
-        if not resp.candidates: return "Hệ thống bận."
-        cand = resp.candidates[0]
-        
-        # Xử lý Tool Call (nếu có)
-        tool_calls = [p.function_call for p in cand.content.parts if p.function_call] if cand.content.parts else []
-
-        if not tool_calls:
-            return (cand.content.parts[0].text if cand.content.parts else "...")
-
-        tool_parts = []
-        for call in tool_calls:
-            res = run_tool(call.name, dict(call.args or {}))
-            tool_parts.append(types.Part(function_response=types.FunctionResponse(name=call.name, response=res)))
-        
-        contents.append(cand.content)
-        contents.append(types.Content(role="tool", parts=tool_parts))
-        
-        # Gọi lại lần 2 sau khi có kết quả tool
-        resp2 = client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=contents,
-            config=types.GenerateContentConfig(temperature=0.3)
-        )
-        
-        if resp2.candidates and resp2.candidates[0].content.parts:
-            return resp2.candidates[0].content.parts[0].text
-            
-        return "Đang xử lý..."
+    return query_cache.get_or_compute(("chat_context", start, end, product), _build)
 
+
+def _memo_key(question: str, start: str, end: str, product: str):
+    return ((question or "").strip(), start, end, product, datetime.now().strftime("%Y-%m-%d"))
+
+
+def ask_gemini(question: str, start: str, end: str, product: str) -> str:
+    if not USE_GEMINI or not GEMINI_API_KEY:
+        return _fallback_rule_answer(question, start, end, product)
+
+    try:
+        client, types = _get_genai()
+    except ImportError:
+        return "Lỗi Server: Chưa cài thư viện google-genai."
+
+    key = _memo_key(question, start, end, product)
+    try:
+        return _answer_cache.get_or_compute(key, lambda: _ask_model(client, types, question, start, end, product))
+    except FuturesTimeout:
+        print(f"[GEMINI] Timeout {GEMINI_TIMEOUT}s -> fallback")
+        return _fallback_rule_answer(question, start, end, product)
+    except _NoAnswer as e:
+        return e.text
     except Exception as e:
         traceback.print_exc()
-        return f"Lỗi AI: {str(e)}"
\ No newline at end of file
+        return f"Lỗi AI: {str(e)}"
+
+
+def _run_tool(name: str, args: Dict[str, Any], start: str, end: str, product: str) -> Dict[str, Any]:
+    print(f"--- [AI Tool] {name} {args}")
+    s = args.get("start_date") or start
+    e = args.get("end_date") or end
+
+    if name == "analyze_trend":
+        return {"data": db_stats_by_day(s, e, args.get("product") or product)}
+    if name == "compare_products":
+        names = list(args.get("products") or [])
+        names += [args[k] for k in ("product_a", "product_b") if args.get(k)]
+        return {"data": db_compare_products(s, e, *names)}
+    return {"error": "Unknown tool"}
+
+
+def _run_tools(calls, start: str, end: str, product: str) -> List[Dict[str, Any]]:
+    """Chạy các tool call của cùng một lượt song song (mỗi tool là truy vấn DB độc lập)."""
+    jobs = [(c.name, dict(c.args or {})) for c in calls]
+    if len(jobs) == 1:
+        return [_run_tool(jobs[0][0], jobs[0][1], start, end, product)]
+    futs = [_tool_executor.submit(_run_tool, n, a, start, end, product) for n, a in jobs]
+    return [f.result() for f in futs]
+
+
+def _tool_decls(types):
+    return [
+        types.Tool(function_declarations=[
+            types.FunctionDeclaration(name="analyze_trend", description="Xem xu hướng", parameters={"type": "object", "properties": {"start_date": {"type": "string"}, "end_date": {"type": "string"}, "product": {"type": "string"}}}),
+            types.FunctionDeclaration(name="compare_products", description="So sánh số lượng giữa các sản phẩm", parameters={"type": "object", "properties": {"start_date": {"type": "string"}, "end_date": {"type": "string"}, "products": {"type": "array", "items": {"type": "string"}}, "product_a": {"type": "string"}, "product_b": {"type": "string"}}}),
+        ])
+    ]
+
+
+def _user_prompt(question: str, start: str, end: str, product: str) -> str:
+    # Chuẩn bị dữ liệu (cache theo bộ lọc + high-water id)
+    summary, csv_data = _chat_context(start, end, product)
+
+    # SYSTEM_PROMPT đi qua system_instruction; phần user chỉ còn thời gian + dữ liệu + câu hỏi
+    current_time_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return (
+        f"THỜI GIAN HIỆN TẠI: {current_time_str}\n"
+        f"--- CSV SNIPPET ---\n{csv_data}\n"
+        f"--- JSON SUMMARY ---\n{json.dumps(summary, ensure_ascii=False)}\n\n"
+        f"USER: \"{question}\"\n"
+        f"AI:"
+    )
+
+
+def _tool_turn(types, contents, model_parts, start: str, end: str, product: str):
+    """Thêm lượt gọi tool của model và kết quả tool vào hội thoại."""
+    calls = [p.function_call for p in model_parts if p.function_call]
+    results = _run_tools(calls, start, end, product)
+    contents.append(types.Content(role="model", parts=list(model_parts)))
+    contents.append(types.Content(role="tool", parts=[
+        types.Part(function_response=types.FunctionResponse(name=c.name, response=r))
+        for c, r in zip(calls, results)
+    ]))
+
+
+def _ask_model(client, types, question: str, start: str, end: str, product: str) -> str:
+    contents = [types.Content(role="user", parts=[types.Part(text=_user_prompt(question, start, end, product))])]
+
+    # Temperature 0.3: Đủ thấp để tạo link chính xác, đủ cao để phân tích mượt mà
+    resp = _generate(
+        client,
+        model=GEMINI_MODEL,
+        contents=contents,
+        config=types.GenerateContentConfig(system_instruction=SYSTEM_PROMPT, tools=_tool_decls(types), temperature=0.3)
+    )
+
+    # Xử lý Tool Call (nếu có)
+    parts = _first_parts(resp)
+    if not any(p.function_call for p in parts):
+        return parts[0].text
+
+    _tool_turn(types, contents, parts, start, end, product)
+
+    # Gọi lại lần 2 sau khi có kết quả tool
+    resp2 = _generate(
+        client,
+        model=GEMINI_MODEL,
+        contents=contents,
+        config=types.GenerateContentConfig(system_instruction=SYSTEM_PROMPT, temperature=0.3)
+    )
+
+    return _final_text(resp2)
+
+
+def _first_parts(resp) -> list:
+    if not resp.candidates:
+        raise _NoAnswer("Hệ thống bận.")
+    parts = resp.candidates[0].content.parts or []
+    if not parts:
+        raise _NoAnswer("...")
+    return parts
+
+
+def _final_text(resp) -> str:
+    if resp.candidates and resp.candidates[0].content.parts:
+        return resp.candidates[0].content.parts[0].text
+    raise _NoAnswer("Đang xử lý...")
+
+
+# --- STREAMING ---
+
+_END = object()
+
+
+def _stream(client, **kwargs) -> Iterator[Any]:
+    """Đọc generate_content_stream trên luồng riêng; mỗi chunk chờ tối đa GEMINI_TIMEOUT."""
+    q: "queue.Queue" = queue.Queue()
+    stop = threading.Event()
+
+    def pump():
+        try:
+            for chunk in client.models.generate_content_stream(**kwargs):
+                if stop.is_set():
+                    break
+                q.put(chunk)
+            q.put(_END)
+        except BaseException as e:
+            q.put(e)
+
+    _executor.submit(pump)
+    try:
+        while True:
+            try:
+                item = q.get(timeout=GEMINI_TIMEOUT + _BACKSTOP_SECONDS)
+            except queue.Empty:
+                raise FuturesTimeout()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                if _is_timeout(item):
+                    raise FuturesTimeout() from item
+                raise item
+            yield item
+    finally:
+        # client ngắt kết nối / timeout -> luồng pump dừng ở chunk kế tiếp
+        stop.set()
+
+
+def _chunk_parts(chunk) -> list:
+    if not chunk.candidates or not chunk.candidates[0].content:
+        return []
+    return chunk.candidates[0].content.parts or []
+
+
+def _stream_model(client, types, question: str, start: str, end: str, product: str) -> Iterator[str]:
+    contents = [types.Content(role="user", parts=[types.Part(text=_user_prompt(question, start, end, product))])]
+    config = types.GenerateContentConfig(system_instruction=SYSTEM_PROMPT, tools=_tool_decls(types), temperature=0.3)
+
+    call_parts = []
+    for chunk in _stream(client, model=GEMINI_MODEL, contents=contents, config=config):
+        for part in _chunk_parts(chunk):
+            if part.function_call:
+                call_parts.append(part)
+            elif part.text:
+                yield part.text
+    if not call_parts:
+        return
+
+    _tool_turn(types, contents, call_parts, start, end, product)
+
+    config = types.GenerateContentConfig(system_instruction=SYSTEM_PROMPT, temperature=0.3)
+    for chunk in _stream(client, model=GEMINI_MODEL, contents=contents, config=config):
+        for part in _chunk_parts(chunk):
+            if part.text:
+                yield part.text
+
+
+def stream_gemini(question: str, start: str, end: str, product: str) -> Iterator[Tuple[str, str]]:
+    """Như ask_gemini nhưng trả từng đoạn câu trả lời ngay khi model sinh ra.
+
+    Sinh ra các cặp ("token", đoạn chữ), kết thúc bằng ("done", toàn bộ câu trả lời)
+    hoặc ("error", thông báo) nếu lỗi giữa chừng.
+    """
+    if not USE_GEMINI or not GEMINI_API_KEY:
+        answer = _fallback_rule_answer(question, start, end, product)
+        yield "token", answer
+        yield "done", answer
+        return
+
+    try:
+        client, types = _get_genai()
+    except ImportError:
+        yield "error", "Lỗi Server: Chưa cài thư viện google-genai."
+        return
+
+    key = _memo_key(question, start, end, product)
+    version = db_high_water()
+    cached = _answer_cache.get(key)
+    if cached is not None:
+        yield "token", cached
+        yield "done", cached
+        return
+
+    pieces: List[str] = []
+    try:
+        for text in _stream_model(client, types, question, start, end, product):
+            pieces.append(text)
+            yield "token", text
+    except FuturesTimeout:
+        print(f"[GEMINI] Timeout {GEMINI_TIMEOUT}s (stream)")
+        if pieces:
+            yield "error", "Lỗi AI: quá thời gian chờ."
+            return
+        answer = _fallback_rule_answer(question, start, end, product)
+        yield "token", answer
+        yield "done", answer
+        return
+    except Exception as e:
+        traceback.print_exc()
+        yield "error", f"Lỗi AI: {str(e)}"
+        return
+
+    answer = "".join(pieces)
+    if not answer:
+        yield "token", "Hệ thống bận."
+        yield "done", "Hệ thống bận."
+        return
+    _answer_cache.put(key, answer, version)
+    yield "done", answer
+
+
+# --- ASYNC (server asyncio, xem app/aserver.py) ---
+# Dùng client.aio của google-genai: lúc chờ model không giữ luồng nào. Phần đọc DB (ngữ cảnh,
+# tool) ngắn nên chạy qua asyncio.to_thread. Client không có .aio (vd. stub) -> chạy bản đồng bộ.
+
+def _has_aio(client) -> bool:
+    return getattr(client, "aio", None) is not None
+
+
+async def _agenerate(client, **kwargs):
+    try:
+        return await asyncio.wait_for(client.aio.models.generate_content(**kwargs), GEMINI_TIMEOUT + _BACKSTOP_SECONDS)
+    except Exception as e:
+        if _is_timeout(e):
+            raise FuturesTimeout() from e
+        raise
+
+
+async def _astream(client, **kwargs) -> AsyncIterator[Any]:
+    """Mỗi chunk chờ tối đa GEMINI_TIMEOUT, giống _stream."""
+    wait = GEMINI_TIMEOUT + _BACKSTOP_SECONDS
+    try:
+        it = (await asyncio.wait_for(client.aio.models.generate_content_stream(**kwargs), wait)).__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(it.__anext__(), wait)
+            except StopAsyncIteration:
+                return
+            yield chunk
+    except Exception as e:
+        if _is_timeout(e):
+            raise FuturesTimeout() from e
+        raise
+
+
+async def _aask_model(client, types, question: str, start: str, end: str, product: str) -> str:
+    prompt = await asyncio.to_thread(_user_prompt, question, start, end, product)
+    contents = [types.Content(role="user", parts=[types.Part(text=prompt)])]
+    resp = await _agenerate(
+        client,
+        model=GEMINI_MODEL,
+        contents=contents,
+        config=types.GenerateContentConfig(system_instruction=SYSTEM_PROMPT, tools=_tool_decls(types), temperature=0.3)
+    )
+    parts = _first_parts(resp)
+    if not any(p.function_call for p in parts):
+        return parts[0].text
+
+    await asyncio.to_thread(_tool_turn, types, contents, parts, start, end, product)
+    resp2 = await _agenerate(
+        client,
+        model=GEMINI_MODEL,
+        contents=contents,
+        config=types.GenerateContentConfig(system_instruction=SYSTEM_PROMPT, temperature=0.3)
+    )
+    return _final_text(resp2)
+
+
+async def _astream_model(client, types, question: str, start: str, end: str, product: str) -> AsyncIterator[str]:
+    prompt = await asyncio.to_thread(_user_prompt, question, start, end, product)
+    contents = [types.Content(role="user", parts=[types.Part(text=prompt)])]
+    config = types.GenerateContentConfig(system_instruction=SYSTEM_PROMPT, tools=_tool_decls(types), temperature=0.3)
+
+    call_parts = []
+    async for chunk in _astream(client, model=GEMINI_MODEL, contents=contents, config=config):
+        for part in _chunk_parts(chunk):
+            if part.function_call:
+                call_parts.append(part)
+            elif part.text:
+                yield part.text
+    if not call_parts:
+        return
+
+    await asyncio.to_thread(_tool_turn, types, contents, call_parts, start, end, product)
+
+    config = types.GenerateContentConfig(system_instruction=SYSTEM_PROMPT, temperature=0.3)
+    async for chunk in _astream(client, model=GEMINI_MODEL, contents=contents, config=config):
+        for part in _chunk_parts(chunk):
+            if part.text:
+                yield part.text
+
+
+def _async_client():
+    """(client, types) nếu dùng được client.aio; None -> đi đường đồng bộ."""
+    if not USE_GEMINI or not GEMINI_API_KEY:
+        return None
+    try:
+        client, types = _get_genai()
+    except ImportError:
+        return None
+    return (client, types) if _has_aio(client) else None
+
+
+async def aask_gemini(question: str, start: str, end: str, product: str) -> str:
+    """Bản asyncio của ask_gemini (cùng memo, timeout và luật dự phòng)."""
+    ct = _async_client()
+    if ct is None:
+        return await asyncio.to_thread(ask_gemini, question, start, end, product)
+    client, types = ct
+
+    key = _memo_key(question, start, end, product)
+    version = db_high_water()
+    cached = _answer_cache.get(key)
+    if cached is not None:
+        return cached
+    try:
+        answer = await _aask_model(client, types, question, start, end, product)
+    except (asyncio.TimeoutError, FuturesTimeout):
+        print(f"[GEMINI] Timeout {GEMINI_TIMEOUT}s -> fallback")
+        return await asyncio.to_thread(_fallback_rule_answer, question, start, end, product)
+    except _NoAnswer as e:
+        return e.text
+    except Exception as e:
+        traceback.print_exc()
+        return f"Lỗi AI: {str(e)}"
+    _answer_cache.put(key, answer, version)
+    return answer
+
+
+async def _aiter_sync(gen: Iterator[Any]) -> AsyncIterator[Any]:
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            item = await loop.run_in_executor(None, next, gen, _END)
+            if item is _END:
+                return
+            yield item
+    finally:
+        gen.close()
+
+
+async def astream_gemini(question: str, start: str, end: str, product: str) -> AsyncIterator[Tuple[str, str]]:
+    """Bản asyncio của stream_gemini: cùng các cặp ("token" | "done" | "error", chữ)."""
+    ct = _async_client()
+    if ct is None:
+        async for item in _aiter_sync(stream_gemini(question, start, end, product)):
+            yield item
+        return
+    client, types = ct
+
+    key = _memo_key(question, start, end, product)
+    version = db_high_water()
+    cached = _answer_cache.get(key)
+    if cached is not None:
+        yield "token", cached
+        yield "done", cached
+        return
+
+    pieces: List[str] = []
+    try:
+        async for text in _astream_model(client, types, question, start, end, product):
+            pieces.append(text)
+            yield "token", text
+    except (asyncio.TimeoutError, FuturesTimeout):
+        print(f"[GEMINI] Timeout {GEMINI_TIMEOUT}s (stream)")
+        if pieces:
+            yield "error", "Lỗi AI: quá thời gian chờ."
+            return
+        answer = await asyncio.to_thread(_fallback_rule_answer, question, start, end, product)
+        yield "token", answer
+        yield "done", answer
+        return
+    except Exception as e:
+        traceback.print_exc()
+        yield "error", f"Lỗi AI: {str(e)}"
+        return
+
+    answer = "".join(pieces)
+    if not answer:
+        yield "token", "Hệ thống bận."
+        yield "done", "Hệ thống bận."
+        return
+    _answer_cache.put(key, answer, version)
+    yield "done", answer
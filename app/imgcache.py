@@ -0,0 +1,146 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+
+from .config import ANNOTATED_CACHE_DIR, ANNOTATED_CACHE_MB, THUMB_CACHE_DIR, THUMB_CACHE_MB, THUMB_QUALITY
+
+
+class DiskLRU:
+    """Cache file ảnh dẫn xuất trên đĩa, giới hạn theo tổng dung lượng, bỏ file ít dùng nhất trước.
+
+    File nằm trong thư mục con theo 2 ký tự đầu của sha1(key) để một thư mục
+    không phải chứa hàng chục nghìn file. Thứ tự LRU lúc khởi động lấy theo mtime;
+    mỗi lần dùng lại file thì mtime được cập nhật.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path_for(self, key: str) -> str:
+        h = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, h[:2], h + os.path.splitext(key)[1])
+
+    def _load(self):
+        files = []
+        for dirpath, _, names in os.walk(self.root):
+            for n in names:
+                if n.endswith(".tmp"):
+                    continue
+                p = os.path.join(dirpath, n)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, p, st.st_size))
+        files.sort()
+        for _, p, size in files:
+            self._index[p] = size
+            self._total += size
+        self._loaded = True
+
+    def get(self, key: str) -> Optional[str]:
+        """Đường dẫn file đã cache, hoặc None."""
+        path = self.path_for(key)
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if path in self._index:
+                self._index.move_to_end(path)
+                self.hits += 1
+            elif os.path.exists(path):
+                # process khác vừa tạo
+                size = os.path.getsize(path)
+                self._index[path] = size
+                self._total += size
+                self.hits += 1
+            else:
+                self.misses += 1
+                return None
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key: str, data: bytes) -> str:
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self._total += len(data) - self._index.pop(path, 0)
+            self._index[path] = len(data)
+            while self._total > self.max_bytes and len(self._index) > 1:
+                old, size = self._index.popitem(last=False)
+                self._total -= size
+                self.evictions += 1
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+        return path
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "files": len(self._index),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# giải mã JPEG ở 1/8, 1/4, 1/2 độ phân giải rẻ hơn nhiều so với giải mã đầy đủ rồi resize
+_REDUCED = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def make_thumbnail(raw: bytes, size: int, fmt: str = "jpg") -> Optional[bytes]:
+    """Ảnh thu nhỏ (cạnh dài <= size, không phóng to) mã hoá "webp" hoặc "jpg"; None nếu không giải mã được."""
+    data = np.frombuffer(raw, dtype=np.uint8)
+    img = None
+    # chỉ JPEG mới giải mã thu nhỏ thật sự (PNG/BMP vẫn giải mã đầy đủ rồi mới resize)
+    probe = cv2.imdecode(data, cv2.IMREAD_REDUCED_GRAYSCALE_8) if data[:2].tobytes() == b"\xff\xd8" else None
+    if probe is not None:
+        long_edge = max(probe.shape[:2]) * 8
+        for factor, flag in _REDUCED:
+            if long_edge // factor >= size:
+                img = cv2.imdecode(data, flag)
+                break
+    if img is None:
+        img = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+
+    h, w = img.shape[:2]
+    scale = size / max(h, w)
+    if scale < 1:
+        img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    if fmt == "webp":
+        ok, buf = cv2.imencode(".webp", img, [cv2.IMWRITE_WEBP_QUALITY, THUMB_QUALITY])
+    else:
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, THUMB_QUALITY])
+    return buf.tobytes() if ok else None
+
+
+annotated_cache = DiskLRU(ANNOTATED_CACHE_DIR, ANNOTATED_CACHE_MB * 1024 * 1024)
+thumb_cache = DiskLRU(THUMB_CACHE_DIR, THUMB_CACHE_MB * 1024 * 1024)
@@ -0,0 +1,202 @@
+import os
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import queue
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from .config import EXTS, MEM_QUEUE_SIZE
+
+# Hằng số inotify (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+_EVENT_HDR = struct.Struct("iIII")
+
+# Tiền tố/hậu tố file tạm khi upload; worker bỏ qua vì đuôi không nằm trong EXTS
+TMP_PREFIX = "."
+TMP_SUFFIX = ".part"
+
+
+def tmp_name_for(filename: str) -> str:
+    return f"{TMP_PREFIX}{filename}{TMP_SUFFIX}"
+
+
+# Hàng đợi (filename, bytes) cho chế độ INMEMORY_INGEST
+mem_queue: "queue.Queue[Tuple[str, bytes]]" = queue.Queue(maxsize=MEM_QUEUE_SIZE)
+# process web tách khỏi worker (serve.py) không có ai lấy hàng đợi RAM -> tắt, upload ghi xuống đĩa
+_mem_enabled = True
+
+# Ảnh raw mới nhất giữ trong RAM thay cho việc copy ra LAST_RAW
+_last_frame: Optional[Tuple[str, bytes]] = None
+
+
+def submit_bytes(filename: str, data: bytes) -> bool:
+    """Đưa ảnh upload vào hàng đợi RAM. Trả về False nếu hàng đợi đầy (hoặc đã tắt)."""
+    if not _mem_enabled:
+        return False
+    try:
+        mem_queue.put_nowait((filename, data))
+        return True
+    except queue.Full:
+        return False
+
+
+def disable_memory_ingest():
+    global _mem_enabled
+    _mem_enabled = False
+
+
+def set_last_frame(filename: str, data: Optional[bytes]):
+    global _last_frame
+    _last_frame = (filename, data) if data is not None else None
+
+
+def get_last_frame() -> Optional[Tuple[str, bytes]]:
+    return _last_frame
+
+
+def _is_image(name: str) -> bool:
+    if name.startswith(TMP_PREFIX):
+        return False
+    return os.path.splitext(name)[1].lower() in EXTS
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+        return libc
+    except Exception:
+        return None
+
+
+def inotify_available() -> bool:
+    return _load_libc() is not None
+
+
+class IngestWatcher:
+    """Theo dõi INPUT_DIR bằng inotify, giữ hàng đợi file đã ghi xong theo thứ tự đến.
+
+    File được coi là "upload xong" khi nhận IN_CLOSE_WRITE (ghi trực tiếp) hoặc
+    IN_MOVED_TO (upload ghi ra file tạm rồi rename), nên không cần ngủ chờ ổn định.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._fd = -1
+        self._stop = False
+        self._thread = None
+
+    def start(self):
+        libc = _load_libc()
+        if libc is None:
+            raise RuntimeError("inotify not available")
+
+        fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = libc.inotify_add_watch(fd, os.fsencode(self.folder), IN_CLOSE_WRITE | IN_MOVED_TO)
+        if wd < 0:
+            err = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(err, f"inotify_add_watch failed: {self.folder}")
+        self._fd = fd
+
+        # file có sẵn từ trước khi khởi động
+        self.rescan()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop = True
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        if self._fd >= 0:
+            try:
+                os.close(self._fd)
+            except Exception:
+                pass
+            self._fd = -1
+
+    def rescan(self):
+        """Liệt kê lại thư mục (lúc khởi động hoặc khi inotify bị tràn hàng đợi)."""
+        try:
+            entries = [e for e in os.scandir(self.folder) if e.is_file() and _is_image(e.name)]
+        except Exception:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for e in entries:
+            self._push(e.path)
+
+    def _push(self, path: str):
+        with self._cond:
+            if path not in self._pending:
+                self._pending[path] = None
+                self._cond.notify()
+
+    def _run(self):
+        while not self._stop:
+            try:
+                r, _, _ = select.select([self._fd], [], [], 1.0)
+                if not r:
+                    continue
+                buf = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except Exception as e:
+                if self._stop:
+                    break
+                print(f"[INGEST] inotify read error: {e}")
+                time.sleep(1.0)
+                continue
+
+            off = 0
+            while off + _EVENT_HDR.size <= len(buf):
+                _wd, mask, _cookie, nlen = _EVENT_HDR.unpack_from(buf, off)
+                off += _EVENT_HDR.size
+                name = buf[off:off + nlen].split(b"\0", 1)[0].decode("utf-8", "replace")
+                off += nlen
+
+                if mask & IN_Q_OVERFLOW:
+                    print("[INGEST] inotify overflow -> rescan")
+                    self.rescan()
+                    continue
+                if mask & IN_IGNORED:
+                    continue
+                if name and _is_image(name):
+                    self._push(os.path.join(self.folder, name))
+
+    def qsize(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def get_many(self, n: int, max_wait: float, timeout: float) -> List[str]:
+        """Lấy tối đa n file. Chờ tối đa `timeout` cho file đầu tiên, rồi `max_wait` để gom đủ lô."""
+        out: List[str] = []
+        with self._cond:
+            if not self._pending:
+                self._cond.wait(timeout)
+            deadline = time.time() + max_wait
+            while self._pending and len(self._pending) < n and not self._stop:
+                left = deadline - time.time()
+                if left <= 0:
+                    break
+                self._cond.wait(left)
+            while self._pending and len(out) < n:
+                path, _ = self._pending.popitem(last=False)
+                out.append(path)
+        return [p for p in out if os.path.exists(p)]
@@ -0,0 +1,284 @@
+"""Hàng đợi job bền (bảng `jobs` trong SQLite) cho ảnh nằm trong INPUT_DIR.
+
+Mỗi ảnh trên đĩa là một job: pending -> claimed (có lease) -> done. Lỗi suy luận/lưu
+không xoá ảnh nữa mà hẹn thử lại với backoff mũ; hết JOB_MAX_ATTEMPTS thì job sang
+failed (view `dead_jobs`) và ảnh được chuyển vào JOB_DEAD_DIR. Job done được ghi cùng
+transaction với bản ghi trong `records`, nên sau crash chỉ cần đối soát (reconcile) lúc
+khởi động: job đang claimed -> pending lại (dọn ảnh output mồ côi của nó), ảnh đã có bản
+ghi nhưng chưa kịp xoá -> xoá, ảnh chưa có job -> tạo job.
+
+Worker vẫn làm việc theo đường dẫn file; module này giữ map path -> job đang xử lý
+trong process để các bước cũ (finish_item, nhánh lỗi) tìm ra job của mình.
+"""
+import os
+import time
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from .config import (
+    INPUT_DIR, OUTPUT_DIR, EXTS, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_RETRY_BASE, JOB_RETRY_MAX,
+    JOB_DEAD_DIR, JOB_KEEP_HOURS,
+)
+from .db import (
+    db_jobs_enqueue, db_jobs_claim, db_job_done, db_job_fail, db_job_requeue, db_jobs_release,
+    db_jobs_prune, db_jobs_in_state, db_job_latest, db_job_get, db_image_paths_on,
+)
+from .storage import shard_for
+
+# path -> (job id, số lần thử) của các job process này đang giữ
+_claimed: Dict[str, Tuple[int, int]] = {}
+# path có job pending/claimed (để bỏ qua khi quét thư mục), chỉ là gợi ý: DB mới là nguồn đúng
+_queued = set()
+_lock = threading.Lock()
+_last_prune = 0.0
+
+
+def enqueue(paths: List[str]) -> List[int]:
+    """Tạo job cho các ảnh, trả về id theo thứ tự các ảnh được nhận.
+
+    Bỏ file đã có job chờ trong process này và file không còn (sự kiện inotify đến muộn
+    sau khi ảnh đã xử lý xong).
+    """
+    with _lock:
+        paths = [p for p in paths if p not in _queued]
+    paths = [p for p in paths if os.path.exists(p)]
+    ids = db_jobs_enqueue(paths)
+    with _lock:
+        _queued.update(paths)
+    return ids
+
+
+def enqueue_uploads(paths: List[str]) -> List[Optional[int]]:
+    """Job cho ảnh vừa upload, id theo đúng thứ tự `paths` (một transaction cho cả lô).
+
+    Khác enqueue: ảnh mà watcher đã kịp tạo job vẫn nhận id của job đó; ảnh đã xử lý
+    xong và bị xoá trong lúc đó nhận id job gần nhất của nó. Không đụng tới _queued:
+    đó là gợi ý cho lần quét của worker, process web (serve.py) không bao giờ dọn nó.
+    """
+    live = [p for p in paths if os.path.exists(p)]
+    ids = dict(zip(live, db_jobs_enqueue(live)))
+    out = []
+    for p in paths:
+        if p not in ids:
+            last = db_job_latest(p)
+            ids[p] = last["id"] if last else None
+        out.append(ids[p])
+    return out
+
+
+def queued_paths() -> set:
+    with _lock:
+        return set(_queued)
+
+
+def claim(n: int) -> List[str]:
+    """Nhận tối đa n job đến hạn, trả về đường dẫn ảnh. Job mà file đã mất thì đóng luôn."""
+    out = []
+    with _lock:
+        # lease hết hạn nhưng process này vẫn đang xử lý file: job của nó chờ tới khi xử lý xong
+        held = list(_claimed)
+    for job_id, path, attempts in db_jobs_claim(n, JOB_LEASE_SECONDS, exclude=held):
+        with _lock:
+            _claimed[path] = (job_id, attempts)
+            _queued.add(path)
+        if not os.path.exists(path):
+            _finish(path)
+            _close_missing(job_id, path)
+            continue
+        out.append(path)
+    return out
+
+
+def _close_missing(job_id: int, path: str):
+    # không còn gì để thử lại -> done kèm lỗi, không đưa vào dead-letter
+    db_job_done(job_id, error="input missing")
+    print(f"[JOBS] #{job_id} input missing: {path}")
+
+
+def job_id_for(path: str) -> Optional[int]:
+    with _lock:
+        held = _claimed.get(path)
+    return held[0] if held else None
+
+
+def _finish(path: str) -> Optional[Tuple[int, int]]:
+    with _lock:
+        _queued.discard(path)
+        return _claimed.pop(path, None)
+
+
+def done(path: str):
+    """Job của `path` đã xong (db_insert đã đánh dấu done nếu có bản ghi)."""
+    _finish(path)
+
+
+def skipped(path: str):
+    """Frame bị bỏ qua (không ghi bản ghi): job done không có record_id."""
+    held = _finish(path)
+    if held is not None:
+        db_job_done(held[0])
+
+
+def fail(path: str, error: str) -> bool:
+    """Ghi lỗi cho job của `path`: hẹn thử lại, hoặc dead-letter nếu hết lượt.
+
+    Trả về False nếu `path` không thuộc job nào (bên gọi tự xử lý như cũ).
+    """
+    held = _finish(path)
+    if held is None:
+        return False
+    job_id, attempts = held
+    if attempts < JOB_MAX_ATTEMPTS:
+        delay = min(JOB_RETRY_MAX, JOB_RETRY_BASE * 2 ** (attempts - 1))
+        db_job_fail(job_id, error, retry_at=time.time() + delay)
+        with _lock:
+            _queued.add(path)
+        print(f"[JOBS] #{job_id} attempt {attempts}/{JOB_MAX_ATTEMPTS} failed ({error}) -> retry in {delay:g}s")
+        return True
+    dead = _move_dead(path)
+    db_job_fail(job_id, error, path=dead)
+    print(f"[JOBS] #{job_id} failed {attempts}x ({error}) -> dead-letter {dead}")
+    return True
+
+
+def _unique_path(folder: str, name: str) -> str:
+    path = os.path.join(folder, name)
+    if not os.path.exists(path):
+        return path
+    base, ext = os.path.splitext(name)
+    return os.path.join(folder, f"{base}_{int(time.time() * 1000)}{ext}")
+
+
+def _move_dead(path: str) -> str:
+    try:
+        os.makedirs(JOB_DEAD_DIR, exist_ok=True)
+        dest = _unique_path(JOB_DEAD_DIR, os.path.basename(path))
+        os.replace(path, dest)
+        return dest
+    except OSError as e:
+        print(f"[JOBS] Move to dead-letter failed: {e}")
+        return path
+
+
+def retry_dead(job_id: int) -> Optional[str]:
+    """Đưa job dead-letter về hàng đợi: chuyển ảnh lại INPUT_DIR, đếm lại lượt thử."""
+    job = db_job_get(job_id)
+    if job is None or job["state"] != "failed":
+        return None
+    src = job["path"]
+    dest = src
+    if os.path.dirname(os.path.abspath(src)) != os.path.abspath(INPUT_DIR):
+        dest = _unique_path(INPUT_DIR, os.path.basename(src))
+    # đánh dấu trước khi chuyển file để watcher/quét thư mục không tạo job thứ hai
+    with _lock:
+        _queued.add(dest)
+    try:
+        if dest != src:
+            os.replace(src, dest)
+        if db_job_requeue(job_id, dest):
+            return dest
+    except OSError as e:
+        print(f"[JOBS] Requeue #{job_id} failed: {e}")
+    with _lock:
+        _queued.discard(dest)
+    return None
+
+
+def maintain():
+    """Xoá job done quá JOB_KEEP_HOURS; gọi lúc rảnh, tự giới hạn mỗi giờ một lần."""
+    global _last_prune
+    now = time.time()
+    if now - _last_prune < 3600:
+        return
+    _last_prune = now
+    n = db_jobs_prune(now - JOB_KEEP_HOURS * 3600)
+    if n:
+        print(f"[JOBS] Pruned {n} done jobs")
+
+
+def _timestamp_of(path: str) -> Optional[str]:
+    from .worker import timestamp_from_filename
+    return timestamp_from_filename(path)
+
+
+def _remove_orphans(job: Dict) -> int:
+    """Ảnh output của job bị ngắt giữa chừng (đã lưu nhưng chưa có bản ghi) -> xoá.
+
+    Tên output là <giờ xử lý>_<sản phẩm>_<tên gốc> trong shard ngày của timestamp bản ghi
+    (từ tên file, hoặc giờ xử lý nếu tên file không có timestamp).
+    """
+    base = os.path.basename(job["path"])
+    days = {shard_for(_timestamp_of(job["path"]) or ""),
+            datetime.fromtimestamp(job["updated"]).strftime("%Y/%m/%d")}
+    removed = 0
+    for day in days:
+        folder = os.path.join(OUTPUT_DIR, *day.split("/"))
+        try:
+            names = [n for n in os.listdir(folder) if n.endswith("_" + base)]
+        except OSError:
+            continue
+        if not names:
+            continue
+        known = db_image_paths_on(day.replace("/", "-"))
+        for n in names:
+            if f"{day}/{n}" in known:
+                continue
+            try:
+                os.remove(os.path.join(folder, n))
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def reconcile() -> Dict[str, int]:
+    """Đối soát INPUT_DIR, OUTPUT_DIR và records với bảng jobs sau khi process trước dừng/crash."""
+    stats = {"requeued": 0, "orphans": 0, "cleaned": 0, "enqueued": 0, "missing": 0}
+
+    # 1) job đang claimed lúc process trước dừng: dọn output mồ côi, trả về pending
+    inflight = db_jobs_in_state("claimed")
+    for job in inflight:
+        stats["orphans"] += _remove_orphans(job)
+    stats["requeued"] = db_jobs_release([j["id"] for j in inflight])
+
+    # 2) job chờ mà ảnh đã mất -> đóng
+    active = set()
+    for job in db_jobs_in_state("pending", "claimed"):
+        if os.path.exists(job["path"]):
+            active.add(job["path"])
+            continue
+        _close_missing(job["id"], job["path"])
+        stats["missing"] += 1
+
+    # 3) ảnh trong INPUT_DIR chưa có job chờ
+    new = []
+    try:
+        entries = [e for e in os.scandir(INPUT_DIR) if e.is_file() and not e.name.startswith(".")
+                   and os.path.splitext(e.name)[1].lower() in EXTS]
+    except OSError:
+        entries = []
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    for e in entries:
+        if e.path in active:
+            continue
+        last = db_job_latest(e.path)
+        # đã ghi bản ghi nhưng chưa kịp xoá ảnh vào (file cũ hơn lúc job xong; file
+        # mới hơn là ảnh upload sau trùng tên -> xử lý bình thường)
+        if last is not None and last["state"] == "done" and e.stat().st_mtime <= last["updated"]:
+            try:
+                os.remove(e.path)
+                stats["cleaned"] += 1
+            except OSError:
+                pass
+            continue
+        new.append(e.path)
+    if new:
+        enqueue(new)
+    stats["enqueued"] = len(new)
+    with _lock:
+        _queued.update(active)
+
+    maintain()
+    print("[JOBS] Reconcile: " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+    return stats
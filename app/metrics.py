@@ -0,0 +1,208 @@
+"""Metrics dạng Prometheus (text exposition 0.0.4) cho /metrics, không cần thư viện ngoài.
+
+Counter / Histogram giữ số đếm trong bộ nhớ; ghi một mẫu chỉ tốn một lock + vài phép cộng
+(bench/bench_metrics.py kiểm tra overhead trên đường xử lý frame < 1%). GaugeFunc đọc
+giá trị lúc scrape (độ sâu hàng đợi, số client SSE, cache...). METRICS_ENABLED=0 tắt ghi mẫu.
+"""
+import bisect
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+from .config import METRICS_ENABLED
+
+# giây; đủ rộng cho cả truy vấn DB (ms) lẫn suy luận CPU (trăm ms) và gọi Gemini (giây)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = METRICS_ENABLED
+_registry: List[Any] = []
+_registry_lock = threading.Lock()
+
+
+def set_enabled(on: bool):
+    global _enabled
+    _enabled = on
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _register(metric):
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        _register(self)
+
+    def labels(self, *values: str, **kw: str):
+        """Series con theo nhãn; nên lấy một lần rồi giữ lại trên đường nóng."""
+        key = tuple(str(v) for v in values) or tuple(str(kw[n]) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _series(self) -> Iterable[Tuple[Tuple[str, ...], Any]]:
+        if not self.labelnames:
+            return [((), self._children.get((), None) or self.labels())]
+        return sorted(self._children.items())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._series():
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, n: float = 1.0):
+        if _enabled:
+            with self._lock:
+                self.value += n
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_labels(labelnames, values)} {_fmt(self.value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, n: float = 1.0):
+        self.labels().inc(n)
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # phần tử cuối: > bucket lớn nhất (+Inf)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, v: float):
+        if not _enabled:
+            return
+        i = bisect.bisect_left(self.buckets, v)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += v
+            self.count += 1
+
+    def render(self, name, labelnames, values):
+        with self._lock:
+            counts, total, n = list(self.counts), self.sum, self.count
+        lines = []
+        acc = 0
+        for le, c in zip(self.buckets + (float("inf"),), counts):
+            acc += c
+            le_label = 'le="%s"' % _fmt(le)
+            lines.append(f"{name}_bucket{_labels(labelnames, values, le_label)} {acc}")
+        lines.append(f"{name}_sum{_labels(labelnames, values)} {_fmt(total)}")
+        lines.append(f"{name}_count{_labels(labelnames, values)} {n}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, v: float):
+        self.labels().observe(v)
+
+
+class GaugeFunc:
+    """Gauge đọc lúc scrape. `fn` trả về một số, hoặc list (giá trị nhãn..., số) nếu có labelnames."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Any], labelnames: Sequence[str] = (),
+                 kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+        _register(self)
+
+    def render(self) -> List[str]:
+        try:
+            value = self.fn()
+        except Exception:
+            return []  # nguồn lỗi không được làm hỏng cả trang /metrics
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if not self.labelnames:
+            lines.append(f"{self.name} {_fmt(value)}")
+        else:
+            for *values, v in value:
+                lines.append(f"{self.name}{_labels(self.labelnames, values)} {_fmt(v)}")
+        return lines
+
+
+def render() -> str:
+    with _registry_lock:
+        metrics = list(_registry)
+    lines: List[str] = []
+    for m in metrics:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- metrics dùng chung giữa các module ---
+FRAMES = Counter("vision_frames_total", "Frames handled by the worker, by result "
+                 "(processed = written to DB, incl. dedup reuse)", ["result"])
+INFER_SECONDS = Histogram("vision_inference_seconds", "Model predict() call latency (one call per frame or batch)")
+DECODE_SECONDS = Histogram("vision_decode_seconds", "Image decode latency (imread / imdecode)")
+DB_SECONDS = Histogram("vision_db_seconds", "Latency of app.db calls, by function", ["fn"])
+CHAT_SECONDS = Histogram("vision_chat_seconds", "Chat request latency, by endpoint", ["endpoint"],
+                         buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0))
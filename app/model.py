@@ -1,31 +1,139 @@
+import os
+import json
+import time
+import threading
 import traceback
-from typing import Tuple, Any
+from typing import Tuple, Any, Dict, List, Optional
 import cv2
 
-from .config import MODEL_PATH
+from .config import MODEL_PATH, ONNX_PATH, MODEL_BACKEND, WARMUP_SIZE
+from .backends import Detections, create_backend
+from .metrics import INFER_SECONDS, DECODE_SECONDS
+from . import tracing
 
 _yolo = None
 _yolo_names = None
 _yolo_err = None
 
+# Trạng thái nạp model cho /health: idle -> loading -> warming -> ready | failed
+_status: Dict[str, Any] = {"state": "idle", "load_seconds": None, "warmup_seconds": None, "error": None}
+_ready = threading.Event()
+_done = threading.Event()
+_load_thread: Optional[threading.Thread] = None
+_load_lock = threading.Lock()
+# process web tách khỏi worker (serve.py): trạng thái model đọc từ file heartbeat của process worker
+_status_file: Optional[str] = None
+_HEARTBEAT_SECONDS = 2.0
+
+
+def warmup(model, size: int = WARMUP_SIZE):
+    """Chạy một lần suy luận trên ảnh đen để backend khởi tạo xong trước frame thật."""
+    import numpy as np
+    model.predict([np.zeros((size, size, 3), dtype=np.uint8)])
+
 
 def load_model():
     global _yolo, _yolo_names, _yolo_err
+    _ready.clear()
+    _done.clear()
+    _status.update(state="loading", backend=MODEL_BACKEND, load_seconds=None, warmup_seconds=None, error=None)
     try:
-        from ultralytics import YOLO
-        _yolo = YOLO(MODEL_PATH)
-        _yolo_names = _yolo.names
+        t0 = time.perf_counter()
+        yolo = create_backend()
+        _status.update(state="warming", load_seconds=round(time.perf_counter() - t0, 3))
+        print(f"[YOLO] Loaded ({yolo.name}):", ONNX_PATH if yolo.name == "onnx" else MODEL_PATH,
+              f"({_status['load_seconds']}s)")
+
+        t1 = time.perf_counter()
+        warmup(yolo)
+        _status["warmup_seconds"] = round(time.perf_counter() - t1, 3)
+        print(f"[YOLO] Warmup done ({_status['warmup_seconds']}s)")
+
+        _yolo = yolo
+        _yolo_names = yolo.names
         _yolo_err = None
-        print("[YOLO] Loaded:", MODEL_PATH)
+        _status["state"] = "ready"
+        _ready.set()
     except Exception as e:
         _yolo = None
         _yolo_names = None
         _yolo_err = str(e)
+        _status.update(state="failed", error=str(e))
         print("[YOLO] Load failed:", e)
         print(traceback.format_exc())
+    finally:
+        _done.set()
+
+
+def start_model_loading() -> threading.Thread:
+    """Nạp + warmup model trên luồng nền để app (và /health) lên ngay."""
+    global _load_thread
+    with _load_lock:
+        if _load_thread is None or not _load_thread.is_alive():
+            _status["state"] = "loading"
+            _done.clear()
+            _load_thread = threading.Thread(target=load_model, name="model-load", daemon=True)
+            _load_thread.start()
+        return _load_thread
+
+
+def write_status_file(path: str, stop: threading.Event):
+    """Process worker: ghi model_status() ra `path` mỗi _HEARTBEAT_SECONDS tới khi `stop`."""
+    while True:
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(dict(model_status(), pid=os.getpid(), heartbeat=time.time()), f)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[YOLO] Status file error: {e}")
+        if stop.wait(_HEARTBEAT_SECONDS):
+            return
+
+
+def follow_status_file(path: str):
+    """Process web: model_ready()/model_status() đọc từ file của process worker."""
+    global _status_file
+    _status_file = path
+
+
+def _remote_status() -> Dict[str, Any]:
+    try:
+        with open(_status_file, encoding="utf-8") as f:
+            st = json.load(f)
+    except (OSError, ValueError):
+        return {"state": "unknown", "ready": False, "error": "worker status unavailable"}
+    # worker chết thì heartbeat ngừng -> coi như chưa sẵn sàng
+    if time.time() - st.get("heartbeat", 0) > 3 * _HEARTBEAT_SECONDS:
+        st.update(state="stale", ready=False)
+    return st
+
+
+def wait_model_ready(timeout: Optional[float] = None) -> bool:
+    """Chờ tới khi nạp xong (thành công hoặc lỗi); True nếu model dùng được."""
+    _done.wait(timeout)
+    return _ready.is_set()
+
+
+def model_ready() -> bool:
+    if _status_file:
+        return bool(_remote_status()["ready"])
+    return _ready.is_set()
+
+
+def model_status() -> Dict[str, Any]:
+    if _status_file:
+        return _remote_status()
+    return dict(_status, ready=_ready.is_set())
+
+
+def load_model_copy():
+    """Nạp một bản model riêng cho một worker trong pool (không đụng tới model toàn cục)."""
+    return create_backend()
 
 
 def safe_imread(path: str):
+    t0 = time.perf_counter()
     img = cv2.imread(path)
     if img is None:
         try:
@@ -37,56 +145,110 @@ def safe_imread(path: str):
             pass
     if img is None:
         raise RuntimeError(f"cv2.imread failed: {path}")
+    dt = time.perf_counter() - t0
+    DECODE_SECONDS.observe(dt)
+    tracing.add("decode", dt)
+    return img
+
+
+def _label_name(idx: int, names=None) -> str:
+    names = _yolo_names if names is None else names
+    return names.get(idx, str(idx)) if isinstance(names, dict) else str(idx)
+
+
+def _top1_from_result(r: Detections, names=None) -> Tuple[str, float]:
+    top = r.top1()
+    if top is None:
+        return "Unknown", 0.0
+    return _label_name(top[0], names), top[1]
+
+
+def detections_json(dets: Optional[Detections], names=None) -> Optional[str]:
+    """Hình học detection để lưu DB (thay cho vẽ ảnh ngay trên luồng worker)."""
+    if dets is None:
+        return None
+    return dets.to_json(_yolo_names if names is None else names)
+
+
+def render_annotated(img, dets_json: Optional[str]):
+    """Vẽ box đã lưu lên ảnh raw; chỉ chạy khi có người xem (/annotated/<id>)."""
+    if not dets_json:
+        return img
+    dets, names = Detections.from_json(dets_json)
+    return dets.plot(img, names)
+
+
+def decode_image(data: bytes):
+    import numpy as np
+    t0 = time.perf_counter()
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise RuntimeError("cv2.imdecode failed")
+    dt = time.perf_counter() - t0
+    DECODE_SECONDS.observe(dt)
+    tracing.add("decode", dt)
     return img
 
 
-def infer_and_annotate(image_path: str) -> Tuple[str, float, Any]:
+def infer_path(image_path: str) -> Tuple[str, float, Optional[Detections]]:
+    """Đọc ảnh từ file rồi infer như `infer_image`; ảnh annotate vẽ sau qua `render_annotated`."""
     if _yolo is None:
         raise RuntimeError(f"YOLO not loaded: {_yolo_err}")
 
-    _ = safe_imread(image_path)
-    results = _yolo(image_path, verbose=False)
+    # decode một lần, đưa thẳng mảng ảnh cho backend (không để backend đọc lại file)
+    return infer_image(safe_imread(image_path))
+
+
+def infer_image(img, yolo=None) -> Tuple[str, float, Optional[Detections]]:
+    """Trả về (nhãn top-1, conf, Detections); không vẽ ảnh.
+
+    `yolo` cho phép worker trong pool dùng bản model riêng của nó.
+    """
+    model = _yolo if yolo is None else yolo
+    if model is None:
+        raise RuntimeError(f"YOLO not loaded: {_yolo_err}")
+
+    t0 = time.perf_counter()
+    results = model.predict([img])
+    dt = time.perf_counter() - t0
+    INFER_SECONDS.observe(dt)
+    tracing.add("infer", dt)
     if not results:
         return "Unknown", 0.0, None
 
     r = results[0]
-    labels = []
-
-    # OBB
-    if hasattr(r, "obb") and r.obb is not None:
-        cls = getattr(r.obb, "cls", None)
-        conf = getattr(r.obb, "conf", None)
-        if cls is not None and conf is not None:
-            cls_list = cls.detach().cpu().tolist()
-            conf_list = conf.detach().cpu().tolist()
-            for c, cf in zip(cls_list, conf_list):
-                idx = int(c)
-                name = _yolo_names.get(idx, str(idx)) if isinstance(_yolo_names, dict) else str(idx)
-                labels.append({"name": name, "conf": float(cf)})
-
-    # Boxes
-    if not labels and hasattr(r, "boxes") and r.boxes is not None:
-        cls = getattr(r.boxes, "cls", None)
-        conf = getattr(r.boxes, "conf", None)
-        if cls is not None and conf is not None:
-            cls_list = cls.detach().cpu().tolist()
-            conf_list = conf.detach().cpu().tolist()
-            for c, cf in zip(cls_list, conf_list):
-                idx = int(c)
-                name = _yolo_names.get(idx, str(idx)) if isinstance(_yolo_names, dict) else str(idx)
-                labels.append({"name": name, "conf": float(cf)})
-
-    labels.sort(key=lambda x: x["conf"], reverse=True)
-    if labels:
-        top1_name = labels[0]["name"]
-        top1_conf = labels[0]["conf"]
-    else:
-        top1_name, top1_conf = "Unknown", 0.0
-
-    ann = None
-    try:
-        ann = r.plot()
-    except Exception:
-        ann = None
+    top1_name, top1_conf = _top1_from_result(r, getattr(model, "names", None))
+    return top1_name, top1_conf, r
+
+
+def infer_batch(image_paths: List[str]) -> List[Optional[Tuple[str, float, Optional[Detections]]]]:
+    """Chạy YOLO một lần cho cả lô ảnh.
+
+    Kết quả trả về theo đúng thứ tự đầu vào; ảnh nào không đọc được thì là None.
+    """
+    if _yolo is None:
+        raise RuntimeError(f"YOLO not loaded: {_yolo_err}")
+
+    out: List[Optional[Tuple[str, float, Optional[Detections]]]] = [None] * len(image_paths)
+    imgs = []
+    idxs = []
+    for i, p in enumerate(image_paths):
+        try:
+            imgs.append(safe_imread(p))
+            idxs.append(i)
+        except Exception as e:
+            print(f"[YOLO] Read error: {e}")
+    if not imgs:
+        return out
 
-    return top1_name, float(top1_conf), ann
+    t0 = time.perf_counter()
+    results = _yolo.predict(imgs) or []
+    dt = time.perf_counter() - t0
+    INFER_SECONDS.observe(dt)
+    tracing.add("infer", dt)
+    for i, r in zip(idxs, results):
+        top1_name, top1_conf = _top1_from_result(r)
+        out[i] = (top1_name, top1_conf, r)
+    for i in idxs[len(results):]:
+        out[i] = ("Unknown", 0.0, None)
+    return out
@@ -0,0 +1,130 @@
+import time
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable, Deque, Optional, Tuple
+
+from .model import load_model_copy, warmup, safe_imread, decode_image, infer_image, detections_json
+from . import tracing
+
+# Mỗi thread (hoặc process) worker giữ một bản model riêng
+_local = threading.local()
+
+
+def _init_worker():
+    try:
+        yolo = load_model_copy()
+        warmup(yolo)
+        _local.yolo = yolo
+        _local.err = None
+    except Exception as e:
+        _local.yolo = None
+        _local.err = str(e)
+        print("[POOL] Load model failed:", e)
+
+
+def _infer_task(src: str, data: Optional[bytes]) -> Tuple[str, float, float, Optional[str]]:
+    """Trả về (tên, conf, số giây suy luận, hình học detection dạng JSON)."""
+    yolo = getattr(_local, "yolo", None)
+    if yolo is None:
+        raise RuntimeError(f"YOLO not loaded: {getattr(_local, 'err', None)}")
+    img = decode_image(data) if data is not None else safe_imread(src)
+    t0 = time.perf_counter()
+    product_name, conf, dets = infer_image(img, yolo=yolo)
+    seconds = time.perf_counter() - t0
+    # decode/infer đo ở đây không có trace mở; luồng commit ghi lại infer từ `seconds`
+    tracing.discard()
+    return product_name, conf, seconds, detections_json(dets, getattr(yolo, "names", None))
+
+
+class InferencePool:
+    """Pool worker suy luận, commit kết quả theo đúng thứ tự submit.
+
+    Chỉ một luồng điều phối lấy ảnh từ hàng đợi nên không có hai worker nhận
+    cùng một file. Kết quả được đưa cho `commit` theo thứ tự đến, vì vậy id
+    trong `records` tăng đúng theo thứ tự chụp dù worker xong trước/sau.
+    """
+
+    def __init__(self, workers: int, mode: str, commit: Callable[[str, Optional[bytes], Future], None]):
+        self.workers = max(1, workers)
+        self.mode = mode
+        self._commit = commit
+        if mode == "process":
+            # spawn: mỗi process tự nạp model, không kế thừa trạng thái torch của process cha
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        else:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="infer",
+                initializer=_init_worker,
+            )
+        # giới hạn số ảnh đang xử lý để không đọc trước quá nhiều
+        self._slots = threading.Semaphore(self.workers * 2)
+        # (ảnh, bytes, future, hàm commit riêng hoặc None = self._commit)
+        self._inflight: Deque[Tuple[str, Optional[bytes], Future, Optional[Callable]]] = deque()
+        self._claimed = set()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._committer = threading.Thread(target=self._commit_loop, name="infer-commit", daemon=True)
+        self._committer.start()
+
+    def claimed(self) -> set:
+        with self._cond:
+            return set(self._claimed)
+
+    def submit(self, src: str, data: Optional[bytes] = None, timeout: Optional[float] = None) -> bool:
+        if not self._slots.acquire(timeout=timeout):
+            return False
+        self._enqueue(src, data, self._executor.submit(_infer_task, src, data), None)
+        return True
+
+    def submit_done(self, src: str, data: Optional[bytes], result, commit: Callable[[str, Optional[bytes], Future], None]):
+        """Xếp một ảnh đã có kết quả (vd. dedup dùng lại kết quả frame trước) vào hàng commit.
+
+        `commit` chạy trên luồng commit, đúng thứ tự với các ảnh đã submit trước nó.
+        """
+        self._slots.acquire()
+        fut: Future = Future()
+        fut.set_result(result)
+        self._enqueue(src, data, fut, commit)
+
+    def _enqueue(self, src: str, data: Optional[bytes], fut: Future, commit: Optional[Callable]):
+        with self._cond:
+            self._inflight.append((src, data, fut, commit))
+            if data is None:
+                self._claimed.add(src)
+            self._cond.notify()
+
+    def _commit_loop(self):
+        while True:
+            with self._cond:
+                while not self._inflight and not self._closed:
+                    self._cond.wait()
+                if not self._inflight:
+                    return
+                src, data, fut, commit = self._inflight[0]
+
+            # chờ ảnh đầu hàng xong, kể cả khi các ảnh sau đã xong trước
+            try:
+                fut.exception()
+                (commit or self._commit)(src, data, fut)
+            except Exception as e:
+                print(f"[POOL] Commit error: {e}")
+
+            with self._cond:
+                self._inflight.popleft()
+                self._claimed.discard(src)
+            self._slots.release()
+
+    def shutdown(self, timeout: float = 10.0):
+        """Dừng nhận ảnh mới, chờ các ảnh đang xử lý được commit rồi tắt executor."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._committer.join(timeout=timeout)
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,62 @@
+"""Profiler lấy mẫu stack của mọi luồng trong process, bật theo yêu cầu qua /admin/profile.
+
+Mỗi chu kỳ đọc sys._current_frames() và đếm theo stack; kết quả ở dạng "collapsed"
+(`luồng;hàm1;hàm2 số_mẫu`, gốc trước) dùng thẳng cho flamegraph.pl / speedscope.
+Không cần khởi động lại process; chỉ một phiên lấy mẫu chạy cùng lúc. Process con của
+pool (WORKER_MODE=process) không được lấy mẫu.
+"""
+import re
+import sys
+import time
+import threading
+from collections import Counter
+from typing import Dict, Optional, Sequence
+
+_busy = threading.Lock()
+
+
+def _thread_label(name: str) -> str:
+    # "Thread-12 (process_request_thread)" -> "Thread (process_request_thread)", "infer_3" -> "infer"
+    return re.sub(r"[-_]?\d+", "", name) or name
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})"
+
+
+def _stack(frame) -> str:
+    parts = []
+    while frame is not None:
+        parts.append(_frame_label(frame))
+        frame = frame.f_back
+    parts.reverse()
+    return ";".join(parts)
+
+
+def collapsed_stacks(seconds: float, hz: float = 100.0, threads: Optional[Sequence[str]] = None) -> Optional[str]:
+    """Lấy mẫu `seconds` giây ở tần số `hz`; `threads`: chỉ giữ luồng có tên chứa một trong các chuỗi này.
+
+    Trả về None nếu đang có phiên lấy mẫu khác.
+    """
+    if not _busy.acquire(blocking=False):
+        return None
+    try:
+        me = threading.get_ident()
+        interval = 1.0 / max(1.0, hz)
+        counts: Counter = Counter()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            names: Dict[int, str] = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                name = names.get(ident, f"thread-{ident}")
+                if threads and not any(t in name for t in threads):
+                    continue
+                counts[_thread_label(name) + ";" + _stack(frame)] += 1
+            time.sleep(max(0.0, interval - (time.perf_counter() - t0)))
+        return "".join(f"{stack} {n}\n" for stack, n in sorted(counts.items()))
+    finally:
+        _busy.release()
@@ -1,26 +1,153 @@
 import io
 import os
+import re
+import csv
+import zlib
+import tempfile
 import time
+import uuid
 import json
+import hashlib
+import hmac
+import mimetypes
 import traceback
 from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote
 
-from flask import Blueprint, request, jsonify, Response, send_from_directory, render_template, stream_with_context
+from flask import Blueprint, request, jsonify, Response, send_file, send_from_directory, render_template, stream_with_context
+import cv2
 from openpyxl import Workbook
 
-from .config import STATIC_DIR, OUTPUT_DIR, INPUT_DIR
-from .db import db_query_cursor, db_query_newer, db_stats, db_count_all
-from .gemini_chat import ask_gemini
+from .config import (STATIC_DIR, OUTPUT_DIR, INPUT_DIR, LAST_RAW, INMEMORY_INGEST, SSE_KEEPALIVE_SECONDS,
+                     THUMB_SIZES, THUMB_MAX_AGE, EXTS, ADMIN_TOKEN, PROFILE_MAX_SECONDS, JOB_QUEUE,
+                     UPLOAD_MAX_FILES)
+from .db import (db_query_cursor, db_query_newer, db_stats, db_count_all, db_iter_export, db_get_record,
+                 db_jobs_stats, db_jobs_dead, db_job_get)
+from .gemini_chat import ask_gemini, stream_gemini
+from .broadcast import broadcaster, record_matches
+from .cache import query_cache
+from .ingest import tmp_name_for, submit_bytes, get_last_frame, mem_queue
+from .model import model_ready, model_status, decode_image, render_annotated
+from .imgcache import annotated_cache, thumb_cache, make_thumbnail
+from .storage import output_abs_path, stat_output, read_output
+from .dedup import dedup_gate
+from . import metrics, tracing, jobs
+from .profiler import collapsed_stacks
 
 bp = Blueprint("routes", __name__)
 
-_stats_cache = {"key": None, "ts": 0.0, "data": None}
-STATS_CACHE_SECONDS = 2.0
-
-
 @bp.get("/health")
 def health():
-    return jsonify({"ok": True})
+    return jsonify({"ok": True, "live": True, "ready": model_ready(), "model": model_status(),
+                    "cache": query_cache.stats(), "dedup": dedup_gate.stats(),
+                    "annotated_cache": annotated_cache.stats(), "thumb_cache": thumb_cache.stats()})
+
+
+@bp.get("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _input_backlog() -> int:
+    try:
+        with os.scandir(INPUT_DIR) as it:
+            return sum(1 for e in it if not e.name.endswith(".tmp") and
+                       os.path.splitext(e.name)[1].lower() in EXTS)
+    except OSError:
+        return 0
+
+
+def _cache_counts(cache) -> List[Tuple[str, int]]:
+    st = cache.stats()
+    return [("hit", st["hits"]), ("miss", st["misses"])]
+
+
+# Gauge đọc lúc scrape: không tốn gì trên đường nóng
+metrics.GaugeFunc("vision_input_backlog", "Image files waiting in INPUT_DIR", _input_backlog)
+metrics.GaugeFunc("vision_memory_queue_depth", "Frames waiting in the in-memory ingest queue", mem_queue.qsize)
+metrics.GaugeFunc("vision_sse_subscribers", "Open /api/stream connections", lambda: broadcaster.subscribers)
+metrics.GaugeFunc("vision_model_ready", "1 when the model is loaded and warmed up", lambda: int(model_ready()))
+metrics.GaugeFunc("vision_query_cache_requests_total", "Dashboard query cache lookups, by outcome",
+                  lambda: _cache_counts(query_cache), ["outcome"], kind="counter")
+metrics.GaugeFunc("vision_query_cache_hit_ratio", "Dashboard query cache hit ratio since start",
+                  lambda: query_cache.stats()["hit_rate"])
+metrics.GaugeFunc("vision_dedup_skip_ratio", "Share of frames skipped/reused by the dedup gate",
+                  lambda: dedup_gate.stats()["skip_rate"])
+metrics.GaugeFunc("vision_jobs", "Ingest jobs in the SQLite queue, by state",
+                  lambda: sorted(db_jobs_stats().items()), ["state"])
+_chat_seconds = metrics.CHAT_SECONDS.labels("chat")
+_chat_stream_seconds = metrics.CHAT_SECONDS.labels("chat_stream")
+
+
+def _admin_allowed() -> bool:
+    # có ADMIN_TOKEN -> bắt buộc token; không có -> chỉ cho gọi từ chính máy chủ
+    if ADMIN_TOKEN:
+        token = request.headers.get("X-Admin-Token") or request.args.get("token", "")
+        return hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+    return request.remote_addr in ("127.0.0.1", "::1")
+
+
+@bp.get("/admin/traces")
+def admin_traces():
+    """Thời gian theo giai đoạn của các frame gần nhất (ring buffer TRACE_BUFFER)."""
+    if not _admin_allowed():
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+    limit = min(max(request.args.get("limit", 50, type=int), 1), max(1, tracing.TRACE_BUFFER))
+    min_ms = request.args.get("min_ms", 0.0, type=float)
+    return jsonify({"ok": True, "enabled": tracing.enabled(), "summary": tracing.summary(),
+                    "frames": tracing.recent(limit, min_ms)})
+
+
+@bp.get("/admin/profile")
+def admin_profile():
+    """Lấy mẫu stack các luồng trong `seconds` giây, trả về collapsed stacks cho flamegraph.
+
+    `threads`: lọc theo tên luồng, vd. threads=worker,Thread (worker_loop + luồng request Flask).
+    """
+    if not _admin_allowed():
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+    seconds = min(max(request.args.get("seconds", 10.0, type=float), 0.1), PROFILE_MAX_SECONDS)
+    hz = min(max(request.args.get("hz", 100.0, type=float), 1.0), 1000.0)
+    threads = [t for t in request.args.get("threads", "").split(",") if t.strip()] or None
+    out = collapsed_stacks(seconds, hz, [t.strip() for t in threads] if threads else None)
+    if out is None:
+        return jsonify({"ok": False, "error": "another profile is running"}), 409
+    print(f"[ADMIN] Profile {seconds:g}s @ {hz:g} Hz -> {out.count(chr(10))} stacks")
+    return Response(out, mimetype="text/plain; charset=utf-8",
+                    headers={"Content-Disposition": f"attachment; filename=profile_{int(time.time())}.collapsed"})
+
+
+@bp.get("/admin/jobs")
+def admin_jobs():
+    """Số job theo trạng thái và danh sách dead-letter (view dead_jobs)."""
+    if not _admin_allowed():
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+    limit = min(max(request.args.get("limit", 100, type=int), 1), 1000)
+    return jsonify({"ok": True, "enabled": JOB_QUEUE, "counts": db_jobs_stats(), "dead": db_jobs_dead(limit)})
+
+
+@bp.post("/admin/jobs/<int:job_id>/retry")
+def admin_job_retry(job_id: int):
+    """Đưa một job dead-letter về hàng đợi (ảnh chuyển lại INPUT_DIR)."""
+    if not _admin_allowed():
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+    path = jobs.retry_dead(job_id)
+    if path is None:
+        return jsonify({"ok": False, "error": "not a dead-letter job"}), 404
+    return jsonify({"ok": True, "job": db_job_get(job_id)})
+
+
+@bp.get("/health/live")
+def health_live():
+    return jsonify({"live": True})
+
+
+@bp.get("/health/ready")
+def health_ready():
+    # 503 tới khi model nạp + warmup xong (cho load balancer / orchestrator)
+    status = model_status()
+    return jsonify(status), (200 if status["ready"] else 503)
 
 
 @bp.get("/")
@@ -30,17 +157,114 @@ def home():
 
 @bp.get("/static/<path:filename>")
 def static_files(filename: str):
+    # Chế độ RAM: ảnh mới nhất không được copy ra LAST_RAW mà giữ trong bộ nhớ
+    if filename == os.path.basename(LAST_RAW):
+        last = get_last_frame()
+        if last is not None:
+            mimetype = mimetypes.guess_type(last[0])[0] or "image/jpeg"
+            return Response(last[1], mimetype=mimetype, headers={"Cache-Control": "no-cache"})
     return send_from_directory(STATIC_DIR, filename)
 
 
 @bp.get("/uploads/<path:filename>")
 def uploads(filename: str):
-    return send_from_directory(OUTPUT_DIR, filename)
+    # tên file raw có timestamp, không bị ghi đè -> ETag/Last-Modified mặc định + cache 1 ngày
+    path = output_abs_path(filename)
+    if path and os.path.isfile(path):
+        return send_from_directory(OUTPUT_DIR, filename, max_age=86400)
+    # ngày đã được pack -> đọc thẳng từ zip
+    st = stat_output(filename)
+    data = read_output(filename) if st else None
+    if data is None:
+        return jsonify({"ok": False, "error": "not found"}), 404
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    return send_file(io.BytesIO(data), mimetype=mimetype, etag=st[2], last_modified=st[0],
+                     max_age=86400, conditional=True)
+
+
+def _thumb_urls(image_path: str) -> dict:
+    # cỡ nhỏ nhất cho danh sách, cỡ lớn nhất cho khung xem trước
+    if not image_path or not THUMB_SIZES:
+        return {"thumb_url": "", "preview_url": ""}
+    path = quote(image_path)
+    return {"thumb_url": f"/thumb/{min(THUMB_SIZES)}/{path}",
+            "preview_url": f"/thumb/{max(THUMB_SIZES)}/{path}"}
+
+
+def _long_cache(resp, etag: str):
+    resp.set_etag(etag)
+    resp.headers["Vary"] = "Accept"
+    resp.cache_control.public = True
+    resp.cache_control.max_age = THUMB_MAX_AGE
+    resp.cache_control.immutable = True
+    return resp
+
+
+def _with_thumbs(rows):
+    # rows có thể nằm trong query_cache / ring buffer -> không sửa tại chỗ
+    return [dict(r, **_thumb_urls(r.get("image_path", ""))) for r in rows]
+
+
+@bp.get("/thumb/<int:size>/<path:filename>")
+def thumb(size: int, filename: str):
+    """Ảnh raw thu nhỏ theo cạnh dài; tạo lần đầu khi được xem, sau đó lấy từ cache đĩa.
+
+    WebP nếu trình duyệt nhận (Accept), ngược lại JPEG. ETag gắn với phiên bản file gốc
+    (mtime, hoặc CRC nếu đã pack) nên If-None-Match khớp sẽ nhận 304 mà không phải đọc ảnh.
+    """
+    if size not in THUMB_SIZES:
+        return jsonify({"ok": False, "error": f"size must be one of {list(THUMB_SIZES)}"}), 404
+    st = stat_output(filename)
+    if st is None:
+        return jsonify({"ok": False, "error": "not found"}), 404
+    mtime, src_size, version = st
+
+    fmt = "webp" if request.accept_mimetypes["image/webp"] else "jpg"
+    mimetype = "image/webp" if fmt == "webp" else "image/jpeg"
+    etag = hashlib.sha1(f"{filename}|{version}|{src_size}|{size}|{fmt}".encode("utf-8")).hexdigest()
+    if etag in request.if_none_match:
+        return _long_cache(Response(status=304), etag)
+
+    key = f"{size}/{filename}@{version}.{fmt}"
+    path = thumb_cache.get(key)
+    if path is None:
+        raw = read_output(filename)
+        data = make_thumbnail(raw, size, fmt) if raw else None
+        if data is None:
+            return jsonify({"ok": False, "error": "decode failed"}), 415
+        path = thumb_cache.put(key, data)
+    resp = send_file(path, mimetype=mimetype, etag=False, last_modified=mtime,
+                     max_age=THUMB_MAX_AGE, conditional=True)
+    return _long_cache(resp, etag)
+
+
+@bp.get("/annotated/<int:record_id>")
+def annotated(record_id: int):
+    """Ảnh raw của bản ghi có vẽ box; vẽ lần đầu khi được xem rồi lấy từ cache đĩa."""
+    key = f"{record_id}.jpg"
+    path = annotated_cache.get(key)
+    if path is None:
+        rec = db_get_record(record_id)
+        if rec is None or not rec["image_path"]:
+            return jsonify({"ok": False, "error": "not found"}), 404
+        raw = read_output(rec["image_path"])
+        try:
+            img = decode_image(raw) if raw else None
+        except RuntimeError:
+            img = None
+        if img is None:
+            return jsonify({"ok": False, "error": "image missing"}), 404
+        ok, buf = cv2.imencode(".jpg", render_annotated(img, rec["detections"]), [cv2.IMWRITE_JPEG_QUALITY, 85])
+        if not ok:
+            return jsonify({"ok": False, "error": "encode failed"}), 500
+        path = annotated_cache.put(key, buf.tobytes())
+    # bản ghi không đổi sau khi ghi -> cho trình duyệt cache lâu
+    return send_file(path, mimetype="image/jpeg", max_age=86400)
 
 
 @bp.get("/api/count_all")
 def api_count_all():
-    return jsonify({"total": db_count_all()})
+    return jsonify({"total": query_cache.get_or_compute(("count_all",), db_count_all)})
 
 
 @bp.get("/api/data")
@@ -68,8 +292,15 @@ def api_data():
     if cursor_raw.isdigit():
         cursor_id = int(cursor_raw)
 
-    rows = db_query_cursor(start, end, product, limit=limit, cursor_id=cursor_id)
-    return jsonify(rows)
+    if cursor_id is None:
+        # trang đầu là trang mọi dashboard cùng tải lại -> cache
+        rows = query_cache.get_or_compute(
+            ("data", start, end, product, limit),
+            lambda: db_query_cursor(start, end, product, limit=limit),
+        )
+    else:
+        rows = db_query_cursor(start, end, product, limit=limit, cursor_id=cursor_id)
+    return jsonify(_with_thumbs(rows))
 
 
 @bp.get("/api/stats")
@@ -82,31 +313,35 @@ def api_stats():
     if start and len(start) == 10: start += " 00:00:00"
     if end and len(end) == 10: end += " 23:59:59"
 
-    key = f"{start}|{end}|{product}"
-    now = time.time()
+    data = query_cache.get_or_compute(
+        ("stats", start, end, product),
+        lambda: db_stats(start, end, product, topk=30),
+    )
+    return jsonify(data)
 
-    if _stats_cache["key"] == key and (now - _stats_cache["ts"] <= STATS_CACHE_SECONDS):
-        return jsonify(_stats_cache["data"])
 
-    data = db_stats(start, end, product, topk=30)
-    _stats_cache.update({"key": key, "ts": now, "data": data})
-    return jsonify(data)
+def _chat_params(data: dict) -> Tuple[str, str, str, str]:
+    question = data.get("question", "")
+
+    start = data.get("start_date", "")
+    end = data.get("end_date", "")
+    product = data.get("product", "")
+
+    # Fix ngày cho chat context luôn
+    if start and len(start) == 10: start += " 00:00:00"
+    if end and len(end) == 10: end += " 23:59:59"
+    return question, start, end, product
+
+
+def _chat_event(kind: str, payload: dict) -> str:
+    return f"event: {kind}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
 
 
 @bp.post("/api/chat")
 def api_chat():
+    t0 = time.perf_counter()
     try:
-        data = request.json or {}
-        question = data.get("question", "")
-        
-        start = data.get("start_date", "")
-        end = data.get("end_date", "")
-        product = data.get("product", "")
-
-        # Fix ngày cho chat context luôn
-        if start and len(start) == 10: start += " 00:00:00"
-        if end and len(end) == 10: end += " 23:59:59"
-
+        question, start, end, product = _chat_params(request.json or {})
         answer = ask_gemini(question, start, end, product)
         return jsonify({"answer": answer})
         
@@ -114,43 +349,98 @@ def api_chat():
         print("------- SERVER CHAT ERROR -------")
         traceback.print_exc()
         return jsonify({"answer": f"Lỗi hệ thống: {str(e)}"}), 200
+    finally:
+        _chat_seconds.observe(time.perf_counter() - t0)
 
 
-@bp.get("/api/stream")
-def api_stream():
-    start = request.args.get("start_date", "")
-    end = request.args.get("end_date", "")
-    product = request.args.get("product", "")
+@bp.post("/api/chat/stream")
+def api_chat_stream():
+    """Như /api/chat nhưng trả câu trả lời dạng SSE: event token (từng đoạn), rồi done hoặc error."""
+    question, start, end, product = _chat_params(request.json or {})
+    event = _chat_event
+    t0 = time.perf_counter()
+
+    @stream_with_context
+    def gen():
+        try:
+            for kind, text in stream_gemini(question, start, end, product):
+                if kind == "token":
+                    yield event("token", {"text": text})
+                else:
+                    yield event(kind, {"answer": text})
+        except Exception as e:
+            print("------- SERVER CHAT ERROR -------")
+            traceback.print_exc()
+            yield event("error", {"answer": f"Lỗi hệ thống: {str(e)}"})
+        finally:
+            # tới khi gửi xong sự kiện cuối (hoặc client ngắt)
+            _chat_stream_seconds.observe(time.perf_counter() - t0)
+
+    return Response(gen(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+def _stream_params(args, headers) -> Tuple[str, str, str, int]:
+    start = args.get("start_date", "")
+    end = args.get("end_date", "")
+    product = args.get("product", "")
 
     if start and len(start) == 10: start += " 00:00:00"
     if end and len(end) == 10: end += " 23:59:59"
 
-    last_id_raw = request.args.get("last_id", "0")
+    # Trình duyệt tự gửi Last-Event-ID khi nối lại -> ưu tiên hơn last_id trên URL
+    last_id_raw = headers.get("Last-Event-ID") or args.get("last_id", "0")
     last_id = int(last_id_raw) if last_id_raw.isdigit() else 0
+    return start, end, product, last_id
+
+
+def _stream_event(r: dict) -> str:
+    payload = json.dumps(dict(r, **_thumb_urls(r.get("image_path", ""))), ensure_ascii=False)
+    return f"id: {r['id']}\nevent: new\ndata: {payload}\n\n"
+
+
+@bp.get("/api/stream")
+def api_stream():
+    start, end, product, last_id = _stream_params(request.args, request.headers)
+    event = _stream_event
 
     @stream_with_context
     def gen():
         nonlocal last_id
         yield "retry: 1000\n\n"
-
-        while True:
-            try:
-                rows = db_query_newer(start, end, product, last_id=last_id, limit=50)
-                if rows:
+        broadcaster.subscribe()
+        try:
+            while True:
+                try:
+                    rows = broadcaster.wait_newer(last_id, SSE_KEEPALIVE_SECONDS)
+                    if rows is None:
+                        # last_id cũ hơn ring buffer -> đọc DB để bắt kịp
+                        high_id = broadcaster.high_id
+                        rows = db_query_newer(start, end, product, last_id=last_id, limit=50)
+                        for r in rows:
+                            last_id = max(last_id, int(r["id"]))
+                            yield event(r)
+                        if len(rows) < 50:
+                            # mọi bản ghi khớp bộ lọc tới high_id đã gửi xong
+                            last_id = max(last_id, high_id)
+                        continue
+
+                    if not rows:
+                        yield ": keep-alive\n\n"
+                        continue
                     for r in rows:
                         last_id = max(last_id, int(r["id"]))
-                        payload = json.dumps(r, ensure_ascii=False)
-                        yield f"event: new\n"
-                        yield f"data: {payload}\n\n"
-                else:
-                    yield ": keep-alive\n\n"
-
-                time.sleep(0.5)
-            except GeneratorExit:
-                break
-            except Exception:
-                yield ": error\n\n"
-                time.sleep(1.0)
+                        if record_matches(r, start, end, product):
+                            yield event(r)
+                except GeneratorExit:
+                    raise
+                except Exception:
+                    yield ": error\n\n"
+                    time.sleep(1.0)
+        finally:
+            broadcaster.unsubscribe()
 
     return Response(gen(), mimetype="text/event-stream", headers={
         "Cache-Control": "no-cache",
@@ -172,52 +462,92 @@ def export_excel():
     if end and len(end) == 10:
         end += " 23:59:59"  # Lấy đến hết giây cuối cùng của ngày
 
-    rows = []
-    cursor_id = None
-    while True:
-        # Gọi db_query_cursor với thời gian đã được fix
-        batch = db_query_cursor(start, end, product, limit=500, cursor_id=cursor_id)
-        if not batch:
-            break
-        rows.extend(batch)
-        cursor_id = batch[-1]["id"]
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Vision Drink Survey"
-    
-    # Header
-    ws.append(["ID", "Thời gian phát hiện", "Tên sản phẩm"])
-    
-    # Data
-    for r in rows:
-        ws.append([r["id"], r["timestamp"], r["product_name"]])
+    fmt = (request.args.get("format", "xlsx") or "xlsx").lower()
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    rows = db_iter_export(start, end, product)
+
+    if fmt in ("csv", "csv.gz"):
+        chunks = _csv_chunks(rows)
+        if fmt == "csv.gz":
+            chunks = _gzip_chunks(chunks)
+        return Response(
+            chunks,
+            mimetype="application/gzip" if fmt == "csv.gz" else "text/csv; charset=utf-8",
+            headers={"Content-Disposition": f'attachment; filename="Report_{stamp}.{fmt}"'}
+        )
+
+    # write_only: openpyxl ghi từng dòng ra file tạm thay vì giữ cả sheet trong RAM
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Vision Drink Survey")
 
     # Auto-adjust column width (Tuỳ chọn làm đẹp)
     ws.column_dimensions['B'].width = 20
     ws.column_dimensions['C'].width = 15
 
-    buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
+    # Header
+    ws.append(["ID", "Thời gian phát hiện", "Tên sản phẩm"])
+
+    # Data
+    for r in rows:
+        ws.append([r["id"], r["timestamp"], r["product_name"] or "Unknown"])
+
+    tmp = tempfile.TemporaryFile()
+    wb.save(tmp)
+    size = tmp.tell()
+    tmp.seek(0)
 
-    fname = f"Report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+    fname = f"Report_{stamp}.xlsx"
     return Response(
-        buf.getvalue(),
+        _file_chunks(tmp),
         mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f'attachment; filename="{fname}"'}
+        headers={
+            "Content-Disposition": f'attachment; filename="{fname}"',
+            "Content-Length": str(size),
+        }
     )
 
 
-@bp.post("/api/upload_cam")
-def upload_cam():
-    f = request.files.get("file") or request.files.get("image")
-    if not f:
-        return jsonify({"ok": False, "error": "missing file"}), 400
+EXPORT_CHUNK = 64 * 1024
 
-    os.makedirs(INPUT_DIR, exist_ok=True)
 
-    filename = (f.filename or "").strip()
+def _csv_chunks(rows):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    # BOM để Excel nhận đúng UTF-8 (tên sản phẩm tiếng Việt)
+    buf.write("\ufeff")
+    w.writerow(["ID", "Thời gian phát hiện", "Tên sản phẩm"])
+    for r in rows:
+        w.writerow([r["id"], r["timestamp"], r["product_name"] or "Unknown"])
+        if buf.tell() >= EXPORT_CHUNK:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def _gzip_chunks(chunks):
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> định dạng gzip
+    for c in chunks:
+        out = z.compress(c)
+        if out:
+            yield out
+    yield z.flush()
+
+
+def _file_chunks(f):
+    try:
+        while True:
+            data = f.read(EXPORT_CHUNK)
+            if not data:
+                break
+            yield data
+    finally:
+        f.close()
+
+
+def _safe_filename(name: str) -> str:
+    filename = (name or "").strip()
     if not filename:
         filename = f"img_{int(time.time())}.jpg"
 
@@ -229,12 +559,143 @@ def upload_cam():
 
     if not filename.lower().endswith((".jpg", ".jpeg", ".png", ".bmp", ".webp")):
         filename += ".jpg"
-
-    save_path = os.path.join(INPUT_DIR, filename)
-    if os.path.exists(save_path):
-        base, ext = os.path.splitext(filename)
-        filename = f"{base}_{int(time.time()*1000)}{ext}"
+    return filename
+
+
+# YYYYMMDD_HHMMSS trong tên file camera gửi kèm
+_NAME_TS_RE = re.compile(r"\d{8}_\d{6}")
+
+
+def _capture_time(value: str) -> Optional[datetime]:
+    """X-Timestamp: giây unix, "YYYYMMDD_HHMMSS" hoặc "YYYY-MM-DD HH:MM:SS" (có thể có T)."""
+    value = value.strip()
+    head, _, frac = value.partition(".")
+    if head.isdigit() and len(head) <= 11 and (not frac or frac.isdigit()):
+        try:
+            return datetime.fromtimestamp(float(value))
+        except (ValueError, OverflowError, OSError):
+            return None
+    for fmt in ("%Y%m%d_%H%M%S", "%Y%m%d%H%M%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return datetime.strptime(value[:19], fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def _raw_upload_name(headers) -> str:
+    """Tên file cho body ảnh thô, từ header: X-Camera, X-Timestamp, X-Filename.
+
+    Worker lấy camera (dedup) và giờ chụp từ tên file, nên có X-Camera thì tên luôn là
+    <camera>_<YYYYMMDD_HHMMSS>.jpg: giờ chụp lấy từ X-Timestamp, rồi timestamp trong
+    X-Filename, cuối cùng là giờ nhận. Tên tự đặt của camera (vd. img_<millis>.jpg) không
+    lọt vào tên camera. Không có X-Camera thì giữ X-Filename như upload multipart.
+    """
+    camera = "".join(ch for ch in headers.get("X-Camera", "") if ch.isalnum() or ch in ("_", "-"))
+    name = headers.get("X-Filename", "")
+    ts = _capture_time(headers.get("X-Timestamp", ""))
+    if ts is None and name:
+        m = _NAME_TS_RE.search(name)
+        ts = _capture_time(m.group(0)) if m else None
+    if not camera and (name or ts is None):
+        return name
+    return f"{camera or 'cam'}_{(ts or datetime.now()).strftime('%Y%m%d_%H%M%S')}.jpg"
+
+
+def _publish_input(tmp_path: str, filename: str) -> Tuple[str, str]:
+    """Đưa file tạm đã ghi xong vào INPUT_DIR dưới tên chưa có, trả về (tên, đường dẫn).
+
+    Tên được giành bằng os.link (lỗi nếu tên đã có) nên hai request cùng lúc, kể cả ở hai
+    process web, không bao giờ nhận cùng một tên; worker chỉ thấy file đã đủ nội dung.
+    """
+    base, ext = os.path.splitext(filename)
+    now_ms = int(time.time() * 1000)
+    for i in range(1000):
         save_path = os.path.join(INPUT_DIR, filename)
+        try:
+            os.link(tmp_path, save_path)
+            return filename, save_path
+        except FileExistsError:
+            # một hậu tố số duy nhất để dedup.camera_id vẫn tách được tên camera
+            filename = f"{base}_{now_ms + i}{ext}"
+    raise FileExistsError(f"no free name for {base}{ext}")
+
+
+def _store_upload(name: str, f=None, data: Optional[bytes] = None) -> Dict[str, Any]:
+    """Lưu một ảnh upload (FileStorage `f` hoặc bytes `data`) vào hàng đợi RAM hoặc INPUT_DIR.
+
+    Không suy luận gì ở đây; ảnh ghi đĩa có thêm khoá "path" để tạo job sau.
+    """
+    filename = _safe_filename(name)
+
+    if INMEMORY_INGEST:
+        if data is None:
+            data = f.read()
+        if not data:
+            return {"ok": False, "filename": filename, "error": "empty file"}
+        if submit_bytes(filename, data):
+            return {"ok": True, "filename": filename, "queued": "memory"}
+        # hàng đợi RAM đầy -> ghi xuống INPUT_DIR như cũ để không mất ảnh
+
+    # Ghi ra file tạm riêng của request này rồi mới đặt tên thật: worker chỉ thấy file khi
+    # đã ghi xong, và hai request trùng tên không ghi đè file tạm của nhau
+    tmp_path = os.path.join(INPUT_DIR, tmp_name_for(f"{uuid.uuid4().hex}_{filename}"))
+    try:
+        if data is not None:
+            with open(tmp_path, "wb") as out:
+                out.write(data)
+        else:
+            f.save(tmp_path)
+        filename, save_path = _publish_input(tmp_path, filename)
+    finally:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    return {"ok": True, "filename": filename, "path": save_path}
+
+
+def _is_raw_image(mimetype: str) -> bool:
+    return mimetype.startswith("image/") or mimetype == "application/octet-stream"
 
-    f.save(save_path)
-    return jsonify({"ok": True, "filename": filename})
\ No newline at end of file
+
+@bp.post("/api/upload_cam")
+def upload_cam():
+    """Nhận ảnh camera, trả về ngay (không suy luận trong request).
+
+    - multipart: một hoặc nhiều file (mọi field file, tối đa UPLOAD_MAX_FILES);
+    - body ảnh thô (Content-Type image/jpeg...), metadata trong header X-Camera,
+      X-Timestamp (giờ chụp), X-Filename (xem _raw_upload_name).
+    Một ảnh -> {"ok", "filename", "job_id"} như cũ; nhiều ảnh -> {"ok", "files": [...]}
+    với từng ảnh một mục. Job của cả lô được tạo trong một transaction.
+    """
+    if _is_raw_image(request.mimetype):
+        data = request.get_data(cache=False)
+        if not data:
+            return jsonify({"ok": False, "error": "missing file"}), 400
+        items = [(_raw_upload_name(request.headers), None, data)]
+    else:
+        files = [f for _, f in request.files.items(multi=True)]
+        if not files:
+            return jsonify({"ok": False, "error": "missing file"}), 400
+        if len(files) > UPLOAD_MAX_FILES:
+            return jsonify({"ok": False, "error": f"too many files (max {UPLOAD_MAX_FILES})"}), 413
+        items = [(f.filename, f, None) for f in files]
+
+    os.makedirs(INPUT_DIR, exist_ok=True)
+    results = [_store_upload(*item) for item in items]
+
+    saved = [r for r in results if "path" in r]
+    if JOB_QUEUE and saved:
+        # tạo job ngay: worker nhận được mà không phải chờ quét thư mục / kiểm tra ổn định
+        for r, job_id in zip(saved, jobs.enqueue_uploads([r["path"] for r in saved])):
+            r["job_id"] = job_id
+    for r in results:
+        r.pop("path", None)
+
+    if len(results) == 1:
+        r = results[0]
+        if not r["ok"]:
+            return jsonify({"ok": False, "error": r["error"]}), 400
+        return jsonify(r)
+    return jsonify({"ok": all(r["ok"] for r in results), "files": results})
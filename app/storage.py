@@ -0,0 +1,251 @@
+"""Lưu ảnh raw đã xử lý theo ngày: OUTPUT_DIR/YYYY/MM/DD/<tên file>.
+
+`image_path` trong DB là đường dẫn tương đối theo layout này (dấu "/"). Ngày cũ hơn
+PACK_AFTER_DAYS được gom thành một file OUTPUT_DIR/YYYY/MM/DD.zip; đọc ảnh trong pack
+là truy cập ngẫu nhiên theo central directory của zip nên không phải giải nén cả ngày.
+Ảnh JPEG/WebP vốn đã nén -> lưu dạng STORED, các định dạng khác dùng DEFLATE.
+"""
+import os
+import re
+import time
+import stat
+import shutil
+import threading
+import zipfile
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from werkzeug.utils import safe_join
+
+from .config import OUTPUT_DIR, PACK_AFTER_DAYS, PACK_INTERVAL_HOURS
+
+_DAY_RE = re.compile(r"^(\d{4})/(\d{2})/(\d{2})/([^/]+)$")
+_STORED_EXTS = {".jpg", ".jpeg", ".webp"}
+
+# ZipFile đang mở, theo (đường dẫn pack, mtime_ns) -> pack được ghi lại thì tự mở bản mới
+_packs: "OrderedDict[Tuple[str, int], zipfile.ZipFile]" = OrderedDict()
+_packs_lock = threading.Lock()
+_MAX_OPEN_PACKS = 32
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def shard_for(timestamp: str) -> str:
+    """"YYYY-MM-DD HH:MM:SS" -> "YYYY/MM/DD" (timestamp lỗi -> ngày hiện tại)."""
+    try:
+        dt = datetime.strptime(timestamp[:10], "%Y-%m-%d")
+    except (TypeError, ValueError):
+        dt = datetime.now()
+    return dt.strftime("%Y/%m/%d")
+
+
+def output_rel_path(timestamp: str, name: str) -> str:
+    return f"{shard_for(timestamp)}/{name}"
+
+
+def output_abs_path(rel: str) -> Optional[str]:
+    """Đường dẫn thật của file chưa pack (None nếu rel trỏ ra ngoài OUTPUT_DIR)."""
+    return safe_join(OUTPUT_DIR, rel)
+
+
+def save_output(rel: str, data: Optional[bytes] = None, src: Optional[str] = None) -> str:
+    """Ghi ảnh raw (từ bytes hoặc copy từ src) vào shard của ngày, trả về đường dẫn tuyệt đối.
+
+    Ghi ra .tmp rồi os.replace: pack_day (bỏ qua .tmp) không gom và xoá file đang ghi dở.
+    """
+    path = os.path.join(OUTPUT_DIR, *rel.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        if data is not None:
+            with open(tmp, "wb") as f:
+                f.write(data)
+        else:
+            shutil.copyfile(src, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return path
+
+
+def _pack_path(rel: str) -> Optional[Tuple[str, str]]:
+    m = _DAY_RE.match(rel)
+    if not m:
+        return None
+    y, mo, d, name = m.groups()
+    return os.path.join(OUTPUT_DIR, y, mo, f"{d}.zip"), name
+
+
+def _open_pack(path: str) -> Optional[zipfile.ZipFile]:
+    try:
+        key = (path, os.stat(path).st_mtime_ns)
+    except OSError:
+        return None
+    with _packs_lock:
+        zf = _packs.get(key)
+        if zf is not None:
+            _packs.move_to_end(key)
+            return zf
+        try:
+            zf = zipfile.ZipFile(path)
+        except (OSError, zipfile.BadZipFile) as e:
+            print(f"[STORAGE] Bad pack {path}: {e}")
+            return None
+        # bản cũ của cùng pack bị bỏ; ZipFile tự đóng khi không còn ai đọc
+        for k in [k for k in _packs if k[0] == path]:
+            del _packs[k]
+        _packs[key] = zf
+        while len(_packs) > _MAX_OPEN_PACKS:
+            _packs.popitem(last=False)
+        return zf
+
+
+def _pack_member(rel: str) -> Optional[Tuple[zipfile.ZipFile, zipfile.ZipInfo]]:
+    loc = _pack_path(rel)
+    if loc is None:
+        return None
+    zf = _open_pack(loc[0])
+    if zf is None:
+        return None
+    try:
+        return zf, zf.getinfo(loc[1])
+    except KeyError:
+        return None
+
+
+def stat_output(rel: str) -> Optional[Tuple[float, int, str]]:
+    """(mtime, kích thước, phiên bản cho ETag) của ảnh, dù nằm ngoài hay trong pack."""
+    path = output_abs_path(rel)
+    if path:
+        try:
+            st = os.stat(path)
+            if stat.S_ISREG(st.st_mode):
+                return st.st_mtime, st.st_size, str(st.st_mtime_ns)
+        except OSError:
+            pass
+    hit = _pack_member(rel)
+    if hit is None:
+        return None
+    info = hit[1]
+    return time.mktime(info.date_time + (0, 0, -1)), info.file_size, f"z{info.CRC:08x}"
+
+
+def read_output(rel: str) -> Optional[bytes]:
+    """Nội dung ảnh raw; đọc file rời trước, không có thì tìm trong pack của ngày."""
+    path = output_abs_path(rel)
+    if path:
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            pass
+    hit = _pack_member(rel)
+    if hit is None:
+        return None
+    try:
+        return hit[0].read(hit[1])
+    except (OSError, zipfile.BadZipFile, ValueError) as e:
+        print(f"[STORAGE] Read {rel} from pack failed: {e}")
+        return None
+
+
+def pack_day(day_dir: str) -> int:
+    """Gom các file trong thư mục ngày vào <DD>.zip cạnh nó rồi xoá file rời; trả về số file đã gom.
+
+    Pack đã có (ngày bị ghi thêm muộn) thì ghi lại pack mới gồm cả nội dung cũ. Pack mới
+    được ghi ra .tmp rồi os.replace, nên người đang đọc pack cũ không bị ảnh hưởng.
+    """
+    names = sorted(n for n in os.listdir(day_dir)
+                   if not n.endswith(".tmp") and os.path.isfile(os.path.join(day_dir, n)))
+    if not names:
+        return 0
+    pack = day_dir.rstrip(os.sep) + ".zip"
+    tmp = f"{pack}.{os.getpid()}.tmp"
+    with zipfile.ZipFile(tmp, "w") as out:
+        if os.path.exists(pack):
+            fresh = set(names)
+            with zipfile.ZipFile(pack) as old:
+                for info in old.infolist():
+                    if info.filename not in fresh:
+                        out.writestr(info, old.read(info), compress_type=info.compress_type)
+        for n in names:
+            ext = os.path.splitext(n)[1].lower()
+            out.write(os.path.join(day_dir, n), n,
+                      compress_type=zipfile.ZIP_STORED if ext in _STORED_EXTS else zipfile.ZIP_DEFLATED)
+    with open(tmp, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, pack)
+
+    for n in names:
+        try:
+            os.remove(os.path.join(day_dir, n))
+        except OSError:
+            pass
+    try:
+        os.rmdir(day_dir)
+    except OSError:
+        pass  # worker vừa ghi thêm file -> lần sau gom tiếp
+    return len(names)
+
+
+def day_dirs() -> List[Tuple[datetime, str]]:
+    """Các thư mục ngày YYYY/MM/DD đang có trong OUTPUT_DIR."""
+    out = []
+    for y in sorted(os.listdir(OUTPUT_DIR)) if os.path.isdir(OUTPUT_DIR) else []:
+        ydir = os.path.join(OUTPUT_DIR, y)
+        if not (y.isdigit() and len(y) == 4 and os.path.isdir(ydir)):
+            continue
+        for mo in sorted(os.listdir(ydir)):
+            mdir = os.path.join(ydir, mo)
+            if not os.path.isdir(mdir):
+                continue
+            for d in sorted(os.listdir(mdir)):
+                ddir = os.path.join(mdir, d)
+                if not os.path.isdir(ddir):
+                    continue
+                try:
+                    out.append((datetime.strptime(f"{y}{mo}{d}", "%Y%m%d"), ddir))
+                except ValueError:
+                    continue
+    return out
+
+
+def pack_old_days(days: int, today: Optional[datetime] = None) -> int:
+    """Pack mọi ngày cũ hơn `days` ngày so với hôm nay; trả về tổng số file đã gom."""
+    cutoff = (today or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+    total = 0
+    for day, ddir in day_dirs():
+        if day >= cutoff:
+            continue
+        try:
+            n = pack_day(ddir)
+        except Exception as e:
+            print(f"[STORAGE] Pack {ddir} failed: {e}")
+            continue
+        if n:
+            print(f"[STORAGE] Packed {n} files -> {ddir}.zip")
+        total += n
+    return total
+
+
+def _retention_loop():
+    while not _stop.is_set():
+        pack_old_days(PACK_AFTER_DAYS)
+        _stop.wait(PACK_INTERVAL_HOURS * 3600)
+
+
+def start_retention_thread():
+    """Chạy pack_old_days định kỳ (PACK_AFTER_DAYS = 0 -> tắt)."""
+    global _thread
+    if PACK_AFTER_DAYS <= 0 or (_thread and _thread.is_alive()):
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_retention_loop, daemon=True, name="retention")
+    _thread.start()
+    print(f"[STORAGE] Retention: pack days older than {PACK_AFTER_DAYS} every {PACK_INTERVAL_HOURS}h")
@@ -0,0 +1,145 @@
+"""Span thời gian theo từng giai đoạn của mỗi frame trong worker, giữ trong ring buffer.
+
+Worker gọi begin(tên frame) ... end() quanh mỗi frame (hoặc mỗi lô); các bước bên trong
+ghi span bằng `with span("save"):` hoặc add("infer", giây). Span ghi khi luồng chưa có
+frame nào đang mở (vd. file_stable trước khi biết ảnh nào sẵn sàng) được giữ tạm và gộp
+vào frame kế tiếp của cùng luồng. TRACE_BUFFER = 0 tắt hoàn toàn.
+"""
+import time
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List
+
+from .config import TRACE_BUFFER
+
+_MAX_PENDING = 16
+
+_ring: Deque[Dict[str, Any]] = deque(maxlen=max(1, TRACE_BUFFER))
+_ring_lock = threading.Lock()
+_local = threading.local()
+
+
+class _Trace:
+    __slots__ = ("frame", "started", "t0", "stages", "before")
+
+    def __init__(self, frame: str, pending: List):
+        self.frame = frame
+        self.started = time.time()
+        self.t0 = time.perf_counter()
+        self.stages = pending
+        # span chờ từ trước begin() nằm ngoài [t0, end] -> cộng riêng vào tổng
+        self.before = sum(s for _, s in pending)
+
+
+class _Span:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        add(self.name, time.perf_counter() - self.t0)
+        return False
+
+
+def enabled() -> bool:
+    return TRACE_BUFFER > 0
+
+
+def begin(frame: str):
+    """Mở trace cho một frame trên luồng hiện tại (kèm các span đang chờ)."""
+    if TRACE_BUFFER <= 0:
+        return
+    pending = getattr(_local, "pending", None) or []
+    _local.pending = []
+    _local.trace = _Trace(frame, pending)
+
+
+def set_frame(frame: str):
+    tr = getattr(_local, "trace", None)
+    if tr is not None:
+        tr.frame = frame
+
+
+def add(name: str, seconds: float):
+    if TRACE_BUFFER <= 0:
+        return
+    tr = getattr(_local, "trace", None)
+    if tr is not None:
+        tr.stages.append((name, seconds))
+        return
+    pending = getattr(_local, "pending", None)
+    if pending is None:
+        pending = _local.pending = []
+    if len(pending) < _MAX_PENDING:
+        pending.append((name, seconds))
+
+
+def span(name: str) -> _Span:
+    return _Span(name)
+
+
+def end():
+    """Đóng trace của luồng hiện tại và đưa vào ring buffer."""
+    tr = getattr(_local, "trace", None)
+    if tr is None:
+        return
+    _local.trace = None
+    elapsed = time.perf_counter() - tr.t0
+    record = {
+        "frame": tr.frame,
+        "thread": threading.current_thread().name,
+        "started": datetime.fromtimestamp(tr.started).isoformat(timespec="milliseconds"),
+        "total_ms": round((elapsed + tr.before) * 1000, 3),
+        "stages": [{"name": n, "ms": round(s * 1000, 3)} for n, s in tr.stages],
+    }
+    with _ring_lock:
+        _ring.append(record)
+
+
+def discard():
+    """Bỏ trace đang mở và các span chờ của luồng hiện tại."""
+    _local.trace = None
+    _local.pending = []
+
+
+def recent(limit: int = 50, min_ms: float = 0.0) -> List[Dict[str, Any]]:
+    """Các frame gần nhất (mới nhất trước), chỉ lấy frame có tổng thời gian >= min_ms."""
+    with _ring_lock:
+        items = list(_ring)
+    out = [r for r in reversed(items) if r["total_ms"] >= min_ms]
+    return out[:limit]
+
+
+def _pct(xs: List[float], p: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+
+def summary() -> Dict[str, Any]:
+    """Phân vị thời gian theo giai đoạn trên toàn bộ ring buffer."""
+    with _ring_lock:
+        items = list(_ring)
+    by_stage: Dict[str, List[float]] = {}
+    for r in items:
+        for s in r["stages"]:
+            by_stage.setdefault(s["name"], []).append(s["ms"])
+    totals = [r["total_ms"] for r in items]
+    grand = sum(totals) or 1.0
+    stages = {
+        name: {"n": len(xs), "p50_ms": round(_pct(xs, 50), 3), "p95_ms": round(_pct(xs, 95), 3),
+               "max_ms": round(max(xs), 3), "share": round(sum(xs) / grand, 4)}
+        for name, xs in by_stage.items()
+    }
+    return {
+        "frames": len(items),
+        "capacity": TRACE_BUFFER,
+        "total": ({"p50_ms": round(_pct(totals, 50), 3), "p95_ms": round(_pct(totals, 95), 3),
+                   "max_ms": round(max(totals), 3)} if totals else None),
+        "stages": stages,
+    }
@@ -1,16 +1,41 @@
 import os
 import time
+import atexit
 import shutil
 import threading
+import queue
 import re
 from datetime import datetime
-from typing import List, Optional
+from typing import Callable, List, Optional, Tuple
 
-from .config import INPUT_DIR, OUTPUT_DIR, EXTS, POLL_SECONDS, STABLE_SECONDS, LAST_RAW
-from .model import infer_and_annotate
+from .config import (
+    INPUT_DIR, OUTPUT_DIR, EXTS, POLL_SECONDS, STABLE_SECONDS, LAST_RAW,
+    BATCH_SIZE, BATCH_MAX_WAIT, INGEST_MODE, INMEMORY_INGEST, MEM_QUEUE_SIZE,
+    WORKERS, WORKER_MODE, JOB_QUEUE, MODEL_RETRY_BASE, MODEL_RETRY_MAX,
+)
+from .model import (
+    infer_path, infer_batch, infer_image, decode_image, detections_json,
+    wait_model_ready, model_status, start_model_loading,
+)
 from .db import db_insert
+from .broadcast import broadcaster
+from .ingest import IngestWatcher, inotify_available, mem_queue, set_last_frame
+from .pool import InferencePool
+from .dedup import dedup_gate, camera_id
+from . import jobs
+from .storage import output_rel_path, output_abs_path, save_output
+from .metrics import FRAMES, INFER_SECONDS
+from . import tracing
 
-stop_flag = False
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+_watcher: Optional[IngestWatcher] = None
+_pool: Optional[InferencePool] = None
+
+_frames_processed = FRAMES.labels("processed")
+_frames_failed = FRAMES.labels("failed")
+_frames_skipped = FRAMES.labels("skipped")
+_frames_reused = FRAMES.labels("reused")
 
 # Hỗ trợ: img_YYYYMMDD_HHMMSS.jpg | cam_YYYYMMDD_HHMMSS.jpg | YYYYMMDD_HHMMSS.jpg
 _TS_RE = re.compile(r"(?:img_|cam_)?(\d{8})_(\d{6})", re.IGNORECASE)
@@ -54,88 +79,580 @@ def file_stable(path: str, stable_seconds: float) -> bool:
         return False
 
 
-def make_output_name(src_path: str, product_name: str) -> str:
+def make_output_name(src_path: str, product_name: str, timestamp: Optional[str] = None) -> str:
+    """Đường dẫn tương đối trong OUTPUT_DIR: YYYY/MM/DD/<giờ xử lý>_<sản phẩm>_<tên gốc>.
+
+    Thư mục ngày lấy theo `timestamp` của bản ghi (mặc định: bây giờ).
+    """
     base = os.path.basename(src_path)
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    now = datetime.now()
+    ts = now.strftime("%Y%m%d_%H%M%S")
     pn = (product_name or "Unknown").strip().replace(" ", "_")
     pn = "".join(ch for ch in pn if ch.isalnum() or ch in ("_", "-", "."))
     name, ext = os.path.splitext(base)
     ext = ext if ext.lower() in EXTS else ".jpg"
-    return f"{ts}_{pn}_{name}{ext}"
+    return output_rel_path(timestamp or now.strftime("%Y-%m-%d %H:%M:%S"), f"{ts}_{pn}_{name}{ext}")
 
 
-def worker_loop():
-    global stop_flag
-    print(f"[WORKER] Watching: {INPUT_DIR}")
-    print(f"[WORKER] Output (RAW IMAGES): {OUTPUT_DIR}")
+def files_stable(paths: List[str], stable_seconds: float) -> List[str]:
+    """Như file_stable nhưng chỉ ngủ một lần cho cả danh sách."""
+    before = {}
+    for p in paths:
+        try:
+            before[p] = os.path.getsize(p)
+        except Exception:
+            pass
+    if not before:
+        return []
+    time.sleep(stable_seconds)
+    stable = []
+    for p, s1 in before.items():
+        try:
+            s2 = os.path.getsize(p)
+        except Exception:
+            continue
+        if s1 == s2 and s2 > 0:
+            stable.append(p)
+    return stable
+
+
+def collect_batch(batch_size: int, max_wait: float, exclude: Optional[set] = None) -> List[str]:
+    def _list():
+        items = list_images_sorted(INPUT_DIR)
+        return [p for p in items if p not in exclude] if exclude else items
+
+    items = _list()
+    deadline = time.time() + max_wait
+    while items and len(items) < batch_size and time.time() < deadline:
+        time.sleep(min(POLL_SECONDS, max(0.0, deadline - time.time())))
+        items = _list()
+    return items[:batch_size]
+
+
+def start_watcher() -> Optional[IngestWatcher]:
+    global _watcher
+    if INGEST_MODE == "poll":
+        return None
+    if INGEST_MODE == "auto" and not inotify_available():
+        print("[WORKER] inotify not available -> polling")
+        return None
+    try:
+        _watcher = IngestWatcher(INPUT_DIR).start()
+        print("[WORKER] Ingest: inotify")
+    except Exception as e:
+        _watcher = None
+        print(f"[WORKER] inotify start failed ({e}) -> polling")
+    return _watcher
 
-    while not stop_flag:
+
+def next_ready(n: int, max_wait: float, timeout: float, exclude: Optional[set] = None) -> List[str]:
+    """Trả về tối đa n ảnh đã ghi xong, theo thứ tự đến.
+
+    `exclude`: các file đã được pool nhận (chế độ quét thư mục chưa xoá chúng khỏi INPUT_DIR).
+    JOB_QUEUE: ảnh lấy từ bảng jobs (nhận theo index); chỉ dò INPUT_DIR tìm ảnh mới
+    (ghi thẳng vào thư mục, không qua /api/upload_cam) khi không còn job đến hạn.
+    """
+    if JOB_QUEUE:
+        return next_jobs(n, timeout, exclude)
+    return discover(n, max_wait, timeout, exclude)
+
+
+def next_jobs(n: int, timeout: float, exclude: Optional[set] = None) -> List[str]:
+    if _watcher is not None:
+        # watcher đã có sẵn danh sách -> lấy không chờ mỗi vòng để ảnh ngoài không phải đợi lúc rảnh
+        found = _watcher.get_many(64, 0.0, 0.0)
+        if found:
+            jobs.enqueue(found)
+    claimed = jobs.claim(n)
+    if claimed:
+        return claimed
+    jobs.maintain()
+    skip = jobs.queued_paths() | (exclude or set())
+    found = discover(64, 0.0, timeout, skip)
+    if found:
+        jobs.enqueue(found)
+    return jobs.claim(n)
+
+
+def discover(n: int, max_wait: float, timeout: float, exclude: Optional[set] = None) -> List[str]:
+    """Tìm tối đa n ảnh đã ghi xong trong INPUT_DIR (inotify hoặc quét thư mục)."""
+    if _watcher is not None:
+        return _watcher.get_many(n, max_wait, timeout)
+
+    # fallback: quét thư mục + kiểm tra kích thước không đổi
+    # chỉ ghi span file_stable khi có ảnh sẵn sàng (nó được gộp vào trace của frame đó)
+    if n > 1 or exclude:
+        batch = collect_batch(n, max_wait, exclude)
+        if not batch:
+            return []
+        t0 = time.perf_counter()
+        ready = files_stable(batch, STABLE_SECONDS)
+    else:
+        items = list_images_sorted(INPUT_DIR)
+        if not items:
+            return []
+        t0 = time.perf_counter()
+        ready = [items[0]] if file_stable(items[0], STABLE_SECONDS) else []
+    if ready:
+        tracing.add("file_stable", time.perf_counter() - t0)
+    return ready
+
+
+def _remove_input(src: str):
+    try:
+        os.remove(src)
+    except Exception:
+        pass
+
+
+def _remove_output(rel: str):
+    path = output_abs_path(rel)
+    if path:
         try:
-            items = list_images_sorted(INPUT_DIR)
-            if not items:
-                time.sleep(POLL_SECONDS)
-                continue
+            os.remove(path)
+        except OSError:
+            pass
 
-            src = items[0]
-            if not file_stable(src, STABLE_SECONDS):
-                time.sleep(POLL_SECONDS)
-                continue
 
-            # copy last raw
-            try:
-                shutil.copyfile(src, LAST_RAW)
-            except Exception:
-                pass
+def _fail_input(src: str, error: str):
+    """Xử lý ảnh lỗi: ảnh thuộc job -> giữ lại để thử lại/dead-letter; ngược lại xoá như cũ."""
+    dedup_gate.forget(camera_id(src))
+    if not jobs.fail(src, error):
+        _remove_input(src)
 
-            # infer
-            try:
-                product_name, conf, _ann_img = infer_and_annotate(src)
-            except Exception as e:
-                print(f"[WORKER] Infer error: {e}")
-                try:
-                    os.remove(src)
-                except Exception:
-                    pass
-                time.sleep(POLL_SECONDS)
-                continue
 
-            # save output raw
-            out_name = make_output_name(src, product_name)
-            out_path = os.path.join(OUTPUT_DIR, out_name)
-            try:
-                shutil.copyfile(src, out_path)
-            except Exception as e:
-                print(f"[WORKER] Save error: {e}")
-                try:
-                    os.remove(src)
-                except Exception:
-                    pass
-                time.sleep(POLL_SECONDS)
-                continue
+def update_last_raw(src: str, data: Optional[bytes] = None):
+    with tracing.span("last_raw"):
+        if data is not None:
+            set_last_frame(src, data)
+            return
+        set_last_frame(src, None)
+        try:
+            shutil.copyfile(src, LAST_RAW)
+        except Exception:
+            pass
+
+
+def finish_item(src: str, product_name: str, conf: float, data: Optional[bytes] = None,
+                dets: Optional[str] = None) -> bool:
+    """Lưu ảnh raw vào shard ngày trong OUTPUT_DIR và ghi DB. `data` != None nghĩa là ảnh đến từ hàng đợi RAM.
+
+    `dets`: hình học detection (JSON) để vẽ ảnh annotate khi có người xem.
+    """
+    # ✅ timestamp = từ filename ESP32
+    ts_from_name = timestamp_from_filename(src)
+    if ts_from_name is None:
+        ts_from_name = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-            # remove input
+    # save output raw (OUTPUT_DIR/YYYY/MM/DD theo timestamp bản ghi)
+    out_name = make_output_name(src, product_name, ts_from_name)
+    try:
+        with tracing.span("save"):
+            save_output(out_name, data=data, src=src)
+    except Exception as e:
+        print(f"[WORKER] Save error: {e}")
+        _frames_failed.inc()
+        if data is None:
+            _fail_input(src, f"save: {e}")
+        else:
+            dedup_gate.forget(camera_id(src))
+        return False
+
+    # bản ghi (và job done) trước, xoá ảnh vào sau: crash ở giữa thì reconcile chỉ cần xoá ảnh vào
+    job_id = jobs.job_id_for(src) if data is None else None
+    brand = product_name if product_name else "Unknown"
+    try:
+        with tracing.span("db_insert"):
+            rid = db_insert(ts_from_name, brand, product_name, conf, out_name, detections=dets, job_id=job_id)
+    except Exception as e:
+        print(f"[WORKER] DB error: {e}")
+        _frames_failed.inc()
+        _remove_output(out_name)
+        if data is None:
+            _fail_input(src, f"db: {e}")
+        else:
+            dedup_gate.forget(camera_id(src))
+        return False
+
+    # remove input
+    if data is None:
+        with tracing.span("remove_input"):
             try:
                 os.remove(src)
             except Exception as e:
                 print(f"[WORKER] Delete src failed: {e}")
+        if job_id is not None:
+            jobs.done(src)
+    with tracing.span("publish"):
+        broadcaster.publish({
+            "id": rid,
+            "timestamp": ts_from_name,
+            "brand": brand,
+            "product_name": product_name or "Unknown",
+            "conf": float(conf or 0.0),
+            "image_path": out_name,
+        })
 
-            # ✅ timestamp = từ filename ESP32
-            ts_from_name = timestamp_from_filename(src)
-            if ts_from_name is None:
-                ts_from_name = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[AI] {product_name} ({conf:.2f}) -> Saved. ts={ts_from_name}")
+    _frames_processed.inc()
+    return True
 
-            brand = product_name if product_name else "Unknown"
-            db_insert(ts_from_name, brand, product_name, conf, out_name)
 
-            print(f"[AI] {product_name} ({conf:.2f}) -> Saved. ts={ts_from_name}")
-            time.sleep(0.05)
+def _read_bytes(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def dedup_check(src: str, data: Optional[bytes] = None,
+                reuse: Optional[Callable[[str, Optional[bytes], Tuple[str, float]], None]] = None) -> bool:
+    """Cổng chống frame trùng. True = frame đã xử lý xong ở đây (bỏ qua hoặc ghi lại kết quả cũ).
+
+    `reuse`: thay cho finish_item khi dùng lại kết quả (chế độ pool đưa vào hàng commit).
+    """
+    if not dedup_gate.enabled:
+        return False
+    cam = camera_id(src)
+    with tracing.span("dedup"):
+        action, last = dedup_gate.check(cam, data if data is not None else _read_bytes(src))
+    if action == "infer":
+        return False
+    if action == "reuse":
+        print(f"[DEDUP] {cam}: same scene -> reuse {last[0]}")
+        _frames_reused.inc()
+        if reuse is not None:
+            reuse(src, data, last)
+        else:
+            finish_item(src, last[0], last[1], data=data)
+    else:
+        print(f"[DEDUP] {cam}: same scene -> skip {os.path.basename(src)}")
+        _frames_skipped.inc()
+        if data is None:
+            jobs.skipped(src)
+            _remove_input(src)
+    return True
+
+
+def process_one(src: str) -> bool:
+    tracing.begin(os.path.basename(src))
+    try:
+        return _process_one(src)
+    finally:
+        tracing.end()
+
+
+def _process_one(src: str) -> bool:
+    update_last_raw(src)
+    if dedup_check(src):
+        return True
+
+    # infer
+    t0 = time.perf_counter()
+    try:
+        product_name, conf, dets = infer_path(src)
+    except Exception as e:
+        print(f"[WORKER] Infer error: {e}")
+        _frames_failed.inc()
+        _fail_input(src, f"infer: {e}")
+        return False
+    seconds = time.perf_counter() - t0
+
+    if not finish_item(src, product_name, conf, dets=detections_json(dets)):
+        return False
+    dedup_gate.record(camera_id(src), (product_name, conf), seconds)
+    return True
+
+
+def process_batch(timeout: float) -> bool:
+    """Xử lý tối đa BATCH_SIZE ảnh ổn định bằng một lần gọi YOLO. Trả về False nếu không có gì để làm."""
+    batch = next_ready(BATCH_SIZE, BATCH_MAX_WAIT, timeout)
+    if not batch:
+        return False
+
+    # một trace cho cả lô: infer là một lần gọi chung, các bước còn lại lặp theo ảnh
+    tracing.begin(f"batch[{len(batch)}] {os.path.basename(batch[0])}")
+    try:
+        _process_batch(batch)
+    finally:
+        tracing.end()
+    return True
+
+
+def _process_batch(batch: List[str]):
+    update_last_raw(batch[-1])
+    batch = [src for src in batch if not dedup_check(src)]
+    if not batch:
+        return
+
+    t0 = time.perf_counter()
+    try:
+        results = infer_batch(batch)
+    except Exception as e:
+        print(f"[WORKER] Infer error: {e}")
+        if len(batch) > 1:
+            # chạy lại từng ảnh để một frame hỏng không kéo cả lô vào retry/dead-letter
+            for src in batch:
+                _process_batch_one(src)
+            return
+        _frames_failed.inc()
+        _fail_input(batch[0], f"infer: {e}")
+        return
+    per_frame = (time.perf_counter() - t0) / len(batch)
+
+    for src, res in zip(batch, results):
+        if res is None:
+            print(f"[WORKER] Infer error: cannot read {src}")
+            _frames_failed.inc()
+            _fail_input(src, "cannot read image")
+            continue
+        product_name, conf, dets = res
+        if finish_item(src, product_name, conf, dets=detections_json(dets)):
+            dedup_gate.record(camera_id(src), (product_name, conf), per_frame)
+
+
+def _process_batch_one(src: str):
+    t0 = time.perf_counter()
+    try:
+        res = infer_batch([src])[0]
+    except Exception as e:
+        print(f"[WORKER] Infer error: {e}")
+        _frames_failed.inc()
+        _fail_input(src, f"infer: {e}")
+        return
+    if res is None:
+        _frames_failed.inc()
+        _fail_input(src, "cannot read image")
+        return
+    product_name, conf, dets = res
+    seconds = time.perf_counter() - t0
+    if finish_item(src, product_name, conf, dets=detections_json(dets)):
+        dedup_gate.record(camera_id(src), (product_name, conf), seconds)
+
+
+def process_disk(timeout: float) -> bool:
+    """Một bước xử lý ảnh trên đĩa (INPUT_DIR). Trả về False nếu không có ảnh nào."""
+    if BATCH_SIZE > 1:
+        return process_batch(timeout)
+    items = next_ready(1, 0.0, timeout)
+    if not items:
+        return False
+    process_one(items[0])
+    return True
+
+
+def process_memory(timeout: float) -> bool:
+    """Một bước xử lý ảnh từ hàng đợi RAM: decode đúng một lần, ghi đĩa đúng một lần."""
+    try:
+        filename, data = mem_queue.get(timeout=timeout) if timeout > 0 else mem_queue.get_nowait()
+    except queue.Empty:
+        return False
+
+    tracing.begin(os.path.basename(filename))
+    try:
+        _process_memory(filename, data)
+    finally:
+        tracing.end()
+    return True
+
+
+def _process_memory(filename: str, data: bytes):
+    update_last_raw(filename, data)
+    if dedup_check(filename, data):
+        return
+
+    try:
+        img = decode_image(data)
+    except Exception as e:
+        print(f"[WORKER] Decode error {filename}: {e}")
+        _frames_failed.inc()
+        dedup_gate.forget(camera_id(filename))
+        return
+
+    t0 = time.perf_counter()
+    try:
+        product_name, conf, dets = infer_image(img)
+    except Exception as e:
+        print(f"[WORKER] Infer error: {e}")
+        _frames_failed.inc()
+        dedup_gate.forget(camera_id(filename))
+        return
+    seconds = time.perf_counter() - t0
+
+    if finish_item(filename, product_name, conf, data=data, dets=detections_json(dets)):
+        dedup_gate.record(camera_id(filename), (product_name, conf), seconds)
+
+
+def _pool_commit(src: str, data: Optional[bytes], fut):
+    # trace của luồng commit: infer (đo trong worker pool) + các bước ghi kết quả
+    tracing.begin(os.path.basename(src))
+    try:
+        _commit_result(src, data, fut)
+    finally:
+        tracing.end()
+
+
+def _commit_result(src: str, data: Optional[bytes], fut):
+    err = fut.exception()
+    if err is not None:
+        print(f"[WORKER] Infer error: {err}")
+        _frames_failed.inc()
+        if data is None:
+            _fail_input(src, f"infer: {err}")
+        else:
+            dedup_gate.forget(camera_id(src))
+        return
+    product_name, conf, seconds, dets = fut.result()
+    tracing.add("infer", seconds)
+    if WORKER_MODE == "process":
+        # process con không chung bộ đếm với process này -> ghi thời gian suy luận nó trả về
+        INFER_SECONDS.observe(seconds)
+    update_last_raw(src, data)
+    if finish_item(src, product_name, conf, data=data, dets=dets):
+        dedup_gate.record(camera_id(src), (product_name, conf), seconds)
+
+
+def _pool_reuse(src: str, data: Optional[bytes], last: Tuple[str, float]):
+    # ghi qua luồng commit của pool để id vẫn theo thứ tự chụp và chỉ một luồng gọi finish_item
+    _pool.submit_done(src, data, last, _pool_commit_reuse)
+
+
+def _pool_commit_reuse(src: str, data: Optional[bytes], fut):
+    tracing.begin(os.path.basename(src))
+    try:
+        product_name, conf = fut.result()
+        update_last_raw(src, data)
+        finish_item(src, product_name, conf, data=data)
+    finally:
+        tracing.end()
+
+
+def pool_loop():
+    """Chế độ pool: luồng này chỉ nhận ảnh và phân phát; worker suy luận song song, commit theo thứ tự."""
+    global _pool
+    _pool = InferencePool(WORKERS, WORKER_MODE, _pool_commit)
+    print(f"[WORKER] Pool: {WORKERS} {WORKER_MODE} workers")
+
+    try:
+        while not _stop.is_set():
+            # luồng điều phối không mở trace; bỏ span chờ (file_stable, dedup) để không dồn lại
+            tracing.discard()
+            try:
+                did = False
+                if INMEMORY_INGEST:
+                    try:
+                        filename, data = mem_queue.get_nowait()
+                        if not dedup_check(filename, data, _pool_reuse):
+                            _pool.submit(filename, data)
+                        did = True
+                    except queue.Empty:
+                        pass
+
+                timeout = 0.0 if INMEMORY_INGEST else POLL_SECONDS
+                for src in next_ready(WORKERS, 0.0, timeout, exclude=_pool.claimed()):
+                    if not dedup_check(src, reuse=_pool_reuse):
+                        _pool.submit(src)
+                    did = True
+
+                if not did:
+                    if INMEMORY_INGEST:
+                        try:
+                            filename, data = mem_queue.get(timeout=POLL_SECONDS)
+                            if not dedup_check(filename, data, _pool_reuse):
+                                _pool.submit(filename, data)
+                        except queue.Empty:
+                            pass
+                    elif _watcher is None:
+                        _stop.wait(POLL_SECONDS)
+
+            except Exception as e:
+                print(f"[WORKER] Loop Error: {e}")
+                _stop.wait(1.0)
+    finally:
+        _pool.shutdown()
+
+
+def wait_for_model() -> bool:
+    """Chờ model nạp + warmup xong; ảnh tới trong lúc chờ vẫn nằm trong hàng đợi, không bị bỏ."""
+    logged = None
+    failures = 0
+    while not _stop.is_set():
+        if wait_model_ready(1.0):
+            if logged:
+                print("[WORKER] Model ready")
+            return True
+        state = model_status()["state"]
+        if state != logged:
+            print(f"[WORKER] Waiting for model ({state})...")
+            logged = state
+        if state == "failed":
+            # nạp lỗi: không xử lý (và không xoá) ảnh nào, nạp lại với backoff mũ
+            failures += 1
+            delay = min(MODEL_RETRY_MAX, MODEL_RETRY_BASE * 2 ** (failures - 1))
+            print(f"[WORKER] Model load failed ({failures}x) -> retry in {delay:g}s")
+            if _stop.wait(delay):
+                break
+            start_model_loading()
+    return False
+
+
+def worker_loop():
+    print(f"[WORKER] Watching: {INPUT_DIR}")
+    print(f"[WORKER] Output (RAW IMAGES): {OUTPUT_DIR}")
+    if BATCH_SIZE > 1:
+        print(f"[WORKER] Batch mode: size={BATCH_SIZE} max_wait={BATCH_MAX_WAIT}s")
+    if INMEMORY_INGEST:
+        print(f"[WORKER] In-memory ingest: queue={MEM_QUEUE_SIZE}")
+    start_watcher()
+    if JOB_QUEUE:
+        try:
+            jobs.reconcile()
+        except Exception as e:
+            print(f"[WORKER] Reconcile error: {e}")
+    if not wait_for_model():
+        return
+
+    if WORKERS > 1:
+        pool_loop()
+        return
+
+    while not _stop.is_set():
+        try:
+            if INMEMORY_INGEST:
+                # xen kẽ RAM và đĩa; khi cả hai rỗng thì chờ trên hàng đợi RAM
+                did = process_memory(0.0)
+                did = process_disk(0.0) or did
+                if not did:
+                    process_memory(POLL_SECONDS)
+                continue
+
+            if not process_disk(POLL_SECONDS):
+                # watcher đã tự chờ POLL_SECONDS trong get_many
+                if _watcher is None:
+                    _stop.wait(POLL_SECONDS)
+                continue
+
+            _stop.wait(0.05)
 
         except Exception as e:
             print(f"[WORKER] Loop Error: {e}")
-            time.sleep(1.0)
+            _stop.wait(1.0)
 
 
 def start_worker_thread():
-    t = threading.Thread(target=worker_loop, daemon=True)
-    t.start()
-    return t
+    global _thread
+    _stop.clear()
+    _thread = threading.Thread(target=worker_loop, name="worker", daemon=True)
+    _thread.start()
+    atexit.register(stop_worker)
+    return _thread
+
+
+def stop_worker(timeout: float = 10.0):
+    """Dừng worker: ngừng nhận ảnh, chờ các ảnh đang xử lý trong pool commit xong."""
+    _stop.set()
+    if _thread is not None and _thread is not threading.current_thread():
+        _thread.join(timeout=timeout)
+    if _watcher is not None:
+        _watcher.stop()
@@ -0,0 +1,100 @@
+"""So sánh CPU mỗi frame của worker: vẽ annotate ngay (cách cũ) vs chỉ lưu hình học detection.
+
+Mặc định dùng Detections giả (không cần model) để đo riêng phần hậu xử lý; với --backend
+thì đo cả suy luận thật. Cuối cùng đo /annotated/<id> lần đầu (vẽ) và lần sau (cache đĩa).
+Chạy:  python -m bench.bench_annotate --frames 200 --size 1280x720 [--backend onnx]
+"""
+import os
+import sys
+import time
+import atexit
+import shutil
+import argparse
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="bench_annotate_")
+atexit.register(shutil.rmtree, _tmp, ignore_errors=True)
+os.environ["DB_PATH"] = os.path.join(_tmp, "bench.db")
+os.environ["OUTPUT_DIR"] = os.path.join(_tmp, "out")
+os.environ["ANNOTATED_CACHE_DIR"] = os.path.join(_tmp, "ann")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+from flask import Flask
+
+from app.config import OUTPUT_DIR
+from app.backends import Detections, create_backend
+from app.db import db_init, db_insert
+from app.routes import bp
+
+NAMES = {0: "7up", 1: "c2", 2: "Warrior"}
+
+
+class StubBackend:
+    name = "stub"
+    names = NAMES
+
+    def predict(self, imgs):
+        out = []
+        for img in imgs:
+            h, w = img.shape[:2]
+            obb = np.array([[w * 0.3, h * 0.5, w * 0.2, h * 0.4, 0.2],
+                            [w * 0.6, h * 0.4, w * 0.15, h * 0.5, -0.1],
+                            [w * 0.8, h * 0.6, w * 0.1, h * 0.3, 0.0]], np.float32)
+            out.append(Detections(np.array([0, 1, 2]), np.array([0.91, 0.8, 0.55]), obb=obb))
+        return out
+
+
+def cpu_per_frame(backend, imgs, frames: int, annotate: bool) -> float:
+    t0 = time.process_time()
+    for i in range(frames):
+        img = imgs[i % len(imgs)]
+        dets = backend.predict([img])[0]
+        if annotate:
+            dets.plot(img, backend.names)
+        else:
+            dets.to_json(backend.names)
+    return (time.process_time() - t0) / frames * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--frames", type=int, default=200)
+    ap.add_argument("--size", default="1280x720")
+    ap.add_argument("--backend", default="")
+    args = ap.parse_args()
+
+    w, h = (int(v) for v in args.size.split("x"))
+    rng = np.random.default_rng(0)
+    imgs = [rng.integers(0, 255, size=(h, w, 3), dtype=np.uint8) for _ in range(4)]
+    backend = create_backend(args.backend) if args.backend else StubBackend()
+    backend.predict(imgs[:1])
+
+    old = cpu_per_frame(backend, imgs, args.frames, annotate=True)
+    new = cpu_per_frame(backend, imgs, args.frames, annotate=False)
+    print(f"backend={backend.name} size={w}x{h} frames={args.frames}")
+    print(f"plot on every frame : {old:8.3f} ms CPU/frame")
+    print(f"store geometry only : {new:8.3f} ms CPU/frame  (-{old - new:.3f} ms, -{(old - new) / old:.0%})")
+
+    db_init()
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    cv2.imwrite(os.path.join(OUTPUT_DIR, "x.jpg"), imgs[0])
+    dets = StubBackend().predict(imgs[:1])[0]
+    ids = [db_insert("2026-01-01 12:00:00", "x", "7up", 0.9, "x.jpg", detections=dets.to_json(NAMES))
+           for _ in range(20)]
+
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    client = app.test_client()
+    for label in ("render (cold)", "cached (warm)"):
+        t0 = time.perf_counter()
+        for rid in ids:
+            resp = client.get(f"/annotated/{rid}")
+            assert resp.status_code == 200, resp.status_code
+            resp.close()
+        print(f"/annotated {label:<14}: {(time.perf_counter() - t0) / len(ids) * 1000:8.2f} ms/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Đo độ trễ mỗi frame và bộ nhớ (RSS) của từng backend suy luận trên CPU.
+
+Mỗi backend chạy trong một process riêng để RSS không lẫn nhau (import torch chiếm nhiều RAM).
+Chạy:  python -m bench.bench_backends --backends torch,onnx --frames 100 [--images thu_muc_anh]
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+
+def child(backend: str, frames: int, images: str):
+    import cv2
+    import numpy as np
+
+    from app.config import EXTS
+    from app.backends import create_backend
+
+    base = rss_mb()
+    t0 = time.perf_counter()
+    be = create_backend(backend)
+    load_s = time.perf_counter() - t0
+
+    if images:
+        paths = sorted(p for p in glob.glob(os.path.join(images, "*"))
+                       if os.path.splitext(p)[1].lower() in EXTS)[:frames]
+        imgs = [cv2.imread(p) for p in paths]
+    else:
+        rng = np.random.default_rng(0)
+        imgs = [rng.integers(0, 255, size=(480, 640, 3), dtype=np.uint8) for _ in range(min(frames, 16))]
+
+    t1 = time.perf_counter()
+    be.predict(imgs[:1])
+    first_ms = (time.perf_counter() - t1) * 1000
+
+    lat = []
+    for i in range(frames):
+        t = time.perf_counter()
+        be.predict([imgs[i % len(imgs)]])
+        lat.append((time.perf_counter() - t) * 1000)
+
+    print(json.dumps({
+        "backend": backend,
+        "load_s": round(load_s, 3),
+        "first_ms": round(first_ms, 1),
+        "p50_ms": round(pct(lat, 50), 2),
+        "p95_ms": round(pct(lat, 95), 2),
+        "fps": round(1000 / (sum(lat) / len(lat)), 1),
+        "rss_base_mb": round(base, 1),
+        "rss_mb": round(rss_mb(), 1),
+        "rss_peak_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backends", default="torch,onnx")
+    ap.add_argument("--frames", type=int, default=100)
+    ap.add_argument("--images", default="")
+    ap.add_argument("--child", default="")
+    args = ap.parse_args()
+
+    if args.child:
+        child(args.child, args.frames, args.images)
+        return
+
+    rows = []
+    for name in [b for b in args.backends.split(",") if b]:
+        cmd = [sys.executable, "-m", "bench.bench_backends", "--child", name,
+               "--frames", str(args.frames), "--images", args.images]
+        proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"{name}: FAILED\n{proc.stderr.strip().splitlines()[-1] if proc.stderr else ''}")
+            continue
+        rows.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    cols = ["backend", "load_s", "first_ms", "p50_ms", "p95_ms", "fps", "rss_mb", "rss_peak_mb"]
+    print(" ".join(f"{c:>11}" for c in cols))
+    for r in rows:
+        print(" ".join(f"{r[c]:>11}" for c in cols))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Đo số ảnh/giây của YOLO trên CPU theo kích thước lô.
+
+Chạy:  python -m bench.bench_batch --sizes 1,2,4,8 --frames 64 [--images thu_muc_anh]
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+import tempfile
+
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+from app.config import EXTS
+from app.model import load_model, infer_batch
+
+
+def make_synthetic(folder: str, n: int, w: int = 640, h: int = 480):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(n):
+        img = rng.integers(0, 255, size=(h, w, 3), dtype=np.uint8)
+        p = os.path.join(folder, f"cam_20260101_{i:06d}.jpg")
+        cv2.imwrite(p, img)
+        paths.append(p)
+    return paths
+
+
+def run(paths, batch_size: int) -> float:
+    t0 = time.perf_counter()
+    for i in range(0, len(paths), batch_size):
+        infer_batch(paths[i:i + batch_size])
+    return len(paths) / (time.perf_counter() - t0)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1,2,4,8,16")
+    ap.add_argument("--frames", type=int, default=64)
+    ap.add_argument("--images", default="")
+    args = ap.parse_args()
+
+    load_model()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.images:
+            paths = sorted(p for p in glob.glob(os.path.join(args.images, "*"))
+                           if os.path.splitext(p)[1].lower() in EXTS)[:args.frames]
+        else:
+            paths = make_synthetic(tmp, args.frames)
+
+        # warmup
+        infer_batch(paths[:1])
+
+        print(f"{'batch':>6} {'img/s':>8}")
+        for bs in [int(x) for x in args.sizes.split(",") if x.strip()]:
+            print(f"{bs:>6} {run(paths, bs):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
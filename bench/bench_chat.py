@@ -0,0 +1,182 @@
+"""Đo độ trễ /api/chat với model giả có độ trễ cố định: lần đầu, lần lặp (memo) và khi quá timeout.
+
+Model giả trả lời sau --latency giây; lần "timeout" đặt độ trễ lớn hơn GEMINI_TIMEOUT
+để kiểm tra đường fallback trả về đúng hạn (model giả tự huỷ sau GEMINI_TIMEOUT như client
+thật với HttpOptions(timeout)), rồi một lượt bình thường ngay sau đó để chắc các luồng gọi
+model đã được trả lại. Với /api/chat/stream, model giả gửi
+--chunks đoạn rải đều trong --latency giây; đo thời gian tới token đầu (ttft) và tổng,
+kể cả lượt có hai tool call chạy song song.
+Phần đạt/không đạt (dùng lại client, memo, timeout) nằm ở tests/test_chat.py.
+Chạy:  python -m bench.bench_chat --calls 50 --latency 0.4
+"""
+import os
+import sys
+import time
+import atexit
+import shutil
+import argparse
+import tempfile
+import threading
+from types import SimpleNamespace
+
+if __name__ == "__main__":
+    # chạy trực tiếp: DB tạm riêng; tests import model giả từ đây thì dùng DB của conftest
+    _tmp = tempfile.mkdtemp(prefix="bench_chat_")
+    atexit.register(shutil.rmtree, _tmp, ignore_errors=True)
+    os.environ["DB_PATH"] = os.path.join(_tmp, "bench.db")
+    os.environ.setdefault("GEMINI_TIMEOUT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from app.config import GEMINI_TIMEOUT
+from app.db import db_init, db_insert
+from app.routes import bp
+import app.gemini_chat as gemini_chat
+
+PRODUCTS = ["7up", "Aquafina", "c2", "Warrior", "Trà Xanh Không Độ"]
+
+
+def _ns(**kw):
+    return SimpleNamespace(**kw)
+
+
+# Thay google.genai.types: chỉ cần các constructor nhận keyword
+stub_types = SimpleNamespace(
+    Tool=_ns, FunctionDeclaration=_ns, Content=_ns, Part=_ns,
+    FunctionResponse=_ns, GenerateContentConfig=_ns,
+)
+
+
+def _resp(*parts):
+    return _ns(candidates=[_ns(content=_ns(role="model", parts=list(parts)))])
+
+
+def _text(t):
+    return _ns(text=t, function_call=None)
+
+
+def _call(name, **args):
+    return _ns(text=None, function_call=_ns(name=name, args=args))
+
+
+class StubModels:
+    def __init__(self):
+        self.latency = 0.0
+        self.chunks = 8
+        self.calls = 0
+
+    def _wait(self, seconds: float):
+        # client thật (HttpOptions timeout) huỷ request sau GEMINI_TIMEOUT
+        timeout = gemini_chat.GEMINI_TIMEOUT
+        if seconds > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("request timed out")
+        time.sleep(seconds)
+
+    def generate_content(self, model, contents, config):
+        self.calls += 1
+        self._wait(self.latency)
+        return _resp(_text("Thống kê: 7up dẫn đầu."))
+
+    def generate_content_stream(self, model, contents, config):
+        self.calls += 1
+        question = contents[0].parts[0].text
+        # lượt đầu của câu "so sánh": model yêu cầu hai tool cùng lúc
+        if "so sánh" in question and len(contents) == 1:
+            self._wait(self.latency / self.chunks)
+            yield _resp(_call("compare_products", products=PRODUCTS),
+                        _call("analyze_trend", product="7up"))
+            return
+        for i in range(self.chunks):
+            self._wait(self.latency / self.chunks)
+            yield _resp(_text(f"đoạn {i} "))
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+
+def run(client, questions):
+    times = []
+    for q in questions:
+        t0 = time.perf_counter()
+        resp = client.post("/api/chat", json={"question": q})
+        assert resp.status_code == 200, resp.status_code
+        times.append((time.perf_counter() - t0) * 1000)
+    return times
+
+
+def run_parallel(client, questions):
+    """Gửi mọi câu hỏi cùng lúc (mỗi câu một luồng), trả về thời gian từng request."""
+    times = [0.0] * len(questions)
+
+    def one(i):
+        times[i] = run(client, [questions[i]])[0]
+
+    threads = [threading.Thread(target=one, args=(i,)) for i in range(len(questions))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return times
+
+
+def run_stream(client, questions):
+    ttft, total = [], []
+    for q in questions:
+        t0 = time.perf_counter()
+        resp = client.post("/api/chat/stream", json={"question": q}, buffered=False)
+        first = None
+        body = b""
+        for chunk in resp.response:
+            body += chunk
+            if first is None and b"event: token" in body:
+                first = time.perf_counter()
+        resp.close()
+        assert b"event: done" in body, body[-200:]
+        ttft.append((first - t0) * 1000)
+        total.append((time.perf_counter() - t0) * 1000)
+    return ttft, total
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--calls", type=int, default=50)
+    ap.add_argument("--latency", type=float, default=0.4)
+    args = ap.parse_args()
+
+    db_init()
+    for i in range(500):
+        db_insert(f"2026-01-{1 + i % 28:02d} 12:00:00", "x", PRODUCTS[i % len(PRODUCTS)], 0.9, f"{i}.jpg")
+
+    models = StubModels()
+    gemini_chat.set_client(_ns(models=models), stub_types)
+    gemini_chat.USE_GEMINI, gemini_chat.GEMINI_API_KEY = True, "stub"
+
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    client = app.test_client()
+
+    models.latency = args.latency
+    cold = run(client, [f"câu hỏi {i}" for i in range(args.calls)])
+    warm = run(client, [f"câu hỏi {i}" for i in range(args.calls)])
+    s_ttft, s_total = run_stream(client, [f"luồng {i}" for i in range(args.calls)])
+    t_ttft, t_total = run_stream(client, [f"so sánh {i}" for i in range(min(args.calls, 10))])
+    models.latency = GEMINI_TIMEOUT + 1
+    # chiếm hết các luồng gọi model cùng lúc; lượt sau đó phải có luồng ngay (không chờ thêm timeout)
+    slow = run_parallel(client, [f"chậm {i}" for i in range(gemini_chat.GEMINI_MAX_CONCURRENCY)])
+    models.latency = args.latency
+    after = run(client, ["sau timeout"])
+
+    print(f"{'case':<13} {'n':>4} {'p50 ms':>9} {'p95 ms':>9}")
+    for name, xs in (("cold", cold), ("memo", warm), ("timeout", slow), ("after", after),
+                     ("stream ttft", s_ttft), ("stream total", s_total),
+                     ("tools ttft", t_ttft), ("tools total", t_total)):
+        print(f"{name:<13} {len(xs):>4} {pct(xs, 50):>9.1f} {pct(xs, 95):>9.1f}")
+    print(f"model calls: {models.calls}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""So sánh thông lượng insert/query: mở kết nối mỗi lần gọi (cách cũ) vs pool + group commit.
+
+Chạy:  python -m bench.bench_db --rows 2000 --threads 1,4,8
+"""
+import os
+import sys
+import time
+import atexit
+import shutil
+import argparse
+import tempfile
+import threading
+
+_tmp = tempfile.mkdtemp(prefix="bench_db_")
+atexit.register(shutil.rmtree, _tmp, ignore_errors=True)
+os.environ["DB_PATH"] = os.path.join(_tmp, "bench.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlite3
+
+from app.config import DB_PATH
+from app.db import db_init, db_insert, db_query_newer, db_stats
+
+PRODUCTS = ["7up", "Aquafina", "c2", "Warrior", "Trà Xanh Không Độ"]
+
+
+def legacy_connect():
+    con = sqlite3.connect(DB_PATH, check_same_thread=False)
+    con.row_factory = sqlite3.Row
+    con.execute("PRAGMA journal_mode=WAL;")
+    con.execute("PRAGMA synchronous=NORMAL;")
+    con.execute("PRAGMA temp_store=MEMORY;")
+    con.execute("PRAGMA busy_timeout=3000;")
+    return con
+
+
+def legacy_insert(ts, brand, product_name, conf, image_path):
+    con = legacy_connect()
+    cur = con.cursor()
+    cur.execute("INSERT INTO records (timestamp, brand, product_name, conf, image_path) VALUES (?, ?, ?, ?, ?)",
+                (ts, brand, product_name, conf, image_path))
+    con.commit()
+    rid = cur.lastrowid
+    con.close()
+    return rid
+
+
+def legacy_query(last_id):
+    con = legacy_connect()
+    rows = con.execute("SELECT * FROM records WHERE id > ? ORDER BY id ASC LIMIT 50", (last_id,)).fetchall()
+    con.execute("SELECT product_name, COUNT(*) FROM records GROUP BY product_name").fetchall()
+    con.close()
+    return rows
+
+
+def new_query(last_id):
+    db_query_newer("", "", "", last_id=last_id, limit=50)
+    db_stats("", "", "", topk=30)
+
+
+def run_threads(n_threads: int, n_ops: int, fn) -> float:
+    per = max(1, n_ops // n_threads)
+
+    def _work(k):
+        for i in range(per):
+            fn(k, i)
+
+    ts = [threading.Thread(target=_work, args=(k,)) for k in range(n_threads)]
+    t0 = time.perf_counter()
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return (per * n_threads) / (time.perf_counter() - t0)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=2000)
+    ap.add_argument("--queries", type=int, default=2000)
+    ap.add_argument("--threads", default="1,4,8")
+    args = ap.parse_args()
+
+    db_init()
+
+    def ins(fn):
+        return lambda k, i: fn("2026-01-01 12:00:00", "x", PRODUCTS[i % len(PRODUCTS)], 0.9, f"{k}_{i}.jpg")
+
+    print(f"{'op':<8} {'threads':>7} {'legacy/s':>10} {'new/s':>10}")
+    for n in [int(x) for x in args.threads.split(",") if x.strip()]:
+        old = run_threads(n, args.rows, ins(legacy_insert))
+        new = run_threads(n, args.rows, ins(db_insert))
+        print(f"{'insert':<8} {n:>7} {old:>10.0f} {new:>10.0f}")
+    for n in [int(x) for x in args.threads.split(",") if x.strip()]:
+        old = run_threads(n, args.queries, lambda k, i: legacy_query(i))
+        new = run_threads(n, args.queries, lambda k, i: new_query(i))
+        print(f"{'query':<8} {n:>7} {old:>10.0f} {new:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Kiểm tra bộ nhớ đỉnh của /export_excel không tăng theo số dòng.
+
+Tạo DB giả N dòng (mặc định 1 triệu), xuất ở N/10 và N dòng, so sánh đỉnh tracemalloc.
+Chạy:  python -m bench.bench_export --rows 1000000 --formats csv,csv.gz,xlsx
+"""
+import os
+import sys
+import time
+import atexit
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+_tmp = tempfile.mkdtemp(prefix="bench_export_")
+atexit.register(shutil.rmtree, _tmp, ignore_errors=True)
+os.environ["DB_PATH"] = os.path.join(_tmp, "bench.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from app.db import db_init, db_connect
+from app.routes import bp
+
+PRODUCTS = ["7up", "Aquafina", "c2", "Warrior", "Trà Xanh Không Độ"]
+
+
+def fill(n: int):
+    con = db_connect()
+    con.execute("DELETE FROM records")
+    con.executemany(
+        "INSERT INTO records (timestamp, brand, product_name, conf, image_path) VALUES (?, ?, ?, ?, ?)",
+        ((f"2026-01-{1 + i % 28:02d} {i % 24:02d}:00:00", "x", PRODUCTS[i % len(PRODUCTS)], 0.9, f"{i}.jpg")
+         for i in range(n)),
+    )
+    con.commit()
+    con.close()
+
+
+def measure(client, fmt: str):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    resp = client.get(f"/export_excel?format={fmt}", buffered=False)
+    size = 0
+    for chunk in resp.response:
+        size += len(chunk)
+    resp.close()
+    dt = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, size, dt
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--formats", default="csv,csv.gz,xlsx")
+    args = ap.parse_args()
+
+    db_init()
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    client = app.test_client()
+
+    formats = [f for f in args.formats.split(",") if f]
+    peaks = {}
+    for n in (args.rows // 10, args.rows):
+        fill(n)
+        for fmt in formats:
+            peak, size, dt = measure(client, fmt)
+            peaks[(fmt, n)] = peak
+            print(f"{fmt:<7} rows={n:>8} peak={peak / 1e6:7.2f} MB out={size / 1e6:8.2f} MB {dt:6.1f}s")
+
+    ok = True
+    for fmt in formats:
+        small, big = peaks[(fmt, args.rows // 10)], peaks[(fmt, args.rows)]
+        # 10x số dòng: đỉnh bộ nhớ phải gần như không đổi
+        if big > small * 1.5 + 2e6:
+            print(f"FAIL {fmt}: peak grew {small / 1e6:.2f} -> {big / 1e6:.2f} MB")
+            ok = False
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""Benchmark đầu-cuối của đường ingest: /api/upload_cam -> worker -> suy luận -> db_insert -> /api/stream.
+
+Chạy server thật (werkzeug, nhiều luồng) trên cổng ngẫu nhiên với backend giả "stub"
+(bench/stub_backend.py, không cần weights/mạng), upload JPEG tổng hợp qua HTTP và nghe
+/api/stream như dashboard. Báo cáo thông lượng, phân vị độ trễ từng giai đoạn, độ trễ
+upload -> sự kiện SSE, RSS đỉnh; ghi kết quả JSON (--out) để so sánh giữa các lần chạy
+(--compare file_cu.json).
+
+Các nút vặn của app chỉnh bằng biến môi trường như khi chạy thật, vd.:
+  INMEMORY_INGEST=1 WORKERS=4 BATCH_SIZE=8 DEDUP_MODE=skip STUB_LATENCY_MS=50
+Backend thật: MODEL_BACKEND=onnx (độ trễ "infer" khi đó không được đo riêng).
+Chạy:  python -m bench.bench_ingest --frames 500 --clients 4 [--rate 20] [--compare bench/results/x.json]
+"""
+import os
+import io
+import sys
+import json
+import time
+import uuid
+import atexit
+import shutil
+import logging
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+import http.client
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# process con của pool (spawn) import lại module này: dùng chung thư mục tạm với process cha
+if "BENCH_INGEST_TMP" not in os.environ:
+    os.environ["BENCH_INGEST_TMP"] = tempfile.mkdtemp(prefix="bench_ingest_")
+    atexit.register(shutil.rmtree, os.environ["BENCH_INGEST_TMP"], ignore_errors=True)
+_tmp = os.environ["BENCH_INGEST_TMP"]
+os.environ["DB_PATH"] = os.path.join(_tmp, "bench.db")
+os.environ["INPUT_DIR"] = os.path.join(_tmp, "in")
+os.environ["OUTPUT_DIR"] = os.path.join(_tmp, "out")
+os.environ["ANNOTATED_CACHE_DIR"] = os.path.join(_tmp, "ann")
+os.environ["THUMB_CACHE_DIR"] = os.path.join(_tmp, "thumbs")
+os.environ.setdefault("MODEL_BACKEND", "stub")
+# keep-alive ngắn để luồng nghe SSE thấy cờ dừng sớm
+os.environ.setdefault("SSE_KEEPALIVE_SECONDS", "1")
+
+import cv2
+import numpy as np
+
+from bench import stub_backend  # noqa: F401  (đăng ký backend "stub")
+
+KNOBS = ("MODEL_BACKEND", "INMEMORY_INGEST", "INGEST_MODE", "WORKERS", "WORKER_MODE", "BATCH_SIZE",
+         "BATCH_MAX_WAIT", "DEDUP_MODE", "DB_COMMIT_MS", "DB_COMMIT_ROWS", "POLL_SECONDS", "STABLE_SECONDS",
+         "STUB_LATENCY_MS", "STUB_PER_IMAGE_MS", "STUB_JITTER_MS")
+
+
+def pct(xs, p):
+    if not xs:
+        return None
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+
+def summary(xs_seconds):
+    ms = [x * 1000 for x in xs_seconds]
+    out = {"n": len(ms)}
+    for p in (50, 90, 95, 99):
+        v = pct(ms, p)
+        out[f"p{p}"] = round(v, 3) if v is not None else None
+    out["max"] = round(max(ms), 3) if ms else None
+    return out
+
+
+def make_frames(n: int, w: int, h: int):
+    """n JPEG khác nhau (khối màu dịch dần + nhiễu) để dedup không gộp hết."""
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(n):
+        img = np.full((h, w, 3), 180, np.uint8)
+        x = (i * 37) % max(1, w - w // 4)
+        cv2.rectangle(img, (x, h // 4), (x + w // 4, h * 3 // 4), (40 + i * 13 % 200, 90, 200), -1)
+        img = np.clip(img + rng.normal(0, 4, img.shape), 0, 255).astype(np.uint8)
+        frames.append(cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes())
+    return frames
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return ""
+
+
+def peak_rss_mb() -> dict:
+    # Linux: ru_maxrss tính bằng KB; children chỉ có giá trị khi process con đã thoát
+    return {"self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)}
+
+
+class Timeline:
+    """Mốc thời gian theo từng frame (khoá = tên file upload không đuôi)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.marks = {}
+        self.stage = {"save": [], "db_insert": []}
+
+    def mark(self, key, name, t=None):
+        with self.lock:
+            self.marks.setdefault(key, {})[name] = t if t is not None else time.perf_counter()
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.stage[stage].append(seconds)
+
+    def deltas(self, a, b):
+        with self.lock:
+            return [m[b] - m[a] for m in self.marks.values() if a in m and b in m]
+
+
+def instrument(tl: Timeline):
+    """Bọc các bước của worker để đo thời gian (không đổi hành vi)."""
+    import app.worker as worker
+
+    def timed(stage, fn):
+        def wrapper(*a, **kw):
+            t0 = time.perf_counter()
+            try:
+                return fn(*a, **kw)
+            finally:
+                tl.add(stage, time.perf_counter() - t0)
+        return wrapper
+
+    finish_item = worker.finish_item
+
+    def finish_wrapper(src, *a, **kw):
+        key = os.path.splitext(os.path.basename(src))[0]
+        tl.mark(key, "commit_start")
+        try:
+            return finish_item(src, *a, **kw)
+        finally:
+            tl.mark(key, "commit_end")
+
+    worker.save_output = timed("save", worker.save_output)
+    worker.db_insert = timed("db_insert", worker.db_insert)
+    worker.finish_item = finish_wrapper
+
+
+def multipart(filename: str, data: bytes):
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    body.write(f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+               f"Content-Type: image/jpeg\r\n\r\n".encode())
+    body.write(data)
+    body.write(f"\r\n--{boundary}--\r\n".encode())
+    return body.getvalue(), f"multipart/form-data; boundary={boundary}"
+
+
+def uploader(port, jobs, tl: Timeline, interval: float, errors: list):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    for due, key, data in jobs:
+        if interval:
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        body, ctype = multipart(f"{key}.jpg", data)
+        t0 = time.perf_counter()
+        try:
+            conn.request("POST", "/api/upload_cam", body=body, headers={"Content-Type": ctype})
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status != 200:
+                errors.append(resp.status)
+                continue
+        except Exception as e:
+            errors.append(str(e))
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            continue
+        tl.mark(key, "upload_start", t0)
+        tl.mark(key, "upload_end")
+    conn.close()
+
+
+def sse_listener(port, tl: Timeline, ready: threading.Event, stop: threading.Event, seen: list):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    conn.request("GET", "/api/stream")
+    resp = conn.getresponse()
+    ready.set()
+    while not stop.is_set():
+        line = resp.readline()
+        if not line:
+            break
+        if line.startswith(b"data: "):
+            rec = json.loads(line[6:])
+            # image_path = YYYY/MM/DD/<giờ>_<sản phẩm>_<tên upload>.jpg; tên upload có dạng camX_YYYYMMDD_HHMMSS
+            stem = os.path.splitext(os.path.basename(rec.get("image_path", "")))[0]
+            key = "_".join(stem.split("_")[-3:])
+            tl.mark(key, "sse")
+            seen.append(key)
+    conn.close()
+
+
+def run(args) -> dict:
+    from werkzeug.serving import make_server
+
+    import app.worker as worker
+    from app import create_app
+    from app.config import INPUT_DIR
+    from app.model import wait_model_ready
+
+    tl = Timeline()
+    instrument(tl)
+    app = create_app(start_services=True)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    port = server.server_port
+    threading.Thread(target=server.serve_forever, daemon=True, name="bench-http").start()
+
+    t_load = time.perf_counter()
+    if not wait_model_ready(60):
+        raise RuntimeError("model not ready")
+    load_seconds = time.perf_counter() - t_load
+    stub_backend.predict_seconds.clear()  # bỏ lần warmup
+
+    frames = make_frames(min(args.frames, args.distinct), *args.size)
+    cams = max(1, args.cameras)
+    jobs = []
+    for i in range(args.frames):
+        # mỗi camera một frame/giây theo timestamp trong tên file
+        ts = datetime(2026, 1, 1) + timedelta(seconds=i // cams)
+        jobs.append([0.0, f"cam{i % cams}_{ts:%Y%m%d_%H%M%S}", frames[i % len(frames)]])
+
+    stop = threading.Event()
+    ready = threading.Event()
+    seen = []
+    listener = threading.Thread(target=sse_listener, args=(port, tl, ready, stop, seen), daemon=True)
+    listener.start()
+    ready.wait(5)
+
+    interval = 1.0 / args.rate if args.rate > 0 else 0.0
+    t0 = time.perf_counter()
+    for i, job in enumerate(jobs):
+        job[0] = t0 + i * interval
+    errors = []
+    threads = [threading.Thread(target=uploader, args=(port, jobs[c::args.clients], tl, interval, errors))
+               for c in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    t_uploaded = time.perf_counter()
+
+    # chờ các frame đã upload đi hết pipeline; frame bị dedup "skip" không sinh sự kiện
+    # nên cũng dừng khi hàng đợi rỗng và không còn tiến triển trong --idle giây
+    uploaded = len(tl.deltas("upload_start", "upload_end"))
+    deadline = time.perf_counter() + args.drain_timeout
+    progress, last_change = -1, time.perf_counter()
+    while time.perf_counter() < deadline and len(seen) < uploaded:
+        now = len(seen) + len(tl.deltas("commit_start", "commit_end"))
+        if now != progress:
+            progress, last_change = now, time.perf_counter()
+        queues_empty = not os.listdir(INPUT_DIR) and worker.mem_queue.qsize() == 0
+        if queues_empty and time.perf_counter() - last_change > args.idle:
+            break
+        time.sleep(0.05)
+    t_end = max([m["sse"] for m in tl.marks.values() if "sse" in m] or [time.perf_counter()])
+    stop.set()
+
+    worker.stop_worker()
+    server.shutdown()
+
+    delivered = len(seen)
+    wall = t_end - t0
+    return {
+        "run_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "params": {"frames": args.frames, "clients": args.clients, "rate": args.rate,
+                   "cameras": cams, "distinct": args.distinct, "size": "x".join(map(str, args.size))},
+        "env": {k: os.environ[k] for k in KNOBS if k in os.environ},
+        "model_load_seconds": round(load_seconds, 3),
+        "uploaded": uploaded,
+        "upload_errors": len(errors),
+        "delivered": delivered,
+        "wall_seconds": round(wall, 3),
+        "throughput_fps": round(delivered / wall, 2) if wall > 0 else None,
+        "upload_fps": round(uploaded / (t_uploaded - t0), 2) if t_uploaded > t0 else None,
+        "latency_ms": {
+            "upload": summary(tl.deltas("upload_start", "upload_end")),
+            "queue_infer": summary(tl.deltas("upload_end", "commit_start")),
+            "infer": summary(list(stub_backend.predict_seconds)),
+            "save": summary(tl.stage["save"]),
+            "db_insert": summary(tl.stage["db_insert"]),
+            "commit": summary(tl.deltas("commit_start", "commit_end")),
+            "publish_to_sse": summary(tl.deltas("commit_end", "sse")),
+            "end_to_end": summary(tl.deltas("upload_start", "sse")),
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def print_report(res: dict, base: dict = None):
+    print(f"commit={res['commit']} env={res['env']}")
+    print(f"uploaded={res['uploaded']} delivered={res['delivered']} errors={res['upload_errors']} "
+          f"wall={res['wall_seconds']}s throughput={res['throughput_fps']} fps (upload {res['upload_fps']} fps)")
+    print(f"{'stage':<15} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}" + ("  Δp95 vs base" if base else ""))
+    for stage, s in res["latency_ms"].items():
+        if not s["n"]:
+            continue
+        line = f"{stage:<15} {s['n']:>6} {s['p50']:>9.2f} {s['p95']:>9.2f} {s['p99']:>9.2f}"
+        b = (base or {}).get("latency_ms", {}).get(stage) or {}
+        if b.get("p95"):
+            line += f"  {(s['p95'] - b['p95']) / b['p95']:+.1%}"
+        print(line)
+    print(f"peak RSS MB: {res['peak_rss_mb']}")
+    if base and base.get("throughput_fps"):
+        print(f"throughput vs base ({base.get('commit')}): {(res['throughput_fps'] - base['throughput_fps']) / base['throughput_fps']:+.1%}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--frames", type=int, default=300)
+    ap.add_argument("--clients", type=int, default=4, help="số luồng upload song song (mỗi luồng giữ kết nối)")
+    ap.add_argument("--rate", type=float, default=0.0, help="tổng số frame/giây (0 = upload nhanh nhất có thể)")
+    ap.add_argument("--cameras", type=int, default=4)
+    ap.add_argument("--distinct", type=int, default=64, help="số ảnh khác nhau dùng xoay vòng")
+    ap.add_argument("--size", default="1280x720")
+    ap.add_argument("--drain-timeout", type=float, default=120.0)
+    ap.add_argument("--idle", type=float, default=2.0)
+    ap.add_argument("--out", default="", help="file JSON kết quả (mặc định bench/results/ingest_<thời điểm>.json)")
+    ap.add_argument("--compare", default="", help="file JSON của lần chạy trước để so sánh")
+    ap.add_argument("--verbose", action="store_true", help="giữ log của server/worker")
+    args = ap.parse_args()
+    args.size = tuple(int(v) for v in args.size.split("x"))
+
+    stdout = sys.stdout
+    if not args.verbose:
+        # log [WORKER]/[AI] của app và access log của werkzeug
+        sys.stdout = open(os.devnull, "w")
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    try:
+        res = run(args)
+    finally:
+        if sys.stdout is not stdout:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    out = args.out or os.path.join(ROOT, "bench", "results", f"ingest_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(res, f, ensure_ascii=False, indent=2)
+
+    base = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)
+    print_report(res, base)
+    print(f"results: {out}")
+    sys.exit(0 if res["delivered"] and not res["upload_errors"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Đo overhead của metrics trên đường xử lý một frame (mục tiêu < 1%).
+
+Đường đo: decode JPEG -> infer_image (backend stub, độ trễ mặc định 0 = trường hợp xấu nhất
+vì phần việc thật ít nhất) -> finish_item (ghi ảnh, db_insert, publish). Hai cách tính:
+  - bound : số mẫu metrics mỗi frame x chi phí một mẫu (perf_counter + observe) / thời gian frame
+  - A/B   : chạy xen kẽ nhiều vòng bật/tắt metrics, so trung vị (nhiễu hơn, chỉ để tham khảo)
+Chạy:  [STUB_LATENCY_MS=20] python -m bench.bench_metrics --frames 2000 --rounds 5
+"""
+import os
+import sys
+import time
+import atexit
+import shutil
+import argparse
+import statistics
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="bench_metrics_")
+atexit.register(shutil.rmtree, _tmp, ignore_errors=True)
+os.environ["DB_PATH"] = os.path.join(_tmp, "bench.db")
+os.environ["OUTPUT_DIR"] = os.path.join(_tmp, "out")
+os.environ["INPUT_DIR"] = os.path.join(_tmp, "in")
+os.environ.setdefault("STUB_LATENCY_MS", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+from bench.stub_backend import StubBackend
+from app import metrics
+from app.db import db_init
+import app.model as model
+import app.worker as worker
+
+
+def per_call_ns(fn, n: int = 200_000) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e9
+
+
+def samples_total() -> float:
+    """Tổng số mẫu đã ghi (mọi series histogram + counter)."""
+    total = 0.0
+    for m in list(metrics._registry):
+        for child in getattr(m, "_children", {}).values():
+            total += child.count if isinstance(child, metrics._HistogramChild) else child.value
+    return total
+
+
+def run_frames(frames, n: int, start: int) -> float:
+    """Giây mỗi frame cho n frame đi hết decode -> infer -> finish_item."""
+    t0 = time.perf_counter()
+    for i in range(n):
+        data = frames[i % len(frames)]
+        img = model.decode_image(data)
+        name, conf, dets = model.infer_image(img)
+        worker.finish_item(f"cam_{start + i}.jpg", name, conf, data=data, dets=model.detections_json(dets))
+    return (time.perf_counter() - t0) / n
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--frames", type=int, default=2000)
+    ap.add_argument("--rounds", type=int, default=5)
+    ap.add_argument("--size", default="640x480")
+    args = ap.parse_args()
+
+    w, h = (int(v) for v in args.size.split("x"))
+    rng = np.random.default_rng(0)
+    frames = [cv2.imencode(".jpg", rng.integers(0, 255, (h, w, 3), dtype=np.uint8))[1].tobytes()
+              for _ in range(8)]
+
+    db_init()
+    stub = StubBackend()
+    model._yolo, model._yolo_names = stub, stub.names
+    model._ready.set()
+    model._done.set()
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")  # bỏ log [AI] mỗi frame
+    try:
+        run_frames(frames, 200, 0)  # warmup
+
+        # 1) chi phí một mẫu
+        hist = metrics.Histogram("bench_tmp_seconds", "bench only")
+        counter = metrics.Counter("bench_tmp_total", "bench only")
+        timer_ns = per_call_ns(lambda: hist.observe(time.perf_counter() - time.perf_counter()))
+        inc_ns = per_call_ns(counter.inc)
+
+        # 2) số mẫu mỗi frame
+        before = samples_total()
+        frame_s = run_frames(frames, args.frames, 1_000_000)
+        per_frame = (samples_total() - before) / args.frames
+
+        # 3) A/B xen kẽ
+        on, off = [], []
+        for r in range(args.rounds):
+            for enabled, bucket in ((True, on), (False, off)) if r % 2 == 0 else ((False, off), (True, on)):
+                metrics.set_enabled(enabled)
+                bucket.append(run_frames(frames, args.frames, 2_000_000 + r * 2 * args.frames + len(bucket) * args.frames))
+        metrics.set_enabled(True)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    bound = per_frame * timer_ns * 1e-9 / frame_s
+    ab = (statistics.median(on) - statistics.median(off)) / statistics.median(off)
+    print(f"observe (perf_counter x2 + histogram) : {timer_ns:8.0f} ns")
+    print(f"counter inc                            : {inc_ns:8.0f} ns")
+    print(f"frame time (stub latency {stub.latency * 1000:.0f} ms)        : {frame_s * 1e6:8.1f} µs")
+    print(f"metric samples per frame               : {per_frame:8.2f}")
+    print(f"overhead bound                         : {bound:8.3%}")
+    print(f"A/B median on vs off ({args.rounds} rounds)       : {ab:+8.3%}  (on {statistics.median(on) * 1e6:.1f} µs, "
+          f"off {statistics.median(off) * 1e6:.1f} µs)")
+    ok = bound < 0.01
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Tải /api/stream: N client SSE đồng thời trên server asyncio (serve.py --no-worker).
+
+Bench mở N kết nối SSE (asyncio, mỗi client một socket), rồi tự ghi --events bản ghi thẳng
+vào DB như worker ở process khác; process web đọc chúng qua follower và phát cho mọi client.
+Báo cáo: số client nhận đủ, độ trễ insert -> client nhận (gồm cả chu kỳ FOLLOW_POLL_SECONDS),
+số luồng và RSS của process web. --server threaded chạy dev server werkzeug (threaded=True)
+để so số luồng/RSS với cùng số client (dev server không có follower nên không đo sự kiện).
+Chạy:  python -m bench.bench_sse --clients 1000 --events 10 [--server threaded]
+"""
+import os
+import sys
+import time
+import atexit
+import shutil
+import socket
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp = tempfile.mkdtemp(prefix="bench_sse_")
+atexit.register(shutil.rmtree, _tmp, ignore_errors=True)
+os.environ["DB_PATH"] = os.path.join(_tmp, "bench.db")
+os.environ["INPUT_DIR"] = os.path.join(_tmp, "in")
+os.environ["OUTPUT_DIR"] = os.path.join(_tmp, "out")
+os.environ.setdefault("FOLLOW_POLL_SECONDS", "0.1")
+
+from app.db import db_init, db_insert
+
+_THREADED = ("from app import create_app; app = create_app(start_services=False); "
+             "app.run(host='127.0.0.1', port={port}, threaded=True)")
+
+
+def raise_nofile(n: int):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    want = min(max(soft, n), hard)
+    if want > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (want, hard))
+    return want
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def proc_stats(pid: int) -> dict:
+    """Số luồng và RSS (MB) của process `pid` và các process con của nó (Linux /proc)."""
+    out = {"threads": 0, "rss_mb": 0.0}
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(p) for p in f.read().split()]
+    except OSError:
+        pass
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("Threads:"):
+                        out["threads"] += int(line.split()[1])
+                    elif line.startswith("VmRSS:"):
+                        out["rss_mb"] += int(line.split()[1]) / 1024
+        except OSError:
+            pass
+    out["rss_mb"] = round(out["rss_mb"], 1)
+    return out
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+
+def wait_port(port: int, proc, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"server exited with code {proc.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit("server did not start")
+
+
+class Client:
+    def __init__(self):
+        self.ready = asyncio.Event()
+        self.received = {}  # id -> thời điểm nhận
+        self.error = None
+
+    async def run(self, port: int, stop: asyncio.Event):
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        except OSError as e:
+            self.error = str(e)
+            self.ready.set()
+            return
+        writer.write(b"GET /api/stream HTTP/1.1\r\nHost: bench\r\nAccept: text/event-stream\r\n\r\n")
+        try:
+            status = await reader.readline()
+            if b" 200 " not in status:
+                self.error = status.decode("latin-1").strip()
+                return
+            read = asyncio.ensure_future(reader.readline())
+            halt = asyncio.ensure_future(stop.wait())
+            while True:
+                done, _ = await asyncio.wait({read, halt}, return_when=asyncio.FIRST_COMPLETED)
+                if halt in done:
+                    read.cancel()
+                    return
+                line = read.result()
+                if not line:
+                    self.error = "closed"
+                    return
+                if line.startswith(b"retry:"):
+                    self.ready.set()
+                elif line.startswith(b"id: "):
+                    self.received[int(line[4:])] = time.time()
+                read = asyncio.ensure_future(reader.readline())
+        except (OSError, asyncio.IncompleteReadError) as e:
+            self.error = str(e) or type(e).__name__
+        finally:
+            self.ready.set()
+            writer.close()
+
+
+async def run_clients(port: int, n: int, events: int, interval: float, pid: int, measure_events: bool):
+    stop = asyncio.Event()
+    clients = [Client() for _ in range(n)]
+    tasks = []
+    t0 = time.perf_counter()
+    for i, c in enumerate(clients):
+        tasks.append(asyncio.ensure_future(c.run(port, stop)))
+        if i % 100 == 99:
+            await asyncio.sleep(0.05)  # tránh tràn backlog lúc mở kết nối
+    await asyncio.wait_for(asyncio.gather(*(c.ready.wait() for c in clients)), 60)
+    connect_s = time.perf_counter() - t0
+    connected = sum(1 for c in clients if c.error is None)
+    await asyncio.sleep(1.0)
+    stats = proc_stats(pid)
+
+    sent = {}
+    if measure_events:
+        loop = asyncio.get_running_loop()
+        for i in range(events):
+            ts = time.time()
+            rid = await loop.run_in_executor(None, db_insert, time.strftime("%Y-%m-%d %H:%M:%S"), "bench",
+                                             "7up", 0.9, f"bench/{i}.jpg")
+            sent[rid] = ts
+            await asyncio.sleep(interval)
+        deadline = time.time() + 10
+        while time.time() < deadline and not all(len(c.received) >= events for c in clients if c.error is None):
+            await asyncio.sleep(0.1)
+    stats_after = proc_stats(pid)
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    lat = [(c.received[rid] - ts) * 1000 for c in clients for rid, ts in sent.items() if rid in c.received]
+    complete = sum(1 for c in clients if c.error is None and all(rid in c.received for rid in sent))
+    errors = [c.error for c in clients if c.error]
+    return {"connected": connected, "connect_s": connect_s, "complete": complete, "lat": lat,
+            "errors": errors, "stats": stats, "stats_after": stats_after}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--clients", type=int, default=1000)
+    ap.add_argument("--events", type=int, default=10)
+    ap.add_argument("--interval", type=float, default=0.5, help="giây giữa hai bản ghi")
+    ap.add_argument("--server", choices=("async", "threaded"), default="async")
+    args = ap.parse_args()
+
+    nofile = raise_nofile(args.clients * 2 + 256)
+    if nofile < args.clients + 64:
+        print(f"[WARN] RLIMIT_NOFILE={nofile} < clients; raise `ulimit -n`")
+    db_init()
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), HOST="127.0.0.1", WEB_PROCESSES="1")
+    if args.server == "async":
+        cmd = [sys.executable, os.path.join(ROOT, "serve.py"), "--web", "1", "--no-worker"]
+    else:
+        cmd = [sys.executable, "-c", _THREADED.format(port=port)]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            preexec_fn=lambda: raise_nofile(args.clients * 2 + 256))
+    try:
+        wait_port(port, proc)
+        # serve.py là process giám sát: đo process web con của nó
+        time.sleep(0.5)
+        res = asyncio.run(run_clients(port, args.clients, args.events, args.interval, proc.pid,
+                                      measure_events=args.server == "async"))
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    print(f"server               : {args.server}")
+    print(f"clients connected    : {res['connected']}/{args.clients} in {res['connect_s']:.2f}s")
+    print(f"server threads / RSS : {res['stats']['threads']} / {res['stats']['rss_mb']} MB (idle), "
+          f"{res['stats_after']['threads']} / {res['stats_after']['rss_mb']} MB (after events)")
+    if args.server == "async":
+        lat = res["lat"]
+        print(f"clients got all {args.events:>3} : {res['complete']}/{args.clients}")
+        if lat:
+            print(f"fan-out latency ms   : p50 {pct(lat, 50):.1f}  p95 {pct(lat, 95):.1f}  max {max(lat):.1f} "
+                  f"({len(lat)} deliveries)")
+    if res["errors"]:
+        print(f"errors               : {len(res['errors'])} (first: {res['errors'][0]})")
+    ok = res["connected"] == args.clients and (args.server != "async" or res["complete"] == args.clients)
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
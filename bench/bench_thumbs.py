@@ -0,0 +1,94 @@
+"""Đo băng thông và độ trễ khi danh sách dashboard tải ảnh: /uploads (ảnh gốc) vs /thumb.
+
+Tạo --images ảnh JPEG có nội dung giống cảnh thật (khối màu + nhiễu nhẹ), rồi mỗi
+trường hợp tải toàn bộ một lượt: ảnh gốc, thumbnail lần đầu (tạo + ghi cache),
+thumbnail từ cache đĩa và lượt tải lại có If-None-Match (304).
+Chạy:  python -m bench.bench_thumbs --images 50 --size 1600x1200
+"""
+import os
+import sys
+import time
+import atexit
+import shutil
+import argparse
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="bench_thumbs_")
+atexit.register(shutil.rmtree, _tmp, ignore_errors=True)
+os.environ["DB_PATH"] = os.path.join(_tmp, "bench.db")
+os.environ["OUTPUT_DIR"] = os.path.join(_tmp, "out")
+os.environ["THUMB_CACHE_DIR"] = os.path.join(_tmp, "thumbs")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+from flask import Flask
+
+from app.config import OUTPUT_DIR
+from app.db import db_init, db_insert
+from app.routes import bp
+
+
+def make_scene(rng, w: int, h: int) -> np.ndarray:
+    img = np.full((h, w, 3), 200, np.uint8)
+    for _ in range(12):
+        x, y = int(rng.integers(0, w)), int(rng.integers(0, h))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.rectangle(img, (x, y), (x + w // 8, y + h // 4), color, -1)
+    noise = rng.normal(0, 6, img.shape)
+    return np.clip(img + noise, 0, 255).astype(np.uint8)
+
+
+def fetch_all(client, urls, headers=None):
+    t0 = time.perf_counter()
+    total, etags = 0, []
+    for i, url in enumerate(urls):
+        h = dict(headers or {})
+        if "If-None-Match" in h:
+            h["If-None-Match"] = h["If-None-Match"][i]
+        resp = client.get(url, headers=h)
+        assert resp.status_code in (200, 304), resp.status_code
+        total += len(resp.data)
+        etags.append(resp.headers.get("ETag", ""))
+        resp.close()
+    return (time.perf_counter() - t0) / len(urls) * 1000, total, etags
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--images", type=int, default=50)
+    ap.add_argument("--size", default="1600x1200")
+    args = ap.parse_args()
+
+    w, h = (int(v) for v in args.size.split("x"))
+    rng = np.random.default_rng(0)
+    db_init()
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    for i in range(args.images):
+        name = f"cam_20260101_{120000 + i:06d}.jpg"
+        cv2.imwrite(os.path.join(OUTPUT_DIR, name), make_scene(rng, w, h))
+        db_insert("2026-01-01 12:00:00", "x", "7up", 0.9, name)
+
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    client = app.test_client()
+    rows = client.get(f"/api/data?limit={min(args.images, 200)}").get_json()
+    originals = [f"/uploads/{r['image_path']}" for r in rows]
+    thumbs = [r["thumb_url"] for r in rows]
+
+    webp = {"Accept": "image/webp,*/*"}
+    results = [("uploads (original)",) + fetch_all(client, originals)[:2],
+               ("thumb cold",) + fetch_all(client, thumbs, webp)[:2]]
+    ms, size, etags = fetch_all(client, thumbs, webp)
+    results.append(("thumb warm", ms, size))
+    results.append(("thumb 304",) + fetch_all(client, thumbs, dict(webp, **{"If-None-Match": etags}))[:2])
+
+    print(f"images={len(rows)} size={w}x{h} thumb={thumbs[0].split('/')[2]}px")
+    print(f"{'case':<20} {'ms/req':>8} {'KiB total':>10}")
+    for name, ms, size in results:
+        print(f"{name:<20} {ms:>8.2f} {size / 1024:>10.1f}")
+    print(f"bytes saved vs originals: {1 - results[2][2] / results[0][2]:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""So sánh các cách upload của camera: mô phỏng N camera cùng gửi lại backlog thẻ SD.
+
+Chế độ (--modes):
+  single : multipart một ảnh, mỗi ảnh một kết nối TCP mới (Connection: close) như firmware cũ
+  raw    : body image/jpeg + header X-Camera/X-Timestamp (như firmware), giữ kết nối (keep-alive)
+  batch  : multipart --batch ảnh mỗi request, giữ kết nối
+Mỗi camera là một luồng gửi --backlog ảnh JPEG. Server chạy không có worker (chỉ đo phần nhận
+ảnh + tạo job). --rtt-ms giả lập độ trễ mạng: mỗi kết nối mới tốn một RTT bắt tay, mỗi
+request một RTT. Báo cáo thời gian xả hết backlog, ảnh/giây, độ trễ mỗi request và kiểm tra
+số job trong DB khớp số ảnh.
+Chạy:  python -m bench.bench_upload --cameras 20 --backlog 100 --batch 16 [--rtt-ms 20] [--server threaded]
+"""
+import os
+import sys
+import json
+import time
+import resource
+import atexit
+import shutil
+import socket
+import sqlite3
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import numpy as np
+
+_THREADED = ("from app import create_app; app = create_app(start_services=False); "
+             "app.run(host='127.0.0.1', port={port}, threaded=True)")
+_BOUNDARY = "----BenchFleetBoundary"
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_port(port: int, proc, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"server exited with code {proc.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit("server did not start")
+
+
+def make_frames(n: int, w: int = 800, h: int = 600):
+    """Ảnh cỡ SVGA chất lượng như ESP32-CAM (jpeg_quality 12 ~ 85 của OpenCV)."""
+    rng = np.random.default_rng(0)
+    return [cv2.imencode(".jpg", rng.integers(0, 255, (h // 8, w // 8, 3), dtype=np.uint8).repeat(8, 0).repeat(8, 1),
+                         [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes() for _ in range(n)]
+
+
+def multipart(files):
+    parts = []
+    for name, data in files:
+        parts.append(f"--{_BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{name}\"\r\n"
+                     f"Content-Type: image/jpeg\r\n\r\n".encode() + data + b"\r\n")
+    return b"".join(parts) + f"--{_BOUNDARY}--\r\n".encode()
+
+
+class Camera(threading.Thread):
+    def __init__(self, idx: int, port: int, mode: str, frames, backlog: int, batch: int, rtt: float):
+        super().__init__(daemon=True)
+        self.name_ = f"cam{idx}"
+        self.port, self.mode, self.frames, self.backlog, self.batch, self.rtt = port, mode, frames, backlog, batch, rtt
+        self.latencies = []
+        self.job_ids = []
+        self.errors = []
+        self.connections = 0
+        self.conn = None
+
+    def _connection(self, fresh: bool):
+        if fresh or self.conn is None:
+            if self.conn is not None:
+                self.conn.close()
+            time.sleep(self.rtt)  # bắt tay TCP
+            self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+            self.connections += 1
+        return self.conn
+
+    def _post(self, body: bytes, headers: dict, fresh: bool):
+        t0 = time.perf_counter()
+        conn = self._connection(fresh)
+        time.sleep(self.rtt)  # request -> response
+        conn.request("POST", "/api/upload_cam", body=body, headers=headers)
+        resp = conn.getresponse()
+        data = resp.read()
+        if resp.getheader("Connection", "").lower() == "close" or fresh:
+            conn.close()
+            self.conn = None
+        self.latencies.append(time.perf_counter() - t0)
+        if resp.status != 200:
+            self.errors.append(f"{resp.status} {data[:100]!r}")
+            return
+        res = json.loads(data)
+        for r in res.get("files", [res]):
+            self.job_ids.append(r.get("job_id"))
+
+    def run(self):
+        names = [f"img_{self.name_}_{i}.jpg" for i in range(self.backlog)]
+        try:
+            if self.mode == "single":
+                for i, name in enumerate(names):
+                    self._post(multipart([(name, self.frames[i % len(self.frames)])]),
+                               {"Content-Type": f"multipart/form-data; boundary={_BOUNDARY}", "Connection": "close"},
+                               fresh=True)
+            elif self.mode == "raw":
+                # backlog thẻ SD: mỗi ảnh chụp cách nhau 5 giây
+                t0 = int(time.time()) - 5 * len(names)
+                for i in range(len(names)):
+                    ts = time.strftime("%Y%m%d_%H%M%S", time.localtime(t0 + 5 * i))
+                    self._post(self.frames[i % len(self.frames)],
+                               {"Content-Type": "image/jpeg", "X-Camera": self.name_, "X-Timestamp": ts}, fresh=False)
+            else:
+                for s in range(0, len(names), self.batch):
+                    chunk = [(n, self.frames[(s + j) % len(self.frames)]) for j, n in enumerate(names[s:s + self.batch])]
+                    self._post(multipart(chunk), {"Content-Type": f"multipart/form-data; boundary={_BOUNDARY}"},
+                               fresh=False)
+        except Exception as e:
+            self.errors.append(repr(e))
+        finally:
+            if self.conn is not None:
+                self.conn.close()
+
+
+def run_mode(mode: str, args, frames) -> dict:
+    d = tempfile.mkdtemp(prefix=f"bench_upload_{mode}_")
+    atexit.register(shutil.rmtree, d, ignore_errors=True)
+    port = free_port()
+    db_path = os.path.join(d, "bench.db")
+    env = dict(os.environ, PORT=str(port), HOST="127.0.0.1", DB_PATH=db_path, INPUT_DIR=os.path.join(d, "in"),
+               OUTPUT_DIR=os.path.join(d, "out"), JOB_QUEUE="1", INMEMORY_INGEST="0",
+               UPLOAD_MAX_FILES=str(max(64, args.batch)))
+    if args.server == "async":
+        cmd = [sys.executable, os.path.join(ROOT, "serve.py"), "--web", "1", "--no-worker"]
+    else:
+        cmd = [sys.executable, "-c", _THREADED.format(port=port)]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_port(port, proc)
+        time.sleep(0.5)
+        cams = [Camera(i, port, mode, frames, args.backlog, args.batch, args.rtt_ms / 1000) for i in range(args.cameras)]
+        t0 = time.perf_counter()
+        for c in cams:
+            c.start()
+        for c in cams:
+            c.join()
+        wall = time.perf_counter() - t0
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    with sqlite3.connect(db_path) as con:
+        jobs = con.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+    lat = [x * 1000 for c in cams for x in c.latencies]
+    ids = [j for c in cams for j in c.job_ids]
+    return {
+        "mode": mode, "wall_s": wall, "images": len(ids), "img_per_s": len(ids) / wall if wall else 0.0,
+        "requests": len(lat), "connections": sum(c.connections for c in cams),
+        "p50_ms": pct(lat, 50) if lat else None, "p95_ms": pct(lat, 95) if lat else None,
+        "job_ids": sum(1 for j in ids if j is not None), "distinct_ids": len({j for j in ids if j is not None}),
+        "jobs_in_db": jobs, "errors": [e for c in cams for e in c.errors],
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cameras", type=int, default=20)
+    ap.add_argument("--backlog", type=int, default=100, help="số ảnh mỗi camera phải gửi lại")
+    ap.add_argument("--batch", type=int, default=16, help="số ảnh mỗi request ở chế độ batch")
+    ap.add_argument("--rtt-ms", type=float, default=20.0, help="độ trễ mạng giả lập mỗi round trip")
+    ap.add_argument("--modes", default="single,raw,batch")
+    ap.add_argument("--server", choices=("async", "threaded"), default="async")
+    args = ap.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(max(soft, args.cameras * 4 + 256), hard), hard))
+    frames = make_frames(8)
+    print(f"{args.cameras} cameras x {args.backlog} frames ({sum(map(len, frames)) // len(frames) // 1024} KB), "
+          f"rtt {args.rtt_ms:g} ms, server {args.server}")
+    print(f"{'mode':<7} {'wall s':>8} {'img/s':>8} {'reqs':>6} {'conns':>6} {'p50 ms':>8} {'p95 ms':>8} {'job ids':>8} {'db jobs':>8}")
+    ok = True
+    expected = args.cameras * args.backlog
+    for mode in args.modes.split(","):
+        r = run_mode(mode.strip(), args, frames)
+        print(f"{r['mode']:<7} {r['wall_s']:8.2f} {r['img_per_s']:8.1f} {r['requests']:6d} {r['connections']:6d} "
+              f"{r['p50_ms']:8.1f} {r['p95_ms']:8.1f} {r['distinct_ids']:8d} {r['jobs_in_db']:8d}")
+        if r["errors"]:
+            print(f"  errors: {len(r['errors'])} (first: {r['errors'][0]})")
+        ok &= not r["errors"] and r["distinct_ids"] == expected == r["jobs_in_db"]
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Kiểm tra backend onnx cho cùng nhãn top-1 với backend torch.
+
+Chạy cả hai backend trên cùng bộ ảnh (mặc định: ảnh đã lưu trong OUTPUT_DIR), so nhãn
+top-1 và độ lệch conf. Cần best.pt và best.onnx (scripts/export_onnx.py).
+Phần đạt/không đạt nằm ở tests/test_backend_parity.py.
+Chạy:  python -m bench.check_backend_parity --images outputs/sautrain --limit 200
+"""
+import os
+import sys
+import glob
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import EXTS, OUTPUT_DIR
+from app.backends import create_backend
+from app.model import safe_imread
+
+
+def top1(backend, img):
+    r = backend.predict([img])[0]
+    top = r.top1()
+    if top is None:
+        return "Unknown", 0.0
+    return backend.names.get(top[0], str(top[0])), top[1]
+
+
+def image_paths(folder: str, limit: int) -> list:
+    return sorted(p for p in glob.glob(os.path.join(folder, "**", "*"), recursive=True)
+                  if os.path.splitext(p)[1].lower() in EXTS)[:limit]
+
+
+def compare(paths, torch_be, onnx_be):
+    """Trả về (số ảnh cùng nhãn, max |Δconf| trên ảnh cùng nhãn, [(ảnh, (nhãn, conf) torch, onnx)] lệch)."""
+    agree = 0
+    max_dconf = 0.0
+    diffs = []
+    for p in paths:
+        img = safe_imread(p)
+        (a, ca), (b, cb) = top1(torch_be, img), top1(onnx_be, img)
+        if a == b:
+            agree += 1
+            max_dconf = max(max_dconf, abs(ca - cb))
+        else:
+            diffs.append((p, (a, ca), (b, cb)))
+    return agree, max_dconf, diffs
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--images", default=OUTPUT_DIR)
+    ap.add_argument("--limit", type=int, default=200)
+    args = ap.parse_args()
+
+    paths = image_paths(args.images, args.limit)
+    if not paths:
+        print(f"Không có ảnh trong {args.images}")
+        sys.exit(2)
+
+    agree, max_dconf, diffs = compare(paths, create_backend("torch"), create_backend("onnx"))
+    for p, (a, ca), (b, cb) in diffs:
+        print(f"DIFF {os.path.basename(p)}: torch={a} ({ca:.3f}) onnx={b} ({cb:.3f})")
+    print(f"images={len(paths)} agree={agree} ({agree / len(paths):.1%}) max|Δconf|={max_dconf:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Đo các truy vấn dashboard trên bảng records lớn và in query plan quét toàn bảng (nếu có).
+
+Tạo bảng giả N dòng (mặc định 10 triệu), chạy các hàm trong app/db.py với nhiều
+tổ hợp bộ lọc, ghi lại SQL thật sự được thực thi rồi EXPLAIN QUERY PLAN từng câu.
+Phần đạt/không đạt (không quét toàn bảng) nằm ở tests/test_query_plans.py.
+Chạy:  python -m bench.check_query_plans --rows 10000000
+"""
+import os
+import sys
+import time
+import atexit
+import shutil
+import argparse
+import tempfile
+
+if __name__ == "__main__":
+    # chạy trực tiếp: DB tạm riêng; tests import module này thì dùng DB của conftest
+    _tmp = tempfile.mkdtemp(prefix="bench_plans_")
+    atexit.register(shutil.rmtree, _tmp, ignore_errors=True)
+    os.environ["DB_PATH"] = os.path.join(_tmp, "plans.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app.db as db
+
+N_PRODUCTS = 40
+T0 = 1735689600  # 2025-01-01 00:00:00
+STEP = 3         # giây giữa hai bản ghi
+
+_statements = []
+
+
+def _tracing_connect(readonly: bool = False):
+    con = _orig_connect(readonly)
+    con.set_trace_callback(_statements.append)
+    return con
+
+
+_orig_connect = db.db_connect
+
+
+def fill(n: int):
+    con = _orig_connect()
+    con.executemany("INSERT OR IGNORE INTO products (id, name) VALUES (?, ?)",
+                    [(i + 1, f"p{i:02d}") for i in range(N_PRODUCTS)])
+    con.execute(f"""
+        INSERT INTO records (timestamp, brand, product_name, conf, image_path, product_id, ts_epoch)
+        WITH RECURSIVE c(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM c WHERE i < {n - 1})
+        SELECT datetime({T0} + i * {STEP}, 'unixepoch'), 'x', printf('p%02d', i % {N_PRODUCTS}), 0.9, '',
+               (i % {N_PRODUCTS}) + 1, {T0} + i * {STEP}
+        FROM c
+    """)
+    con.commit()
+    con.execute("ANALYZE")
+    con.commit()
+    con.close()
+    db.db_rebuild_rollups()
+
+
+def dashboard_calls(n: int):
+    end_ts = T0 + n * STEP
+    day = 86400
+
+    def fmt(t):
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(t))
+
+    ranges = [
+        ("", ""),
+        (fmt(end_ts - day), ""),                                  # hôm nay
+        (fmt(T0 + 3 * day), fmt(T0 + 4 * day - 1)),                # một ngày cũ
+        (fmt(T0 + 10 * day + 1234), fmt(T0 + 40 * day + 777)),     # khoảng lẻ giờ, cũ
+    ]
+    for start, end in ranges:
+        for product in ("", "p07", "=p07", "p1"):
+            yield "query_cursor", lambda: db.db_query_cursor(start, end, product, limit=20)
+            yield "query_cursor+cursor", lambda: db.db_query_cursor(start, end, product, limit=20, cursor_id=n // 2)
+            yield "query_newer", lambda: db.db_query_newer(start, end, product, last_id=n - 100, limit=50)
+            yield "stats", lambda: db.db_stats(start, end, product, topk=30)
+            yield "count_filtered", lambda: db.db_count_filtered(start, end, product)
+            yield "stats_by_day", lambda: db.db_stats_by_day(start, end, product)
+            yield "csv_data", lambda: db.db_get_csv_data(start, end, product, limit=150)
+            yield "compare_products", lambda: db.db_compare_products(start, end, product or "p03", "p1", "=p22")
+    yield "count_all", db.db_count_all
+
+
+def is_full_scan(detail: str, sql: str) -> bool:
+    if not detail.startswith("SCAN records"):
+        return False
+    # trang mới nhất không lọc: đi lùi theo khoá chính và dừng ở LIMIT
+    normalized = " ".join(sql.split()).upper()
+    if " WHERE " not in normalized and "ORDER BY ID DESC LIMIT" in normalized:
+        return False
+    return True
+
+
+def run_calls(n: int):
+    """Chạy từng truy vấn dashboard, trả về (tên, ms, [(sql, plan)] quét toàn bảng).
+
+    Cần `db.db_connect = _tracing_connect` (và pool đọc trống) để ghi lại SQL.
+    """
+    for name, call in dashboard_calls(n):
+        _statements.clear()
+        t = time.perf_counter()
+        call()
+        dt = (time.perf_counter() - t) * 1000
+        scans = []
+        checker = _orig_connect(readonly=True)
+        try:
+            for sql in list(_statements):
+                if not sql.lstrip().upper().startswith("SELECT"):
+                    continue
+                plan = [r["detail"] for r in checker.execute("EXPLAIN QUERY PLAN " + sql).fetchall()]
+                if any(is_full_scan(d, sql) for d in plan):
+                    scans.append((sql, plan))
+        finally:
+            checker.close()
+        yield name, dt, scans
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=10_000_000)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    db.db_init()
+    fill(args.rows)
+    print(f"filled {args.rows} rows in {time.perf_counter() - t0:.1f}s")
+
+    db._read_pool.close_all()
+    db.db_connect = _tracing_connect
+
+    for name, dt, scans in run_calls(args.rows):
+        for sql, plan in scans:
+            print(f"FULL SCAN in {name}: {' '.join(sql.split())}\n    {plan}")
+        print(f"{name:<22} {dt:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Backend giả cho benchmark: không cần weights, độ trễ cấu hình qua biến môi trường.
+
+Import module này sẽ đăng ký backend "stub" vào app.backends.BACKENDS; chạy với
+MODEL_BACKEND=stub. Process con của pool (spawn) đọc cùng biến môi trường nên có cùng độ trễ.
+  STUB_LATENCY_MS    thời gian mỗi lần gọi predict (mặc định 20)
+  STUB_PER_IMAGE_MS  cộng thêm cho mỗi ảnh trong lô (mặc định 0)
+  STUB_JITTER_MS     dao động ngẫu nhiên đều ±jitter (mặc định 0)
+"""
+import os
+import time
+import random
+import threading
+from typing import List
+
+import numpy as np
+
+from app.backends import BACKENDS, Detections
+
+NAMES = {0: "7up", 1: "Aquafina", 2: "c2", 3: "Warrior", 4: "Trà Xanh Không Độ"}
+
+# thời gian (giây) của từng lần predict trong process này, để bench tính phân vị
+predict_seconds: List[float] = []
+_lock = threading.Lock()
+
+
+class StubBackend:
+    name = "stub"
+
+    def __init__(self):
+        self.names = dict(NAMES)
+        self.latency = float(os.getenv("STUB_LATENCY_MS", "20")) / 1000
+        self.per_image = float(os.getenv("STUB_PER_IMAGE_MS", "0")) / 1000
+        self.jitter = float(os.getenv("STUB_JITTER_MS", "0")) / 1000
+        self._rng = random.Random(0)
+
+    def predict(self, imgs) -> List[Detections]:
+        t0 = time.perf_counter()
+        delay = self.latency + self.per_image * max(0, len(imgs) - 1)
+        if self.jitter:
+            delay += self._rng.uniform(-self.jitter, self.jitter)
+        time.sleep(max(0.0, delay))
+        out = []
+        for img in imgs:
+            h, w = img.shape[:2]
+            # lớp phụ thuộc độ sáng để các frame khác nhau cho kết quả khác nhau
+            cls = int(img[::16, ::16].mean()) % len(self.names)
+            boxes = np.array([[w * 0.2, h * 0.2, w * 0.6, h * 0.8]], np.float32)
+            out.append(Detections(np.array([cls]), np.array([0.9], np.float32), boxes=boxes))
+        with _lock:
+            predict_seconds.append(time.perf_counter() - t0)
+        return out
+
+
+BACKENDS.setdefault("stub", StubBackend)
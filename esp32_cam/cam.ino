@@ -2,6 +2,7 @@
 #include "FS.h"
 #include "SD_MMC.h"
 #include <WiFi.h>
+#include <time.h>
 
 // =====================
 // 1) CẤU HÌNH
@@ -37,62 +38,99 @@ static const uint32_t CAPTURE_INTERVAL_MS = 5000;
 #define HREF_GPIO_NUM     23
 #define PCLK_GPIO_NUM     22
 
+// Tên camera gửi trong header X-Camera (server dùng để tách dedup theo camera)
+const char* CAMERA_ID = "cam1";
+// Mỗi vòng loop gửi tối đa chừng này ảnh tồn trên thẻ SD (để không trễ lịch chụp)
+static const int BACKLOG_PER_LOOP = 10;
+
+// Giờ chụp: đồng bộ NTP khi có WiFi (giờ Việt Nam UTC+7). Ảnh trên SD đặt tên theo giờ chụp
+// YYYYMMDD_HHMMSS.jpg và gửi trong X-Timestamp; server tự dựng tên <camera>_<giờ chụp>.jpg
+const char* TZ_INFO = "ICT-7";
+const char* NTP_SERVER = "pool.ntp.org";
+
 static uint32_t lastCaptureMs = 0;
 
+// Kết nối giữ lại giữa các lần upload (HTTP keep-alive), không bắt tay TCP lại mỗi ảnh
+static WiFiClient client;
+
 // =====================
-// Upload multipart (HTTP)
+// Upload body ảnh thô (HTTP keep-alive)
 // =====================
-bool uploadFileMultipartHTTP(File &file) {
-  WiFiClient client;
+bool readResponse() {
+  // status line + header, rồi bỏ qua body theo Content-Length
+  String statusLine = "";
+  int contentLength = 0;
+  bool serverClose = false;
+  unsigned long t0 = millis();
 
-  if (!client.connect(HOST, PORT)) {
-    Serial.println("❌ Khong ket noi duoc toi server");
-    return false;
+  while (client.connected() && millis() - t0 < 8000) {
+    if (!client.available()) { delay(2); continue; }
+    String line = client.readStringUntil('\n');
+    line.trim();
+    if (statusLine.length() == 0) {
+      statusLine = line;
+      Serial.println("Server: " + statusLine);
+      continue;
+    }
+    if (line.length() == 0) break;  // hết header
+    String lower = line;
+    lower.toLowerCase();
+    if (lower.startsWith("content-length:")) contentLength = lower.substring(15).toInt();
+    if (lower.startsWith("connection:") && lower.indexOf("close") >= 0) serverClose = true;
+  }
+  while (contentLength > 0 && client.connected() && millis() - t0 < 8000) {
+    if (client.available()) { client.read(); contentLength--; }
+    else delay(2);
   }
+  if (serverClose || contentLength > 0) client.stop();
+  return statusLine.indexOf(" 200") >= 0 || statusLine.indexOf(" 201") >= 0;
+}
 
-  String boundary = "----ESP32FormBoundary";
-  String head =
-    "--" + boundary + "\r\n"
-    "Content-Disposition: form-data; name=\"file\"; filename=\"cam.jpg\"\r\n"
-    "Content-Type: image/jpeg\r\n\r\n";
-  String tail = "\r\n--" + boundary + "--\r\n";
+// "YYYYMMDD_HHMMSS..." -> "YYYYMMDD_HHMMSS"; tên không có giờ chụp (chụp lúc chưa có NTP) -> ""
+String captureTimeOf(const String &name) {
+  if (name.length() < 15 || name.charAt(8) != '_') return "";
+  for (int i = 0; i < 15; i++) {
+    if (i != 8 && !isDigit(name.charAt(i))) return "";
+  }
+  return name.substring(0, 15);
+}
 
-  uint32_t contentLength = head.length() + file.size() + tail.length();
+bool sendRawHTTP(File &file, const String &name) {
+  if (!client.connected()) {
+    client.stop();
+    if (!client.connect(HOST, PORT)) {
+      Serial.println("❌ Khong ket noi duoc toi server");
+      return false;
+    }
+  }
 
-  // HTTP header
+  // HTTP header: body là ảnh JPEG nguyên bản, metadata trong header
   client.print(String("POST ") + PATH + " HTTP/1.1\r\n");
   client.print(String("Host: ") + HOST + "\r\n");
-  client.print("Connection: close\r\n");
-  client.print("Content-Type: multipart/form-data; boundary=" + boundary + "\r\n");
-  client.print("Content-Length: " + String(contentLength) + "\r\n\r\n");
+  client.print("Connection: keep-alive\r\n");
+  client.print("Content-Type: image/jpeg\r\n");
+  client.print(String("X-Camera: ") + CAMERA_ID + "\r\n");
+  // không có giờ chụp thì server dùng giờ nhận ảnh
+  String ts = captureTimeOf(name);
+  if (ts.length() > 0) client.print("X-Timestamp: " + ts + "\r\n");
+  client.print("Content-Length: " + String(file.size()) + "\r\n\r\n");
 
   // Body
-  client.print(head);
-
   uint8_t buf[1024];
   while (file.available()) {
     size_t n = file.read(buf, sizeof(buf));
-    client.write(buf, n);
+    if (client.write(buf, n) != n) return false;
   }
 
-  client.print(tail);
-
-  // Đọc status line
-  String statusLine = "";
-  unsigned long t0 = millis();
-  while (client.connected() && millis() - t0 < 8000) {
-    while (client.available()) {
-      String line = client.readStringUntil('\n');
-      line.trim();
-      if (line.startsWith("HTTP/1.1")) {
-        statusLine = line;
-        Serial.println("Server: " + statusLine);
-      }
-    }
-  }
+  return readResponse();
+}
 
+bool uploadFileRawHTTP(File &file, const String &name) {
+  if (sendRawHTTP(file, name)) return true;
+  // server có thể đã đóng kết nối keep-alive rảnh -> thử lại một lần với kết nối mới
   client.stop();
-  return statusLine.indexOf("200") >= 0 || statusLine.indexOf("201") >= 0;
+  file.seek(0);
+  return sendRawHTTP(file, name);
 }
 
 // =====================
@@ -100,8 +138,16 @@ bool uploadFileMultipartHTTP(File &file) {
 // =====================
 void ensureWiFi() {
   static uint32_t lastTry = 0;
+  static bool ntpStarted = false;
 
-  if (WiFi.status() == WL_CONNECTED) return;
+  if (WiFi.status() == WL_CONNECTED) {
+    if (!ntpStarted) {
+      // SNTP chạy nền, tự đồng bộ lại định kỳ
+      configTzTime(TZ_INFO, NTP_SERVER);
+      ntpStarted = true;
+    }
+    return;
+  }
 
   // 3 giây thử connect lại 1 lần (không while chờ)
   if (millis() - lastTry < 3000) return;
@@ -122,8 +168,21 @@ String captureToSD() {
     return "";
   }
 
-  // đặt tên file
-  String path = "/img_" + String(millis()) + ".jpg";
+  // đặt tên file theo giờ chụp; chưa đồng bộ NTP thì chưa có giờ -> nt_<millis>
+  String base;
+  struct tm t;
+  if (getLocalTime(&t, 0)) {
+    char buf[20];
+    strftime(buf, sizeof(buf), "/%Y%m%d_%H%M%S", &t);
+    base = buf;
+  } else {
+    base = "/nt_" + String(millis());
+  }
+  // không ghi đè ảnh còn tồn (cùng giây, hoặc millis lặp lại sau khi khởi động lại)
+  String path = base + ".jpg";
+  for (int i = 1; SD_MMC.exists(path.c_str()); i++) {
+    path = base + "_" + String(i) + ".jpg";
+  }
 
   File f = SD_MMC.open(path.c_str(), FILE_WRITE);
   if (!f) {
@@ -144,24 +203,24 @@ String captureToSD() {
 // =====================
 // Try upload (chỉ khi có WiFi)
 // =====================
-void tryUploadAndMaybeDelete(const String &path) {
-  if (path.length() == 0) return;
+bool tryUploadAndMaybeDelete(const String &path) {
+  if (path.length() == 0) return false;
 
   if (WiFi.status() != WL_CONNECTED) {
     Serial.println("⚠️ No WiFi -> skip upload (keep file on SD)");
-    return;
+    return false;
   }
 
   File rf = SD_MMC.open(path.c_str(), FILE_READ);
   if (!rf) {
     Serial.println("❌ Open file read failed");
-    return;
+    return false;
   }
 
   Serial.print("⬆️ Uploading: ");
   Serial.println(path);
 
-  bool ok = uploadFileMultipartHTTP(rf);
+  bool ok = uploadFileRawHTTP(rf, path.substring(path.lastIndexOf('/') + 1));
   rf.close();
 
   if (ok) {
@@ -170,6 +229,42 @@ void tryUploadAndMaybeDelete(const String &path) {
   } else {
     Serial.println("❌ Upload FAIL -> keep file");
   }
+  return ok;
+}
+
+// =====================
+// Gửi lại ảnh tồn trên thẻ SD (lúc mất WiFi) qua cùng kết nối keep-alive
+// =====================
+void uploadBacklog() {
+  static uint32_t lastFailMs = 0;
+  if (WiFi.status() != WL_CONNECTED) return;
+  // server lỗi / không tới được -> 10 giây mới thử lại, không chặn vòng loop
+  if (lastFailMs != 0 && millis() - lastFailMs < 10000) return;
+
+  // gom tên trước rồi mới gửi/xoá (không xoá file trong lúc đang duyệt thư mục)
+  String names[BACKLOG_PER_LOOP];
+  int count = 0;
+  File root = SD_MMC.open("/");
+  if (!root) return;
+  File entry = root.openNextFile();
+  while (entry && count < BACKLOG_PER_LOOP) {
+    String name = String(entry.name());
+    if (!entry.isDirectory() && name.endsWith(".jpg")) {
+      names[count++] = name.startsWith("/") ? name : "/" + name;
+    }
+    entry.close();
+    entry = root.openNextFile();
+  }
+  if (entry) entry.close();
+  root.close();
+
+  lastFailMs = 0;
+  for (int i = 0; i < count; i++) {
+    if (!tryUploadAndMaybeDelete(names[i])) {  // lỗi -> để vòng sau
+      lastFailMs = millis();
+      break;
+    }
+  }
 }
 
 // =====================
@@ -262,5 +357,8 @@ void loop() {
     tryUploadAndMaybeDelete(path);
   }
 
+  // 3) ảnh còn tồn trên SD (lúc mất WiFi / upload lỗi) -> gửi dần
+  uploadBacklog();
+
   delay(20);
 }
@@ -1,7 +1,12 @@
+import os
+
 from app import create_app
-from app.config import APP_TITLE, HOST, PORT, MODEL_PATH, INPUT_DIR, OUTPUT_DIR
+from app.config import APP_TITLE, HOST, PORT, DEBUG, MODEL_PATH, INPUT_DIR, OUTPUT_DIR
 
-app = create_app()
+# debug=True bật reloader: process cha chỉ theo dõi file và chạy lại process con
+# (WERKZEUG_RUN_MAIN=true), nên chỉ process con mới nạp model và chạy worker
+_reloader_parent = __name__ == "__main__" and DEBUG and os.environ.get("WERKZEUG_RUN_MAIN") != "true"
+app = create_app(start_services=not _reloader_parent)
 
 if __name__ == "__main__":
     print(f"== {APP_TITLE} ==")
@@ -9,4 +14,4 @@ if __name__ == "__main__":
     print("Input:", INPUT_DIR)
     print("Output:", OUTPUT_DIR)
     print(f"Run: http://127.0.0.1:{PORT}")
-    app.run(host=HOST, port=PORT, debug=True, threaded=True)
+    app.run(host=HOST, port=PORT, debug=DEBUG, threaded=True)
@@ -0,0 +1,36 @@
+"""Xuất best.pt sang ONNX cho backend onnx (MODEL_BACKEND=onnx).
+
+Chạy:  python scripts/export_onnx.py [--imgsz 640] [--static]
+Kết quả ghi ra ONNX_PATH (mặc định best.onnx cạnh best.pt).
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import MODEL_PATH, ONNX_PATH, MODEL_IMGSZ
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--imgsz", type=int, default=MODEL_IMGSZ)
+    ap.add_argument("--static", action="store_true", help="batch cố định = 1 (mặc định: batch động)")
+    ap.add_argument("--opset", type=int, default=None)
+    args = ap.parse_args()
+
+    from ultralytics import YOLO
+
+    print("Model:", MODEL_PATH)
+    t0 = time.perf_counter()
+    out = YOLO(MODEL_PATH).export(format="onnx", imgsz=args.imgsz, dynamic=not args.static,
+                                  simplify=True, opset=args.opset)
+    if os.path.abspath(out) != os.path.abspath(ONNX_PATH):
+        shutil.move(out, ONNX_PATH)
+    print(f"Exported {ONNX_PATH} in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
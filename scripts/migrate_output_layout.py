@@ -0,0 +1,99 @@
+"""Chuyển ảnh raw đang nằm phẳng trong OUTPUT_DIR sang layout OUTPUT_DIR/YYYY/MM/DD và cập nhật image_path.
+
+Ngày của ảnh lấy theo timestamp bản ghi trong DB; file không có bản ghi thì lấy theo
+tiền tố YYYYMMDD_HHMMSS của tên file, cuối cùng là mtime. Chạy lại an toàn: bản ghi
+mà file đã được chuyển ở lần chạy dở trước chỉ được cập nhật DB.
+Nên dừng server trước khi chạy. --pack-after N: sau khi chuyển, gom các ngày cũ hơn N ngày thành zip.
+
+Chạy:  python scripts/migrate_output_layout.py [--dry-run] [--pack-after 30]
+"""
+import os
+import re
+import sys
+import time
+import argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import OUTPUT_DIR, DB_PATH, EXTS
+from app.db import db_init, db_flat_image_paths, db_set_image_paths
+from app.storage import output_rel_path, pack_old_days
+
+_NAME_TS_RE = re.compile(r"^(\d{8})_(\d{6})_")
+
+
+def _timestamp_for(name: str, path: str) -> str:
+    m = _NAME_TS_RE.match(name)
+    if m:
+        try:
+            return datetime.strptime(m.group(1) + m.group(2), "%Y%m%d%H%M%S").strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            pass
+    return datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dry-run", action="store_true")
+    ap.add_argument("--pack-after", type=int, default=0, help="gom các ngày cũ hơn N ngày (0 = không)")
+    ap.add_argument("--batch", type=int, default=1000)
+    args = ap.parse_args()
+
+    print("DB:", DB_PATH)
+    print("Output:", OUTPUT_DIR)
+    db_init()
+    t0 = time.perf_counter()
+
+    by_name = {}
+    for rid, ts, name in db_flat_image_paths():
+        by_name.setdefault(name, []).append((rid, ts))
+
+    moved = updated = missing = 0
+    pending = []
+
+    def flush():
+        nonlocal updated
+        if pending and not args.dry_run:
+            db_set_image_paths(pending)
+        updated += len(pending)
+        pending.clear()
+
+    # 1) file còn nằm phẳng -> chuyển vào thư mục ngày
+    for name in sorted(os.listdir(OUTPUT_DIR)):
+        src = os.path.join(OUTPUT_DIR, name)
+        if not os.path.isfile(src) or os.path.splitext(name)[1].lower() not in EXTS:
+            continue
+        recs = by_name.pop(name, [])
+        rel = output_rel_path(recs[0][1] if recs else _timestamp_for(name, src), name)
+        if not args.dry_run:
+            dst = os.path.join(OUTPUT_DIR, *rel.split("/"))
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            os.replace(src, dst)
+        moved += 1
+        pending.extend((rid, rel) for rid, _ in recs)
+        if len(pending) >= args.batch:
+            flush()
+
+    # 2) bản ghi còn lại: file đã được chuyển ở lần chạy trước, hoặc đã mất
+    for name, recs in by_name.items():
+        for rid, ts in recs:
+            rel = output_rel_path(ts, name)
+            if os.path.isfile(os.path.join(OUTPUT_DIR, *rel.split("/"))):
+                pending.append((rid, rel))
+            else:
+                missing += 1
+        if len(pending) >= args.batch:
+            flush()
+    flush()
+
+    print(f"{'[dry-run] ' if args.dry_run else ''}moved {moved} files, updated {updated} records, "
+          f"{missing} records without file, {time.perf_counter() - t0:.2f}s")
+
+    if args.pack_after > 0 and not args.dry_run:
+        n = pack_old_days(args.pack_after)
+        print(f"Packed {n} files older than {args.pack_after} days")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""Dựng lại bảng rollup_hourly / rollup_daily từ records (dùng cho DB cũ hoặc khi nghi lệch số liệu).
+
+Chạy:  python scripts/rebuild_rollups.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import DB_PATH
+from app.db import db_init, db_rebuild_rollups
+
+
+def main():
+    print("DB:", DB_PATH)
+    db_init()
+    t0 = time.perf_counter()
+    n = db_rebuild_rollups()
+    print(f"Rebuilt {n} hourly buckets in {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Chạy thật: một process worker (model + suy luận) và N process web asyncio dùng chung cổng.
+
+    python serve.py [--web N] [--no-worker | --worker-only]
+
+Process web không giữ luồng cho client SSE/chat (xem app/aserver.py); số process web chỉ
+quyết định số nhân CPU cho phần JSON/HTML, worker suy luận luôn là một. Process con chết thì
+được chạy lại. main.py vẫn là server dev (Flask/werkzeug, một process).
+
+Metrics suy luận (vision_frames_total, decode/infer, db insert), trace từng frame và profiler
+của worker_loop nằm trong process worker: xem ở http://127.0.0.1:WORKER_ADMIN_PORT/metrics,
+/admin/traces, /admin/profile (mặc định PORT+1). /metrics trên cổng chính chỉ có số liệu
+của process web (HTTP, SSE, chat, truy vấn).
+"""
+import os
+import time
+import signal
+import socket
+import argparse
+import threading
+import multiprocessing as mp
+
+from app.config import (APP_TITLE, HOST, PORT, WEB_PROCESSES, WORKER_STATUS_FILE, WORKER_ADMIN_PORT, INPUT_DIR,
+                        OUTPUT_DIR, MODEL_PATH)
+
+
+def _serve_worker_admin(app):
+    """Cổng quản trị của process worker (chỉ loopback): metrics/trace/profile của phần suy luận."""
+    from werkzeug.serving import make_server
+
+    try:
+        server = make_server("127.0.0.1", WORKER_ADMIN_PORT, app, threaded=True)
+    except OSError as e:
+        print(f"[SERVE] Worker admin port {WORKER_ADMIN_PORT} unavailable: {e}")
+        return
+    print(f"[SERVE] Worker metrics/admin on http://127.0.0.1:{WORKER_ADMIN_PORT}")
+    threading.Thread(target=server.serve_forever, daemon=True, name="worker_admin").start()
+
+
+def _worker_main():
+    from app.model import write_status_file
+    from app.worker import stop_worker
+    from app import create_app, run_services
+
+    # create_app: thư mục + db_init + app Flask cho cổng quản trị, chưa chạy dịch vụ
+    app = create_app(start_services=False)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    run_services()
+    threading.Thread(target=write_status_file, args=(WORKER_STATUS_FILE, stop), daemon=True,
+                     name="status_file").start()
+    if WORKER_ADMIN_PORT:
+        _serve_worker_admin(app)
+    try:
+        stop.wait()
+    except KeyboardInterrupt:
+        stop.set()
+    # cho frame đang xử lý ghi xong (job còn claimed thì lần chạy sau reconcile)
+    stop_worker()
+
+
+def _web_main(reuse_port: bool):
+    from app import create_app
+    from app.aserver import run
+    from app.ingest import disable_memory_ingest
+    from app.model import follow_status_file
+
+    # không ai lấy hàng đợi RAM ở process này -> upload luôn ghi xuống INPUT_DIR
+    disable_memory_ingest()
+    follow_status_file(WORKER_STATUS_FILE)
+    app = create_app(start_services=False)
+    run(app, HOST, PORT, reuse_port=reuse_port)
+
+
+def _has_reuse_port() -> bool:
+    if not hasattr(socket, "SO_REUSEPORT"):
+        return False
+    try:
+        with socket.socket() as s:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        return True
+    except OSError:
+        return False
+
+
+def main():
+    ap = argparse.ArgumentParser(description=APP_TITLE)
+    ap.add_argument("--web", type=int, default=WEB_PROCESSES, help="số process web (mặc định WEB_PROCESSES)")
+    group = ap.add_mutually_exclusive_group()
+    group.add_argument("--no-worker", action="store_true", help="chỉ chạy web (worker chạy ở nơi khác)")
+    group.add_argument("--worker-only", action="store_true", help="chỉ chạy worker, không mở cổng")
+    args = ap.parse_args()
+
+    web = 0 if args.worker_only else max(1, args.web)
+    if web > 1 and not _has_reuse_port():
+        print("[SERVE] SO_REUSEPORT not available -> 1 web process")
+        web = 1
+
+    print(f"== {APP_TITLE} ==")
+    print("Model:", MODEL_PATH)
+    print("Input:", INPUT_DIR)
+    print("Output:", OUTPUT_DIR)
+    if web:
+        print(f"Run: http://127.0.0.1:{PORT} ({web} web process{'es' if web > 1 else ''})")
+
+    # schema/migration một lần trước khi chạy các process con (db_init của chúng chỉ còn kiểm tra)
+    from app.db import db_init
+    db_init()
+
+    ctx = mp.get_context("spawn")
+    # tên -> (target, args)
+    specs = {}
+    if not args.no_worker:
+        specs["worker"] = (_worker_main, ())
+    for i in range(web):
+        specs[f"web-{i}"] = (_web_main, (web > 1,))
+    procs = {}
+
+    def start(name):
+        target, a = specs[name]
+        p = ctx.Process(target=target, args=a, name=name)
+        p.start()
+        procs[name] = p
+        print(f"[SERVE] Started {name} (pid {p.pid})")
+
+    stopping = threading.Event()
+
+    def stop(*_):
+        stopping.set()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for name in specs:
+        start(name)
+    while not stopping.wait(1.0):
+        for name, p in list(procs.items()):
+            if not p.is_alive():
+                print(f"[SERVE] {name} exited (code {p.exitcode}) -> restart")
+                time.sleep(1.0)
+                start(name)
+
+    for p in procs.values():
+        if p.is_alive():
+            p.terminate()
+    deadline = time.time() + 10
+    for p in procs.values():
+        p.join(max(0.1, deadline - time.time()))
+        if p.is_alive():
+            p.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""Cấu hình chung cho pytest: DB/thư mục tạm, đặt trước khi import app (config đọc env lúc import)."""
+import os
+import sys
+import shutil
+import atexit
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp = tempfile.mkdtemp(prefix="vision_tests_")
+atexit.register(shutil.rmtree, _tmp, ignore_errors=True)
+os.environ["DB_PATH"] = os.path.join(_tmp, "test.db")
+os.environ["INPUT_DIR"] = os.path.join(_tmp, "in")
+os.environ["OUTPUT_DIR"] = os.path.join(_tmp, "out")
+os.environ["WORKER_STATUS_FILE"] = os.path.join(_tmp, "worker.json")
+# thử lại job ngay, không chờ backoff
+os.environ["JOB_RETRY_BASE"] = "0"
+
+
+@pytest.fixture(autouse=True)
+def _clean_queue():
+    """Mỗi test bắt đầu với INPUT_DIR và bảng jobs trống."""
+    from app import jobs
+    from app.db import db_init, db_write
+
+    db_init()
+    db_write(lambda cur: cur.execute("DELETE FROM jobs"))
+    jobs._claimed.clear()
+    jobs._queued.clear()
+    shutil.rmtree(os.environ["INPUT_DIR"], ignore_errors=True)
+    os.makedirs(os.environ["INPUT_DIR"])
+    yield
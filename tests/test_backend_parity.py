@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+from app.config import BASE_DIR, MODEL_PATH, ONNX_PATH
+
+# Ảnh thật để so; mặc định thư mục ảnh đã lưu của repo (conftest đổi OUTPUT_DIR sang thư mục tạm)
+IMAGES = os.getenv("PARITY_IMAGES", os.path.join(BASE_DIR, "outputs", "sautrain"))
+MIN_AGREE = 0.98
+MAX_DCONF = 0.05
+
+
+def test_onnx_backend_matches_torch_top1():
+    pytest.importorskip("ultralytics")
+    pytest.importorskip("onnxruntime")
+    for path in (MODEL_PATH, ONNX_PATH):
+        if not os.path.exists(path):
+            pytest.skip(f"thiếu model {path} (scripts/export_onnx.py)")
+    from app.backends import create_backend
+    from bench.check_backend_parity import compare, image_paths
+
+    paths = image_paths(IMAGES, 200)
+    if not paths:
+        pytest.skip(f"không có ảnh trong {IMAGES}")
+
+    agree, max_dconf, diffs = compare(paths, create_backend("torch"), create_backend("onnx"))
+    assert agree / len(paths) >= MIN_AGREE, diffs[:10]
+    assert max_dconf <= MAX_DCONF
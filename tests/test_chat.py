@@ -0,0 +1,73 @@
+import sys
+import time
+import threading
+from types import ModuleType
+
+import pytest
+
+import app.gemini_chat as gemini_chat
+from bench.bench_chat import StubModels, stub_types, _ns
+
+
+@pytest.fixture
+def models(monkeypatch):
+    """google.genai giả: ghi lại mỗi lần tạo Client; mọi Client dùng chung một model giả."""
+    models = StubModels()
+    models.created = []
+
+    def client(**kw):
+        models.created.append(kw)
+        return _ns(models=models)
+
+    genai = ModuleType("google.genai")
+    genai.Client = client
+    genai.types = _ns(HttpOptions=_ns, **vars(stub_types))
+    google = ModuleType("google")
+    google.genai = genai
+    monkeypatch.setitem(sys.modules, "google", google)
+    monkeypatch.setitem(sys.modules, "google.genai", genai)
+    monkeypatch.setattr(gemini_chat, "_client", None)
+    monkeypatch.setattr(gemini_chat, "_types", None)
+    monkeypatch.setattr(gemini_chat, "USE_GEMINI", True)
+    monkeypatch.setattr(gemini_chat, "GEMINI_API_KEY", "stub")
+    gemini_chat._answer_cache.clear()
+    yield models
+    gemini_chat._answer_cache.clear()
+
+
+def test_client_is_reused_and_memo_hits(models):
+    questions = [f"câu hỏi {i}" for i in range(5)]
+    first = [gemini_chat.ask_gemini(q, "", "", "") for q in questions]
+    again = [gemini_chat.ask_gemini(q, "", "", "") for q in questions]
+
+    assert len(models.created) == 1
+    assert models.created[0]["http_options"].timeout == int(gemini_chat.GEMINI_TIMEOUT * 1000)
+    assert models.calls == len(questions)  # lượt hai trả từ memo, không gọi model
+    assert again == first
+
+
+def test_timeout_falls_back_and_returns_model_threads(models, monkeypatch):
+    monkeypatch.setattr(gemini_chat, "GEMINI_TIMEOUT", 0.3)
+    monkeypatch.setattr(gemini_chat, "_BACKSTOP_SECONDS", 0.5)
+    models.latency = 1.0
+    answers, times = {}, {}
+
+    def ask(i):
+        t0 = time.perf_counter()
+        answers[i] = gemini_chat.ask_gemini(f"chậm {i}", "", "", "")
+        times[i] = time.perf_counter() - t0
+
+    # chiếm hết các luồng gọi model cùng lúc
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(gemini_chat.GEMINI_MAX_CONCURRENCY)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert set(answers.values()) == {gemini_chat._fallback_rule_answer("chậm", "", "", "")}
+    assert max(times.values()) < 0.3 + 0.3
+
+    # luồng đã được trả lại: lượt sau không phải chờ thêm một timeout
+    models.latency = 0.0
+    t0 = time.perf_counter()
+    assert gemini_chat.ask_gemini("sau timeout", "", "", "") == "Thống kê: 7up dẫn đầu."
+    assert time.perf_counter() - t0 < 0.2
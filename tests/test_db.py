@@ -0,0 +1,36 @@
+import sqlite3
+from datetime import datetime
+
+from app import db
+
+
+def test_migration_keeps_unparseable_timestamps_filterable(monkeypatch, tmp_path, capsys):
+    path = str(tmp_path / "old.db")
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE records (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL, "
+                "brand TEXT, product_name TEXT, conf REAL, image_path TEXT)")
+    con.executemany("INSERT INTO records (timestamp, brand, product_name, conf, image_path) VALUES (?, 'b', 'p', 0.9, 'x')",
+                    [("2026-01-05 10:00:00",), ("2026-01-05 kl 10",), ("05/01/2026 10:00",)])
+    con.commit()
+    con.close()
+
+    monkeypatch.setattr(db, "DB_PATH", path)
+    db.db_init()
+    con = sqlite3.connect(path)
+    rows = con.execute("SELECT timestamp, ts_epoch FROM records ORDER BY id").fetchall()
+    con.close()
+    day = db._epoch(datetime(2026, 1, 5))
+    assert rows[0][1] == day + 36000
+    # phần ngày vẫn đọc được -> đầu ngày đó; không đọc được gì -> giờ migrate, không bao giờ NULL
+    assert rows[1][1] == day
+    assert rows[2][1] is not None
+    assert "2 records with unparseable timestamp" in capsys.readouterr().out
+
+
+def test_insert_with_unparseable_timestamp_is_dated_at_processing_time():
+    before = db._epoch(datetime.now())
+    rid = db.db_insert("bad timestamp", "b", "p", 0.9, "bad.jpg")
+    con = sqlite3.connect(db.DB_PATH)
+    ts = con.execute("SELECT ts_epoch FROM records WHERE id = ?", (rid,)).fetchone()[0]
+    con.close()
+    assert before <= ts <= db._epoch(datetime.now())
@@ -0,0 +1,69 @@
+import os
+import sqlite3
+
+import cv2
+import numpy as np
+import pytest
+
+from app import jobs, worker
+from app.config import DB_PATH, INPUT_DIR
+from app.dedup import DuplicateGate
+
+
+def _jpeg(seed: int) -> bytes:
+    img = np.random.default_rng(seed).integers(0, 255, (60, 80, 3), dtype=np.uint8).repeat(8, 0).repeat(8, 1)
+    return cv2.imencode(".jpg", img)[1].tobytes()
+
+
+def test_anchor_only_after_record():
+    gate = DuplicateGate("skip", 5)
+    frame = _jpeg(1)
+    assert gate.check("cam", frame)[0] == "infer"
+    # frame lỗi -> forget: lần thử lại của chính nó phải được suy luận lại
+    gate.forget("cam")
+    assert gate.check("cam", frame)[0] == "infer"
+    gate.record("cam", ("7up", 0.9))
+    assert gate.check("cam", frame)[0] == "skip"
+
+
+def test_reuse_does_not_drop_duplicate_of_inflight_frame():
+    gate = DuplicateGate("reuse", 5)
+    frame = _jpeg(2)
+    assert gate.check("cam", frame)[0] == "infer"
+    # mốc còn đang suy luận: không có kết quả để dùng lại -> suy luận, không bỏ
+    assert gate.check("cam", frame)[0] == "infer"
+    gate.record("cam", ("pepsi", 0.8))
+    assert gate.check("cam", frame) == ("reuse", ("pepsi", 0.8))
+
+
+@pytest.mark.parametrize("mode", ["skip", "reuse"])
+def test_failed_then_retried_frame_gets_record(mode, monkeypatch, tmp_path):
+    monkeypatch.setattr(worker, "dedup_gate", DuplicateGate(mode, 5))
+    monkeypatch.setattr(worker, "LAST_RAW", str(tmp_path / "last.jpg"))
+    calls = []
+
+    def flaky_infer(path):
+        calls.append(path)
+        if len(calls) == 1:
+            raise RuntimeError("backend hiccup")
+        return "7up", 0.9, None
+
+    monkeypatch.setattr(worker, "infer_path", flaky_infer)
+    src = os.path.join(INPUT_DIR, f"retry{mode}_20260101_120000.jpg")
+    with open(src, "wb") as f:
+        f.write(_jpeg(3))
+
+    def records():
+        with sqlite3.connect(DB_PATH) as con:
+            return con.execute("SELECT COUNT(*) FROM records WHERE image_path LIKE ?", (f"%retry{mode}%",)).fetchone()[0]
+
+    jobs.enqueue([src])
+    assert jobs.claim(1) == [src]
+    assert worker.process_one(src) is False
+    assert os.path.exists(src) and records() == 0
+
+    assert jobs.claim(1) == [src]
+    assert worker.process_one(src) is True
+    assert len(calls) == 2
+    assert records() == 1
+    assert not os.path.exists(src)
@@ -0,0 +1,34 @@
+import sqlite3
+
+from app.config import DB_PATH
+from app.db import db_insert, db_iter_export, db_write
+
+
+def _fill(n: int):
+    db_write(lambda cur: cur.execute("DELETE FROM records"))
+    for i in range(n):
+        db_insert(f"2026-02-{1 + i % 28:02d} 12:00:00", "x", "7up" if i % 2 else "c2", 0.9, f"e{i}.jpg")
+
+
+def test_export_pages_cover_every_row_newest_first():
+    _fill(250)
+    ids = [r["id"] for r in db_iter_export("", "", "", batch_size=40)]
+    assert len(ids) == 250 and ids == sorted(ids, reverse=True)
+    c2 = [r["product_name"] for r in db_iter_export("", "", "=c2", batch_size=40)]
+    assert len(c2) == 125 and set(c2) == {"c2"}
+
+
+def test_slow_export_does_not_pin_wal_snapshot():
+    _fill(100)
+    it = db_iter_export("", "", "", batch_size=10)
+    first = [next(it) for _ in range(15)]  # client tải chậm: đang giữa trang thứ hai
+    db_insert("2026-02-01 13:00:00", "x", "7up", 0.9, "late.jpg")
+    con = sqlite3.connect(DB_PATH)
+    try:
+        busy, _, _ = con.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    finally:
+        con.close()
+    assert busy == 0
+    rest = list(it)
+    # bản ghi mới (id lớn hơn trang đầu) không lọt vào giữa lượt tải
+    assert len(first) + len(rest) == 100
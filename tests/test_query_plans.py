@@ -0,0 +1,29 @@
+import pytest
+
+from app import db
+from bench import check_query_plans as plans
+
+ROWS = 50_000
+
+
+@pytest.fixture
+def traced_db(monkeypatch):
+    db.db_write(lambda cur: cur.execute("DELETE FROM records"))
+    plans.fill(ROWS)
+    db._read_pool.close_all()
+    monkeypatch.setattr(db, "db_connect", plans._tracing_connect)
+    yield
+    db._read_pool.close_all()
+    db.db_write(lambda cur: cur.execute("DELETE FROM records"))
+    db.db_rebuild_rollups()
+
+
+def test_dashboard_queries_never_full_scan_records(traced_db):
+    scans = [(name, " ".join(sql.split()), plan)
+             for name, _, found in plans.run_calls(ROWS) for sql, plan in found]
+    assert scans == []
+
+
+def test_checker_flags_filtered_full_scan():
+    assert plans.is_full_scan("SCAN records", "SELECT * FROM records WHERE brand = ?")
+    assert not plans.is_full_scan("SCAN records", "SELECT * FROM records ORDER BY id DESC LIMIT 20")
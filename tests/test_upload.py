@@ -0,0 +1,53 @@
+import os
+import threading
+
+import pytest
+
+from app import create_app, routes
+from app.config import INPUT_DIR
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # ghi xuống INPUT_DIR (không qua hàng đợi RAM) như process web của serve.py
+    monkeypatch.setattr(routes, "INMEMORY_INGEST", False)
+    return create_app(start_services=False)
+
+
+def test_concurrent_uploads_with_same_capture_second_keep_every_image(client):
+    n = 32
+    bodies = [bytes([i]) * (1 << 20) for i in range(n)]
+    results = [None] * n
+    start = threading.Barrier(n)
+
+    def post(i):
+        c = client.test_client()
+        start.wait()
+        results[i] = c.post("/api/upload_cam", data=bodies[i], headers={
+            "Content-Type": "image/jpeg", "X-Camera": "burst", "X-Timestamp": "20260101_120000"}).get_json()
+
+    threads = [threading.Thread(target=post, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert all(r["ok"] for r in results)
+    names = [r["filename"] for r in results]
+    assert len(set(names)) == n
+    assert len({r["job_id"] for r in results}) == n
+    for name, body in zip(names, bodies):
+        with open(os.path.join(INPUT_DIR, name), "rb") as f:
+            assert f.read() == body
+    assert not [e for e in os.listdir(INPUT_DIR) if e.endswith(".part")]
+
+
+def test_upload_does_not_grow_worker_scan_hint(client):
+    from app import jobs
+
+    for i in range(5):
+        r = client.test_client().post("/api/upload_cam", data=b"x" * 100, headers={
+            "Content-Type": "image/jpeg", "X-Camera": "hint", "X-Timestamp": f"20260101_12000{i}"}).get_json()
+        assert r["ok"] and r["job_id"] is not None
+    # process web không nhận/đóng job nên không được giữ đường dẫn nào lại
+    assert jobs.queued_paths() == set()